@@ -1,23 +1,42 @@
 # app/__init__.py
+import logging
+import os
+import time
 from datetime import datetime,timedelta
 from flask import Flask, redirect, url_for, request, session
 from .extensions import db as sqla_db, login_manager, bcrypt   # ← instancia de Flask-SQLAlchemy
 from .db import DATABASE_URL                                   # ← tu URL de SQLAlchemy puro
 from flask_login import current_user
-from app.scripts.get_overdue_assignments import (
-    get_cards_vs_trainees_alerts,
-    get_overdue_course_alerts,
-)
-from app.db import SessionLocal
+from app.scripts import request_globals, sql_profiler, warmup
 from flask.sessions import SecureCookieSessionInterface
-# NFC is optional. In the distributed-reader model, the server does not need PC/SC.
-try:
-    from app.nfc.acr122 import init_buzzer_off
-except Exception:  # smartcard libs/reader not installed on server
-    init_buzzer_off = None
+from werkzeug.local import LocalProxy
+
+# NFC is optional. In the distributed-reader model, the server does not need
+# PC/SC: the probe only runs with TAMS_NFC_SERVER=1 (reader on this machine).
+NFC_SERVER = os.getenv("TAMS_NFC_SERVER", "0") == "1"
+
+
+def _init_server_nfc():
+    try:
+        from app.nfc.acr122 import init_buzzer_off
+    except Exception as e:  # smartcard libs/reader not installed on server
+        print(f"[WARN] NFC enabled but PC/SC is not available: {e}")
+        return
+    try:
+        init_buzzer_off()
+    except Exception as e:
+        print(f"[WARN] Could not init NFC buzzer off: {e}")
+
 
 def create_app():
+    started = time.perf_counter()
     app = Flask(__name__)
+    # app.logger (stderr; con gunicorn va al error log): tiempos de arranque y
+    # calentamiento en INFO, salvo que la configuración de logging ya lo fije
+    if app.logger.level == logging.NOTSET:
+        app.logger.setLevel(os.getenv("TAMS_LOG_LEVEL", "info").upper())
+    # antes de cualquier acceso a app.jinja_env
+    warmup.configure_jinja_cache(app)
     class DeptSessionInterface(SecureCookieSessionInterface):
         def get_expiration_time(self, app, session):
             # Si la sesión no es permanente, Flask no pone expiración (cookie de navegador)
@@ -66,6 +85,7 @@ def create_app():
 
         non_refresh_paths = (
             "/api/counters",
+            "/api/stream",
             "/dashboard/partials/alerts",
             "/dashboard/itc-pickup-fragment",
             "/courses/api/calendar-events",
@@ -78,11 +98,8 @@ def create_app():
         # Renovar expiración en actividad real
         session.permanent = True
 
-    if init_buzzer_off is not None:
-        try:
-            init_buzzer_off()
-        except Exception as e:
-            print(f"[WARN] Could not init NFC buzzer off: {e}")
+    if NFC_SERVER:
+        _init_server_nfc()
 
     # Config
     app.config["SECRET_KEY"] = "cambia-esto"
@@ -96,6 +113,11 @@ def create_app():
     login_manager.init_app(app)
     bcrypt.init_app(app)
 
+    # Métricas SQL por request (TAMS_SQL_PROFILE=1): Server-Timing + log lento.
+    # Se registra antes que el resto de hooks para medir la request completa.
+    from .db import engine as db_engine
+    sql_profiler.init_app(app, db_engine)
+
     login_manager.login_view = "auth.login"
     login_manager.login_message_category = "warning"
 
@@ -118,22 +140,25 @@ def create_app():
             pass
         return resp
 
+    # Globals de plantilla perezosos: sesión compartida por request
+    request_globals.init_app(app)
+
+    def _overdue_counts(db):
+        from app.scripts.get_overdue_assignments import get_overdue_course_alerts
+        overdue = get_overdue_course_alerts(db)
+        return {
+            "overdue_total": len(overdue),
+            "overdue_1_count": sum(1 for o in overdue if o.get("type") == "overdue_1"),
+            "overdue_2_count": sum(1 for o in overdue if o.get("type") == "overdue_2"),
+        }
+
     @app.context_processor
     def inject_overdue_counter():
-        # OJO: esto usa SessionLocal (otra sesión distinta).
-        # Está bien mientras NO intentes mezclar objetos ORM entre sesiones.
-        db = SessionLocal()
-        try:
-            overdue = get_overdue_course_alerts(db)
-            total_overdue_1 = sum(1 for o in overdue if o.get("type") == "overdue_1")
-            total_overdue_2 = sum(1 for o in overdue if o.get("type") == "overdue_2")
-            return {
-                "overdue_total": len(overdue),
-                "overdue_1_count": total_overdue_1,
-                "overdue_2_count": total_overdue_2,
-            }
-        finally:
-            db.close()
+        # Sólo se calcula si alguna plantilla lee estos valores.
+        return {
+            key: LocalProxy(lambda key=key: request_globals.request_cached("overdue_counts", _overdue_counts)[key])
+            for key in ("overdue_total", "overdue_1_count", "overdue_2_count")
+        }
 
     # Blueprints
     from .auth import bp as auth_bp
@@ -164,7 +189,19 @@ def create_app():
     app.register_blueprint(temporary_loans_bp, url_prefix="/temporary_loans")
     app.register_blueprint(reworks_bp, url_prefix="/reworks")
 
-    with app.app_context():
+    # Con gunicorn --preload los hilos de fondo se arrancan en cada worker
+    # (post_fork), no en el maestro
+    defer_background = os.getenv("TAMS_DEFER_BACKGROUND_THREADS", "0") == "1"
+
+    # Propagación de cambios entre workers (LISTEN/NOTIFY) para cachés y SSE
+    if os.getenv("TAMS_PG_NOTIFY", "1") == "1":
+        from .db import engine
+        from app.scripts.pg_change_listener import start_pg_listener
+        start_pg_listener(engine, defer=defer_background)
+
+    # URL map sólo en debug (o a petición): recorrerlo e imprimirlo en cada
+    # arranque de worker no aporta nada en producción
+    if app.debug or os.getenv("TAMS_DEBUG", "0") == "1" or os.getenv("TAMS_PRINT_URL_MAP", "0") == "1":
         print("\n== URL MAP ==")
         for r in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
             print(f"{r.rule:30s} -> {r.endpoint}")
@@ -180,6 +217,11 @@ def create_app():
     # current_user disponible en todas las plantillas
     @app.context_processor
     def inject_user():
-        return dict(current_user=current_user)
+        from app.scripts.change_feed import STREAM_ENABLED
+        return dict(current_user=current_user, sse_enabled=STREAM_ENABLED)
+
+    # Pool, jerarquía de AssetType y plantillas: en segundo plano
+    warmup.start_warmup(app, defer=defer_background)
 
+    app.logger.info("create_app ready in %.0f ms (pid %s)", (time.perf_counter() - started) * 1000, os.getpid())
     return app
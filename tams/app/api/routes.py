@@ -1,11 +1,25 @@
+import os
+from datetime import date, datetime, timezone
+
 from . import bp
-from flask import jsonify, request
+from flask import jsonify, request, Response, stream_with_context
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_
-from app.db import SessionLocal
+from sqlalchemy import func
+from app.db import SessionLocal, pool_stats
+from app.extensions import db as sqla_db
 from app import models
 from app.scripts.alerts_service import get_alerts_for_user
 from app.scripts.alert_filters import reason_counts_for_calendar
+from app.scripts import change_feed
+from app.scripts.asset_hierarchy import CARD_ROOT_CODE, PC_ROOT_CODE, USB_ROOT_CODE
+from app.scripts.device_resolver import (
+    IDENTIFIER_FIELDS,
+    normalize_identifier,
+    resolve_device,
+    resolve_devices,
+)
+
+RESOLVE_MAX_BATCH = int(os.getenv("TAMS_RESOLVE_MAX_BATCH", "500"))
 
 
 
@@ -27,58 +41,121 @@ def _notif_scope_for_user():
     return "__NONE__"
 
 
+def _counters_payload(db):
+    """
+    Contadores del sidebar (alerts / notifications) para current_user.
+    Lo usan /api/counters (polling) y /api/stream (SSE).
+    """
+    # -------------------------
+    # Notifications (UNREAD real)
+    # -------------------------
+    notif_scope = _notif_scope_for_user()
+    if notif_scope == "__NONE__":
+        notifications = 0
+    else:
+        qn = db.query(func.count(models.Notification.id)).filter(
+            models.Notification.active.is_(True),
+            models.Notification.read_at.is_(None),
+            models.Notification.status.notin_(["done", "dismissed"]),
+        )
+        if notif_scope is not None:
+            qn = qn.filter(models.Notification.department_target == notif_scope)
+
+        notifications = int(qn.scalar() or 0)
+
+    # -------------------------
+    # Alerts (alineado con sidebar)
+    # -------------------------
+    now_utc = datetime.now(timezone.utc)
+
+    alerts_list = get_alerts_for_user(db, current_user, include_hidden=True, read_only=True) or []
+    alerts = 0
+
+    for a in alerts_list:
+        reasons = a.get("reasons") or []
+        if reasons:
+            for r in reasons:
+                if reason_counts_for_calendar(r, now_utc):
+                    alerts += 1
+        else:
+            # legacy: si no hay reasons, cuenta 1 (o 0). Aquí lo dejo conservador.
+            # alerts += 1
+            pass
+
+    return {
+        "alerts": alerts,
+        "notifications": notifications
+    }
+
+
 @bp.route("/counters", methods=["GET"])
 @login_required
 def counters():
     db = SessionLocal()
     try:
-        # -------------------------
-        # Notifications (UNREAD real)
-        # -------------------------
-        notif_scope = _notif_scope_for_user()
-        if notif_scope == "__NONE__":
-            notifications = 0
-        else:
-            qn = db.query(func.count(models.Notification.id)).filter(
-                models.Notification.active.is_(True),
-                models.Notification.read_at.is_(None),
-                models.Notification.status.notin_(["done", "dismissed"]),
-            )
-            if notif_scope is not None:
-                qn = qn.filter(models.Notification.department_target == notif_scope)
-
-            notifications = int(qn.scalar() or 0)
-
-        # -------------------------
-        # Alerts (alineado con sidebar)
-        # -------------------------
-        now_utc = models.datetime.now(models.timezone.utc) if hasattr(models, "datetime") else None
-        # mejor: import datetime/timezone arriba, pero te lo dejo simple:
-        from datetime import datetime, timezone
-        now_utc = datetime.now(timezone.utc)
-
-        alerts_list = get_alerts_for_user(db, current_user, include_hidden=True) or []
-        alerts = 0
-
-        for a in alerts_list:
-            reasons = a.get("reasons") or []
-            if reasons:
-                for r in reasons:
-                    if reason_counts_for_calendar(r, now_utc):
-                        alerts += 1
-            else:
-                # legacy: si no hay reasons, cuenta 1 (o 0). Aquí lo dejo conservador.
-                # alerts += 1
-                pass
-
-        return jsonify({
-            "alerts": alerts,
-            "notifications": notifications
-        })
+        return jsonify(_counters_payload(db))
     finally:
         db.close()
 
 
+@bp.route("/stream", methods=["GET"])
+@login_required
+def stream():
+    """
+    Server-Sent Events: counters / alerts / pickup / calendar cuando cambian
+    los datos (ver app/scripts/change_feed.py). Los endpoints de polling
+    siguen existiendo como fallback.
+
+    Mientras espera no retiene sesión de BD: la de Flask-SQLAlchemy que
+    abrió @login_required (load_user) se cierra antes de devolver la
+    respuesta (stream_with_context mantiene vivo el contexto, y con él esa
+    sesión y su conexión del pool, hasta que acaba el stream). Los
+    contadores usan una SessionLocal corta cada vez que cambian.
+    """
+    if not change_feed.STREAM_ENABLED:
+        # 204 -> EventSource se cierra y el cliente sigue con polling
+        return Response(status=204)
+
+    def counters_event(last):
+        db = SessionLocal()
+        try:
+            payload = _counters_payload(db)
+        finally:
+            db.close()
+        if payload == last:
+            return None, last
+        return change_feed.sse_event("counters", payload), payload
+
+    @stream_with_context
+    def generate():
+        yield f"retry: {change_feed.STREAM_RETRY_MS}\n\n"
+
+        ev, last_counters = counters_event(None)
+        yield ev
+
+        for changed in change_feed.iter_changes():
+            if not changed:
+                yield change_feed.sse_comment()
+                continue
+
+            if "counters" in changed:
+                ev, last_counters = counters_event(last_counters)
+                if ev:
+                    yield ev
+
+            for channel in ("alerts", "pickup", "calendar"):
+                if channel in changed:
+                    yield change_feed.sse_event(channel)
+
+    # current_user ya está cargado; se queda desligado de la sesión
+    sqla_db.session.remove()
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
 
 @bp.route("/card-course-lookup", methods=["GET"])
 @login_required
@@ -93,34 +170,16 @@ def card_course_lookup():
 
     db = SessionLocal()
     try:
-        device = (
-            db.query(models.Device)
-            .filter(
-                or_(
-                    models.Device.uid == code,
-                    models.Device.barcode == code
-                )
-            )
-            .first()
-        )
+        resolved = resolve_device(db, code)
 
-        if not device:
+        if not resolved:
             return jsonify({
                 "found": False,
                 "message": "Card or barcode not found."
             })
 
-        assignment = (
-            db.query(models.Assignment)
-            .join(models.Course, models.Assignment.course_id == models.Course.id)
-            .filter(
-                models.Assignment.device_id == device.id,
-                models.Assignment.released_at.is_(None),
-                models.Assignment.status == "active",
-            )
-            .order_by(models.Assignment.id.desc())
-            .first()
-        )
+        device = resolved.device
+        assignment = resolved.assignment
 
         if not assignment:
             return jsonify({
@@ -136,7 +195,7 @@ def card_course_lookup():
                 "message": "Device found, but it is not assigned to any active course."
             })
 
-        course = assignment.course
+        course = resolved.course
 
         return jsonify({
             "found": True,
@@ -165,3 +224,141 @@ def card_course_lookup():
         })
     finally:
         db.close()
+
+
+def _resolved_payload(q, key, r):
+    if not r:
+        return {"q": q, "key": key, "found": False}
+
+    d = r.device
+    a = r.assignment
+    c = r.course
+
+    course = None
+    if c:
+        end_date = c.end_date.date() if isinstance(c.end_date, datetime) else c.end_date
+        overdue_days = 0
+        if isinstance(end_date, date) and a is not None and a.released_at is None:
+            overdue_days = max((date.today() - end_date).days, 0)
+
+        course_code = (c.course or "").strip()
+        parts = [course_code, (c.name or "").strip(), (c.client or "").strip()]
+
+        course = {
+            "id": c.id,
+            "course": c.course,
+            "name": c.name,
+            "client": c.client,
+            "label": " | ".join(p for p in parts if p) or f"Course #{c.id}",
+            "start_date": c.start_date.isoformat() if c.start_date else None,
+            "end_date": end_date.isoformat() if end_date else None,
+            "overdue_days": overdue_days,
+        }
+
+    return {
+        "q": q,
+        "key": key,
+        "found": True,
+        "matched_by": r.matched_by,
+        "device": {
+            "id": d.id,
+            "name": d.name,
+            "uid": d.uid,
+            "barcode": d.barcode,
+            "status": d.status,
+            "active": d.active,
+            "bucket": r.bucket,
+            "asset_type_code": r.asset_type_code,
+            "asset_parent_code": r.asset_parent_code,
+        },
+        "assignment": {
+            "id": a.id,
+            "status": a.status,
+            "live": r.is_live,
+            "assigned_at": a.assigned_at.isoformat() if a.assigned_at else None,
+            "released_at": a.released_at.isoformat() if a.released_at else None,
+            "is_temporary": bool(a.is_temporary),
+        } if a else None,
+        "course": course,
+    }
+
+
+@bp.route("/devices/resolve", methods=["POST"])
+@login_required
+def devices_resolve():
+    """
+    Resolución por lotes para los puestos de escaneo.
+
+    Body JSON:
+      {
+        "identifiers": ["04AABB", "ITC-015678", ...],   # UID o barcode
+        "uids": [...],                                 # sólo UID
+        "barcodes": [...],                             # sólo barcode
+        "fields": ["barcode", "uid"],                  # prioridad para "identifiers"
+        "family": "COMPUTER" | "USB" | "CARD" | null,
+        "live_only": true                              # false = último assignment
+      }
+
+    Una query por lista (como mucho 3 por lote, da igual cuántos items).
+    Devuelve results[] en el mismo orden de entrada.
+    """
+    data = request.get_json(silent=True) or {}
+
+    family = (data.get("family") or "").strip().upper() or None
+    if family and family not in (PC_ROOT_CODE, USB_ROOT_CODE, CARD_ROOT_CODE):
+        return jsonify({"success": False, "error": f"Unknown family: {family}"}), 400
+
+    fields = data.get("fields") or IDENTIFIER_FIELDS
+    if not isinstance(fields, (list, tuple)) or not set(fields) <= set(IDENTIFIER_FIELDS):
+        return jsonify({"success": False, "error": "Invalid fields"}), 400
+
+    live_only = data.get("live_only", True) is not False
+
+    groups = []
+    for name, group_fields in (("identifiers", tuple(fields)), ("uids", ("uid",)), ("barcodes", ("barcode",))):
+        items = data.get(name) or []
+        if not isinstance(items, list):
+            return jsonify({"success": False, "error": f"'{name}' must be a list"}), 400
+        items = [str(x).strip() for x in items if x is not None and str(x).strip()]
+        if items:
+            groups.append((items, group_fields))
+
+    total = sum(len(items) for items, _ in groups)
+    if not total:
+        return jsonify({"success": False, "error": "No identifiers provided"}), 400
+    if total > RESOLVE_MAX_BATCH:
+        return jsonify({
+            "success": False,
+            "error": f"Too many identifiers ({total} > {RESOLVE_MAX_BATCH})",
+        }), 413
+
+    results = []
+    db = SessionLocal()
+    try:
+        for items, group_fields in groups:
+            resolved = resolve_devices(
+                db, items, fields=group_fields, family=family, live_only=live_only
+            )
+            for q in items:
+                key = normalize_identifier(q)
+                results.append(_resolved_payload(q, key, resolved.get(key)))
+    finally:
+        db.close()
+
+    found = sum(1 for r in results if r["found"])
+    return jsonify({
+        "success": True,
+        "results": results,
+        "found": found,
+        "not_found": len(results) - found,
+    })
+
+
+@bp.route("/pool-stats", methods=["GET"])
+@login_required
+def db_pool_stats():
+    """Uso del pool de conexiones de ESTE worker (sólo admin)."""
+    role = (getattr(current_user, "role", "") or "").strip().lower()
+    if "admin" not in role:
+        return jsonify({"success": False, "error": "Forbidden"}), 403
+    return jsonify({"success": True, **pool_stats()})
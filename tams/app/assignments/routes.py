@@ -7,6 +7,15 @@ from app.db import SessionLocal
 from app.models import Assignment, Device, Course, User, Movements, CourseDeviceMovement, AssetType
 from datetime import date, datetime, timedelta, timezone
 from app.scripts import get_overdue_assignments, log_movement
+from app.scripts.asset_hierarchy import asset_type_bucket
+from app.scripts.device_resolver import identifier_column, normalize_identifier, resolve_device
+from app.scripts.bulk_assignments import (
+    claim_devices,
+    find_live_assignments,
+    insert_assignments,
+    live_counts_by_course,
+    release_assignments,
+)
 
 def log_bulk_return_movement(db, *, user_id, items, action="return", success=True):
     """
@@ -459,63 +468,78 @@ def new_bulk():
         return redirect(url_for("courses.detail", course_id=course_id_value))
 
     try:
-        devices = db.query(Device).filter(Device.uid.in_(uids)).all()
-        devices_by_uid = {d.uid: d for d in devices}
+        # Todo el lote en un número fijo de queries:
+        # devices -> conflictos -> UPDATE guardado -> INSERT multi-fila
+        keys = [normalize_identifier(u) for u in uids]
+        uid_norm = identifier_column(db, "uid")
+        devices = (
+            db.query(Device.id, Device.uid, uid_norm.label("uid_norm"), Device.status)
+            .filter(uid_norm.in_({k for k in keys if k}))
+            .all()
+        )
+        devices_by_key = {d.uid_norm: d for d in devices}
 
-        created_count = 0
+        live = find_live_assignments(db, [d.id for d in devices])
 
-        for idx, uid in enumerate(uids):
+        outcomes = {"assigned": [], "already_here": [], "elsewhere": [], "unavailable": [], "not_found": []}
+        candidates = {}   # device_id -> (uid, is_temporary)
 
-            device = devices_by_uid.get(uid)
+        for idx, (uid, key) in enumerate(zip(uids, keys)):
+            device = devices_by_key.get(key)
             if not device:
+                outcomes["not_found"].append(uid)
                 continue
 
-            asig_other = (
-                db.query(Assignment)
-                .filter(
-                    Assignment.device_id == device.id,
-                    Assignment.status == "active",
-                    Assignment.course_id != course_id_value,
-                )
-                .first()
-            )
-            if asig_other:
-                continue
+            if device.id in candidates:
+                continue  # UID repetido en el mismo envío
 
-            asig_same = (
-                db.query(Assignment)
-                .filter(
-                    Assignment.device_id == device.id,
-                    Assignment.course_id == course_id_value,
-                    Assignment.status == "active",
-                )
-                .first()
-            )
-            if asig_same:
+            live_course_ids = {a.course_id for a in live.get(device.id, [])}
+            if live_course_ids - {course_id_value}:
+                outcomes["elsewhere"].append(uid)
+                continue
+            if course_id_value in live_course_ids:
+                outcomes["already_here"].append(uid)
                 continue
-
             if device.status != "available":
+                outcomes["unavailable"].append(uid)
                 continue
 
             is_temp = (idx < len(temp_flags) and temp_flags[idx] == "1")
+            candidates[device.id] = (uid, is_temp)
 
-            assignment = Assignment(
-                course_id=course_id_value,
-                device_id=device.id,
-                assigned_at=datetime.utcnow(),
-                created_by=current_user.id,
-                status="active",
-                is_temporary=is_temp
-            )
+        # Sólo se asignan los que sigan 'available' (si otra petición se ha
+        # adelantado, no vuelven en el RETURNING)
+        claimed = claim_devices(db, candidates.keys())
 
-            db.add(assignment)
-            device.status = "assigned"
-            created_count += 1
+        rows = []
+        for device_id, (uid, is_temp) in candidates.items():
+            if device_id not in claimed:
+                outcomes["unavailable"].append(uid)
+                continue
+            rows.append({
+                "course_id": course_id_value,
+                "device_id": device_id,
+                "created_by": current_user.id,
+                "is_temporary": is_temp,
+            })
+            outcomes["assigned"].append(uid)
+
+        insert_assignments(db, rows)
 
         db.commit()
 
-        if created_count:
-            flash(f"{created_count} devices assigned.", "success")
+        if outcomes["assigned"]:
+            flash(f"{len(outcomes['assigned'])} devices assigned.", "success")
+
+        skipped_msgs = (
+            ("already_here", "Already assigned to this course"),
+            ("elsewhere", "Assigned to another course"),
+            ("unavailable", "Not available"),
+            ("not_found", "Unknown UID"),
+        )
+        for key, label in skipped_msgs:
+            if outcomes[key]:
+                flash(f"{label} ({len(outcomes[key])}): {', '.join(outcomes[key])}", "warning")
 
     except Exception as e:
         db.rollback()
@@ -546,24 +570,50 @@ def bulk_return():
         # Una UID por línea
         uids = [u.strip() for u in raw_uids.splitlines() if u.strip()]
 
-        # Buscar dispositivos existentes
-        devices = (
-            db.query(Device)
-            .filter(Device.uid.in_(uids))
-            .all()
-        )
-        devices_by_uid = {d.uid: d for d in devices}
+        # Devices + su assignment abierto, para todo el lote (2 queries)
+        keys = [normalize_identifier(u) for u in uids]
+        uid_norm = identifier_column(db, "uid")
+        devices_by_key = {
+            key: device
+            for device, key in (
+                db.query(Device, uid_norm.label("uid_norm"))
+                .filter(uid_norm.in_({k for k in keys if k}))
+                .all()
+            )
+        }
+        devices = list(devices_by_key.values())
+
+        open_by_device = {}
+        if devices:
+            open_rows = (
+                db.query(Assignment)
+                .options(joinedload(Assignment.course))
+                .filter(
+                    Assignment.device_id.in_([d.id for d in devices]),
+                    Assignment.released_at.is_(None),
+                )
+                # Preferir las 'active'
+                .order_by(
+                    Assignment.device_id,
+                    (Assignment.status == "active").desc(),
+                    Assignment.assigned_at.desc(),
+                )
+                .all()
+            )
+            for a in open_rows:
+                open_by_device.setdefault(a.device_id, a)
 
         processed = []           # detalle por tarjeta
         per_course = {}          # course_id -> {course, returned, pending}
         skipped_not_found = []   # UIDs sin device
         skipped_no_assignment = []  # devices sin asignación activa
-        returned_count = 0
+        to_return = []           # (uid, device, assignment)
+        seen_devices = set()
 
         now = datetime.utcnow()
 
-        for uid in uids:
-            device = devices_by_uid.get(uid)
+        for uid, key in zip(uids, keys):
+            device = devices_by_key.get(key)
 
             # 1) UID no encontrado en devices
             if not device:
@@ -577,19 +627,12 @@ def bulk_return():
                 })
                 continue
 
-            # 2) Buscar asignación activa (released_at IS NULL)
-            q = db.query(Assignment).filter(
-                Assignment.device_id == device.id,
-                Assignment.released_at.is_(None),
-            )
-
-            # Preferir las 'active'
-            q = q.order_by(
-                (Assignment.status == "active").desc(),
-                Assignment.assigned_at.desc(),
-            )
+            if device.id in seen_devices:
+                continue  # UID repetido en la lista
+            seen_devices.add(device.id)
 
-            assignment = q.first()
+            # 2) Asignación abierta (released_at IS NULL)
+            assignment = open_by_device.get(device.id)
 
             if not assignment:
                 skipped_no_assignment.append(device)
@@ -602,30 +645,50 @@ def bulk_return():
                 })
                 continue
 
-            course = assignment.course
+            to_return.append((uid, device, assignment))
 
-            # BEFORE (antes de devolver)
-            before_data = {
-                "assignment_status": assignment.status,
-                "released_at": assignment.released_at.isoformat()
-                    if assignment.released_at else None,
-                "device_status": getattr(device, "status", None),
+        # 3) Marcar devolución: un UPDATE para assignments y otro para devices.
+        # Los que otra petición haya cerrado antes no vuelven en el RETURNING.
+        before = {
+            a.id: {
+                "assignment_status": a.status,
+                "released_at": a.released_at.isoformat() if a.released_at else None,
+                "device_status": getattr(d, "status", None),
             }
+            for _, d, a in to_return
+        }
+        released_ids = {
+            row.id for row in release_assignments(
+                db, [a.id for _, _, a in to_return], status="closed", released_at=now
+            )
+        }
+        claim_devices(
+            db,
+            [d.id for _, d, a in to_return if a.id in released_ids],
+            from_statuses=None,
+            to_status="available",
+        )
 
-            # 3) Marcar devolución
-            assignment.status = "closed"
-            assignment.released_at = now
+        returned_count = 0
+        for uid, device, assignment in to_return:
+            course = assignment.course
 
-            old_device_status = getattr(device, "status", None)
-            if hasattr(Device, "status"):
-                device.status = "available"
+            if assignment.id not in released_ids:
+                skipped_no_assignment.append(device)
+                processed.append({
+                    "uid": uid,
+                    "status": "no_active_assignment",
+                    "device": device,
+                    "course": None,
+                    "message": "Card was returned by someone else meanwhile.",
+                })
+                continue
 
             # AFTER (después de devolver)
             after_data = {
-                "assignment_status": assignment.status,
-                "released_at": assignment.released_at.isoformat()
-                    if assignment.released_at else None,
-                "device_status": getattr(device, "status", None),
+                "assignment_status": "closed",
+                "released_at": now.isoformat(),
+                "device_status": "available",
             }
 
             # AUDITORÍA: movimiento de devolución
@@ -636,7 +699,7 @@ def bulk_return():
                 device=device,
                 course=course,
                 action="returned",
-                before=before_data,
+                before=before[assignment.id],
                 after=after_data,
                 success=True,
             )
@@ -660,17 +723,10 @@ def bulk_return():
                 "message": "Assignment closed and device returned to stock.",
             })
 
-        # Calcular cuántas quedan pendientes por curso
+        # Cuántas quedan pendientes por curso (una query agrupada)
+        pending_by_course = live_counts_by_course(db, per_course.keys())
         for cid, info in per_course.items():
-            pending = (
-                db.query(Assignment)
-                .filter(
-                    Assignment.course_id == cid,
-                    Assignment.released_at.is_(None),
-                )
-                .count()
-            )
-            info["pending"] = pending
+            info["pending"] = pending_by_course.get(cid, 0)
 
         db.commit()
         for cid in per_course.keys():
@@ -919,12 +975,9 @@ def bulk_return_find():
                 "error": "Empty UID."
             }), 400
 
-        # 1) Buscar device por UID
-        device = (
-            db.query(Device)
-              .filter(Device.uid == uid)
-              .first()
-        )
+        # 1) Device por UID + su ÚLTIMA asignación (viva o no), en una query
+        resolved = resolve_device(db, uid, fields=("uid",), live_only=False)
+        device = resolved.device if resolved else None
 
         if not device:
             # Tarjeta no registrada como device
@@ -942,14 +995,7 @@ def bulk_return_find():
                 }
             })
 
-        # 2) Buscar la ÚLTIMA asignación que haya tenido ese device
-        assignment = (
-            db.query(Assignment)
-              .options(joinedload(Assignment.course))
-              .filter(Assignment.device_id == device.id)
-              .order_by(Assignment.assigned_at.desc())
-              .first()
-        )
+        assignment = resolved.assignment
 
         if not assignment:
             # Device existe pero jamás ha tenido assignments
@@ -967,7 +1013,7 @@ def bulk_return_find():
                 }
             })
 
-        course = assignment.course
+        course = resolved.course
 
         # Sacar fecha de fin del curso (si existe)
         course_end_date = getattr(course, "end_date", None)
@@ -985,7 +1031,7 @@ def bulk_return_find():
             status = "assigned"
         else:
             status = "released"
-        course = assignment.course
+        course = resolved.course
 
         # Sacar fecha de fin del curso (si existe)
         course_end_date = getattr(course, "end_date", None)
@@ -1074,42 +1120,15 @@ def check_cards_vs_trainees(db, course_id: int):
 def _movement_asset_kind_from_device(device):
     """
     Devuelve:
-    - 'pc' si el device pertenece a PC / LAPTOP / COMPUTER
-    - 'usb' si pertenece a USB
+    - 'pc' si su AssetType es de la familia COMPUTER (asset_hierarchy)
+    - 'usb' si es de la familia USB
     - None si no debe registrarse en course_device_movements
 
     Ojo: ahora mismo nos interesa sobre todo PC.
     Las tarjetas/cards no deben entrar aquí.
     """
-    if not device or not getattr(device, "asset_type", None):
+    if not device or not getattr(device, "asset_type_id", None):
         return None
 
-    asset_type = device.asset_type
-
-    code = (getattr(asset_type, "code", "") or "").strip().upper()
-    name = (getattr(asset_type, "name", "") or "").strip().upper()
-
-    parent = getattr(asset_type, "parent", None)
-    parent_code = (getattr(parent, "code", "") or "").strip().upper() if parent else ""
-    parent_name = (getattr(parent, "name", "") or "").strip().upper() if parent else ""
-
-    values = {
-        code,
-        name,
-        parent_code,
-        parent_name,
-    }
-
-    joined_values = " ".join(v for v in values if v)
-
-    if "USB" in joined_values:
-        return "usb"
-
-    if (
-        "PC" in values
-        or "LAPTOP" in joined_values
-        or "COMPUTER" in joined_values
-    ):
-        return "pc"
-
-    return None
\ No newline at end of file
+    bucket = asset_type_bucket(device.asset_type_id)
+    return bucket if bucket in ("pc", "usb") else None
@@ -1,8 +1,9 @@
 # courses/routes.py
 import re
+import hashlib
+import time
 from math import ceil
-from io import StringIO, BytesIO
-import csv
+from io import BytesIO
 from turtle import title
 
 from flask import (
@@ -17,23 +18,41 @@ from flask import (
     Response,
 )
 from flask_login import login_required, current_user
-from sqlalchemy.orm import joinedload, aliased
-from sqlalchemy import or_, func, case
+from sqlalchemy.orm import lazyload
+from sqlalchemy import and_, or_, func, case
 from sqlalchemy.exc import IntegrityError
-from datetime import date, datetime, timezone
+from datetime import date, datetime, timedelta, timezone
 from datetime import date as _date
 
 from . import bp
 from app.db import SessionLocal
+from app.scripts.exports import iter_query, stream_csv, export_xlsx
+from app.scripts.text_search import courses_search_text, search_available
+from app.scripts.asset_hierarchy import CARD_ROOT_CODE
+from app.scripts.device_resolver import family_type_ids, resolve_device
+from app.scripts.bulk_assignments import (
+    claim_devices,
+    delete_assignments,
+    find_live_assignments,
+    insert_assignments,
+    insert_course_device_movements,
+)
 import app.models as models
-from app.scripts import log_movement
+from app.scripts import log_movement, data_version
 from app.scripts.alerts_service import get_alerts_for_user
 from app.scripts.alert_filters import reason_counts_for_calendar
+from app.scripts.alerts_cache import ALERTS_CACHE_MAX_AGE_SECONDS
+from app.scripts.change_feed import CALENDAR_SOURCE_TABLES
+from app.scripts.course_detail import load_course_detail
+from app.scripts.itc_rules import (
+    PC_ROOT_CODE,
+    USB_ROOT_CODE,
+    get_itc_calendar_stats,
+    itc_asset_type_ids,
+)
 
 from app.models import (
-    Assignment,
     Course,
-    Device,
     User,
     CourseAssetRequirement,
     AssetType,
@@ -44,7 +63,6 @@ from app.scripts.get_overdue_assignments import (
     get_overdue_course_alerts,
 )
 
-from openpyxl import Workbook
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -750,13 +768,16 @@ def build_courses_query(db, args):
 
     if q:
         like = f"%{q}%"
-        qry = qry.filter(
-            or_(
-                models.Course.course.ilike(like),
-                models.Course.name.ilike(like),
-                getattr(models.Course, "notes", models.Course.name).ilike(like),
+        if search_available(db):
+            qry = qry.filter(courses_search_text().ilike(like))
+        else:
+            qry = qry.filter(
+                or_(
+                    models.Course.course.ilike(like),
+                    models.Course.name.ilike(like),
+                    getattr(models.Course, "notes", models.Course.name).ilike(like),
+                )
             )
-        )
 
     if course_code:
         qry = qry.filter(models.Course.course.ilike(f"%{course_code}%"))
@@ -1356,88 +1377,60 @@ def calendar_data():
 @login_required
 def detail(course_id):
     db = SessionLocal()
-    course = (
-        db.query(Course)
-        .options(joinedload(Course.assignments).joinedload(Assignment.device))
-        .get(course_id)
-    )
-    if not course:
-        abort(404)
-
-    update_assignment_overdue_status_for_course(db, course)
-
-    active_assignments = [
-        a for a in course.assignments
-        if a.status in ("active", "overdue_1", "overdue_2") and a.device is not None
-    ]
+    try:
+        detail = load_course_detail(db, course_id, with_summary=False)
+        if detail is None:
+            abort(404)
 
-    return render_template(
-        "courses/detail.html",
-        course=course,
-        active_assignments=active_assignments,
-    )
+        return render_template(
+            "courses/detail.html",
+            course=detail.course,
+            active_assignments=detail.active_assignments,
+        )
+    finally:
+        db.close()
 
 
 @bp.route("/<int:course_id>/fragment")
 @login_required
 def detail_fragment(course_id):
     db = SessionLocal()
-    modal_context = (request.args.get("modal_context") or "").strip().lower()
-    actor_dept = (getattr(current_user, "department", "") or "").strip().lower()
-
-    course = (
-        db.query(Course)
-        .options(
-            joinedload(Course.assignments)
-            .joinedload(Assignment.device)
-            .joinedload(Device.asset_type)
-            .joinedload(AssetType.parent),
-
-            joinedload(Course.asset_requirements)
-            .joinedload(CourseAssetRequirement.asset_type)
-            .joinedload(AssetType.parent),
-        )
-        .get(course_id)
-    )
-    if not course:
-        abort(404)
+    try:
+        modal_context = (request.args.get("modal_context") or "").strip().lower()
+        actor_dept = (getattr(current_user, "department", "") or "").strip().lower()
 
-    update_assignment_overdue_status_for_course(db, course)
+        # Sólo assignments vivos; overdue y resumen ITC calculados en SQL
+        detail = load_course_detail(db, course_id)
+        if detail is None:
+            abort(404)
 
-    active_assignments = [
-        a for a in course.assignments
-        if a.status in ("active", "overdue_1", "overdue_2") and a.device is not None
-    ]
-    active_reworks = (
-        db.query(models.CourseRework)
-        .filter(
-            models.CourseRework.course_id == course.id,
-            models.CourseRework.cancelled_at.is_(None),
-        )
-        .order_by(
-            models.CourseRework.rework_date.desc(),
-            models.CourseRework.id.desc(),
+        active_reworks = (
+            db.query(models.CourseRework)
+            .filter(
+                models.CourseRework.course_id == course_id,
+                models.CourseRework.cancelled_at.is_(None),
+            )
+            .order_by(
+                models.CourseRework.rework_date.desc(),
+                models.CourseRework.id.desc(),
+            )
+            .all()
         )
-        .all()
-    )
 
-    active_assignments = [
-    a for a in course.assignments
-    if a.status in ("active", "overdue_1", "overdue_2") and a.device is not None
-    ]
-    itc_equipment_summary = _build_itc_equipment_summary(course)
-    return render_template(
-        "courses/_detail_fragment.html",
-        course=course,
-        active_assignments=active_assignments,
-        course_itc_statuses=COURSE_ITC_STATUSES,
-        show_calendar_itc_status_editor=(
-            modal_context == "calendar" and actor_dept == "itc support"
-        ),
-        today_date=date.today().isoformat(),
-        active_reworks=active_reworks,
-        itc_equipment_summary=itc_equipment_summary,
-    )
+        return render_template(
+            "courses/_detail_fragment.html",
+            course=detail.course,
+            active_assignments=detail.active_assignments,
+            course_itc_statuses=COURSE_ITC_STATUSES,
+            show_calendar_itc_status_editor=(
+                modal_context == "calendar" and actor_dept == "itc support"
+            ),
+            today_date=date.today().isoformat(),
+            active_reworks=active_reworks,
+            itc_equipment_summary=detail.equipment_summary,
+        )
+    finally:
+        db.close()
 
 @bp.route("/<int:course_id>/reworks/<int:rework_id>/edit", methods=["POST"])
 @login_required
@@ -1520,94 +1513,6 @@ def edit_rework(course_id, rework_id):
     finally:
         db.close()
 
-def _itc_asset_bucket(asset_type):
-    """
-    Devuelve:
-    - 'pc' si el asset pertenece a COMPUTER
-    - 'usb' si el asset pertenece a USB
-    - None si no aplica
-    """
-    if not asset_type:
-        return None
-
-    code = ((asset_type.code or "") if hasattr(asset_type, "code") else "").strip().upper()
-    name = ((asset_type.name or "") if hasattr(asset_type, "name") else "").strip().upper()
-
-    parent = getattr(asset_type, "parent", None)
-    parent_code = ((parent.code or "") if parent else "").strip().upper()
-    parent_name = ((parent.name or "") if parent else "").strip().upper()
-
-    if code == "USB" or parent_code == "USB" or "USB" in name or "USB" in parent_name:
-        return "usb"
-
-    if (
-        code == "COMPUTER"
-        or parent_code == "COMPUTER"
-        or "COMPUTER" in name
-        or "COMPUTER" in parent_name
-        or "LAPTOP" in name
-        or "LAPTOP" in parent_name
-        or code == "PC"
-    ):
-        return "pc"
-
-    return None
-
-
-def _build_itc_equipment_summary(course):
-    summary = {
-        "pc": {
-            "required": 0,
-            "assigned": 0,
-            "returned": 0,
-            "pending": 0,
-            "total_assigned": 0,
-        },
-        "usb": {
-            "required": 0,
-            "assigned": 0,
-            "returned": 0,
-            "pending": 0,
-            "total_assigned": 0,
-        },
-    }
-
-    # Requeridos desde course_asset_requirements
-    for req in getattr(course, "asset_requirements", []) or []:
-        if getattr(req, "active", True) is False:
-            continue
-
-        bucket = _itc_asset_bucket(getattr(req, "asset_type", None))
-        if not bucket:
-            continue
-
-        summary[bucket]["required"] += int(getattr(req, "quantity", 0) or 0)
-
-    # Asignados / devueltos desde assignments
-    for assignment in getattr(course, "assignments", []) or []:
-        device = getattr(assignment, "device", None)
-        if not device:
-            continue
-
-        bucket = _itc_asset_bucket(getattr(device, "asset_type", None))
-        if not bucket:
-            continue
-
-        released_at = getattr(assignment, "released_at", None)
-        status = (getattr(assignment, "status", "") or "").strip().lower()
-
-        if released_at is not None:
-            summary[bucket]["returned"] += 1
-            summary[bucket]["total_assigned"] += 1
-            continue
-
-        if status in ("active", "overdue_1", "overdue_2"):
-            summary[bucket]["assigned"] += 1
-            summary[bucket]["pending"] += 1
-            summary[bucket]["total_assigned"] += 1
-
-    return summary
-
 @bp.route("/<int:course_id>/reworks/new", methods=["POST"])
 @login_required
 def create_rework(course_id):
@@ -1747,38 +1652,6 @@ def cancel_rework(course_id, rework_id):
     finally:
         db.close()
 
-OVERDUE_1_DAYS = 7
-
-
-def update_assignment_overdue_status_for_course(db, course):
-    today = date.today()
-
-    if not course.end_date:
-        for a in course.assignments:
-            if a.status in ("active", "overdue_1", "overdue_2"):
-                a.status = "active"
-                a.days_late = 0
-        return
-
-    days_late = (today - course.end_date).days
-
-    for a in course.assignments:
-        if a.status not in ("active", "overdue_1", "overdue_2"):
-            continue
-
-        if days_late <= 0:
-            new_status = "active"
-            dl = 0
-        elif days_late <= OVERDUE_1_DAYS:
-            new_status = "overdue_1"
-            dl = days_late
-        else:
-            new_status = "overdue_2"
-            dl = days_late
-
-        a.status = new_status
-        a.days_late = dl
-
 def _now_utc():
     return datetime.now(timezone.utc)
 
@@ -1988,9 +1861,64 @@ def equipment_movement_detail():
     finally:
         db.close()
 
+def _parse_calendar_range(args):
+    """
+    FullCalendar manda ?start=...&end=... (ISO, end exclusivo).
+    Devuelve (start_date, end_date) o (None, None) si no vienen o no son válidos,
+    en cuyo caso se sirve el histórico completo como antes.
+    """
+    raw_start = (args.get("start") or "").strip()
+    raw_end = (args.get("end") or "").strip()
+    if not raw_start or not raw_end:
+        return None, None
+
+    try:
+        range_start = _date.fromisoformat(raw_start[:10])
+        range_end = _date.fromisoformat(raw_end[:10])
+    except ValueError:
+        return None, None
+
+    if range_end <= range_start:
+        return None, None
+
+    return range_start, range_end
+
+
+def _calendar_etag(range_start, range_end, actor_role, actor_dept, severity_by_course) -> str:
+    """
+    ETag del calendario: versión de datos de las tablas que lo alimentan +
+    vista (rol/depto) + rango + día + severidades (ya salen del caché de alertas).
+
+    Es un validador POR WORKER: las versiones son contadores del proceso, así
+    que el tag lleva el boot id (único por proceso, también tras el fork de
+    --preload y en cada worker nuevo). Una petición que cae en otro worker
+    no casa y recibe un 200; nunca un 304 por coincidencia de contadores.
+
+    Lleva además un tramo de tiempo de la misma edad máxima que el caché de
+    alertas: hay escrituras que no mueven data_version (jobs por cron como
+    auto_lost_overdue, TAMS_PG_NOTIFY=0 con varios workers) y sin él el
+    calendario respondería 304 con datos viejos hasta el día siguiente.
+    """
+    parts = [
+        data_version.boot_id(),
+        str(data_version.version(CALENDAR_SOURCE_TABLES)),
+        str(int(time.time() // max(ALERTS_CACHE_MAX_AGE_SECONDS, 1))),
+        actor_role,
+        actor_dept,
+        range_start.isoformat() if range_start else "",
+        range_end.isoformat() if range_end else "",
+        _date.today().isoformat(),
+        ",".join(f"{cid}:{sev}" for cid, sev in sorted(severity_by_course.items())),
+    ]
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
 @bp.route("/api/calendar-events")
 @login_required
 def api_calendar_events():
+    range_start, range_end = _parse_calendar_range(request.args)
+    windowed = range_start is not None
+
     db = SessionLocal()
     try:
         severity_order = {"notice": 1, "warning": 2, "critical": 3}
@@ -2008,7 +1936,7 @@ def api_calendar_events():
         # ------------------------------------------------------------
         now_utc = _now_utc()
 
-        alerts = get_alerts_for_user(db, current_user, include_hidden=True) or []
+        alerts = get_alerts_for_user(db, current_user, include_hidden=True, read_only=True) or []
 
         for a in alerts:
             course_obj = a.get("course")
@@ -2042,19 +1970,40 @@ def api_calendar_events():
                     sev = "notice"
                 bump_severity(cid, sev)
 
+        actor_role = (getattr(current_user, "role", "") or "").strip().lower()
+        actor_dept = (getattr(current_user, "department", "") or "").strip().lower()
+
+        # ------------------------------------------------------------
+        # Refetch sin cambios -> 304 antes de lanzar ninguna query
+        # ------------------------------------------------------------
+        etag = _calendar_etag(range_start, range_end, actor_role, actor_dept, severity_by_course)
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag)
+            resp.headers["Cache-Control"] = "private, no-cache"
+            return resp
+
         # ------------------------------------------------------------
         # Eventos de cursos
+        # Sólo los que tienen inicio o fin dentro del rango visible
+        # (los eventos son de un día: start_date y end_date).
         # ------------------------------------------------------------
-        courses = db.query(Course).all()
+        courses_q = db.query(Course).options(lazyload(Course.asset_requirements))
+        if windowed:
+            courses_q = courses_q.filter(
+                or_(
+                    and_(Course.start_date >= range_start, Course.start_date < range_end),
+                    and_(Course.end_date >= range_start, Course.end_date < range_end),
+                )
+            )
+        courses = courses_q.all()
+        window_course_ids = [c.id for c in courses]
 
         def css_slug(s: str) -> str:
             s = (s or "").strip().lower()
             s = re.sub(r"[^a-z0-9]+", "-", s)
             return s.strip("-")
 
-        actor_role = (getattr(current_user, "role", "") or "").strip().lower()
-        actor_dept = (getattr(current_user, "department", "") or "").strip().lower()
-
         force_code_title = (actor_role == "admin") or (actor_dept == "itc support")
         is_itc_view = (
             actor_role == "admin"
@@ -2067,106 +2016,28 @@ def api_calendar_events():
         pending_pc_count_by_course = {}
         returned_pc_on_end_count_by_course = {}
 
-        if is_itc_view:
-            # ------------------------------------------------------------
-            # PCs asignados históricamente al curso
-            # course_device_movements = histórico
-            # ------------------------------------------------------------
-            assigned_rows = (
-                db.query(
-                    models.CourseDeviceMovement.course_id.label("course_id"),
-                    func.count(models.CourseDeviceMovement.id).label("pc_count"),
-                )
-                .filter(
-                    models.CourseDeviceMovement.cancelled_at.is_(None),
-                    models.CourseDeviceMovement.asset_kind == "pc",
-                    models.CourseDeviceMovement.movement_type == "assigned",
-                )
-                .group_by(models.CourseDeviceMovement.course_id)
-                .all()
-            )
-
-            assigned_pc_count_by_course = {
-                int(row.course_id): int(row.pc_count or 0)
-                for row in assigned_rows
-            }
-
-            # ------------------------------------------------------------
-            # PCs requeridos por curso
-            # En TAMS actual: asset_type_id = 13 corresponde a PC/laptop
-            # ------------------------------------------------------------
-            required_rows = (
-                db.query(
-                    CourseAssetRequirement.course_id.label("course_id"),
-                    func.coalesce(
-                        func.sum(CourseAssetRequirement.quantity),
-                        0,
-                    ).label("required_pc_count"),
-                )
-                .filter(
-                    CourseAssetRequirement.active.is_(True),
-                    CourseAssetRequirement.asset_type_id == 13,
-                    CourseAssetRequirement.quantity > 0,
-                )
-                .group_by(CourseAssetRequirement.course_id)
-                .all()
-            )
-
-            required_pc_count_by_course = {
-                int(row.course_id): int(row.required_pc_count or 0)
-                for row in required_rows
-            }
-
-            # ------------------------------------------------------------
-            # PCs pendientes actualmente
-            # assignments = tabla viva
-            # Si un PC sigue aquí, sigue pendiente de devolución
-            # ------------------------------------------------------------
-            pending_rows = (
-                db.query(
-                    models.Assignment.course_id.label("course_id"),
-                    func.count(models.Assignment.id).label("pending_pc_count"),
-                )
-                .join(models.Device, models.Assignment.device_id == models.Device.id)
-                .filter(
-                    models.Assignment.status.in_(["active", "overdue_1", "overdue_2"]),
-                    models.Device.asset_type_id == 13,
-                )
-                .group_by(models.Assignment.course_id)
-                .all()
-            )
-
-            pending_pc_count_by_course = {
-                int(row.course_id): int(row.pending_pc_count or 0)
-                for row in pending_rows
-            }
+        itc_type_ids = None
+        if is_itc_view or actor_dept == "itc support":
+            itc_type_ids = itc_asset_type_ids(db)
 
+        if is_itc_view:
             # ------------------------------------------------------------
-            # PCs devueltos exactamente en el día de fin del curso
-            # Estos NO se pintarán como evento +X independiente.
-            # Se añadirán al evento de fin del curso.
+            # assigned (histórico de movimientos), required, pending
+            # (assignments vivos) y devueltos el día de fin, en una query.
+            # Los devueltos el día de fin NO se pintan como evento +X
+            # independiente: se añaden al evento de fin del curso.
             # ------------------------------------------------------------
-            returned_on_end_rows = (
-                db.query(
-                    models.CourseDeviceMovement.course_id.label("course_id"),
-                    func.count(models.CourseDeviceMovement.id).label("returned_pc_count"),
-                )
-                .join(Course, models.CourseDeviceMovement.course_id == Course.id)
-                .filter(
-                    models.CourseDeviceMovement.cancelled_at.is_(None),
-                    models.CourseDeviceMovement.asset_kind == "pc",
-                    models.CourseDeviceMovement.movement_type == "returned",
-                    Course.end_date.isnot(None),
-                    func.date(models.CourseDeviceMovement.movement_at) == Course.end_date,
-                )
-                .group_by(models.CourseDeviceMovement.course_id)
-                .all()
+            stats = get_itc_calendar_stats(
+                db,
+                itc_type_ids[PC_ROOT_CODE],
+                course_ids=window_course_ids if windowed else None,
             )
 
-            returned_pc_on_end_count_by_course = {
-                int(row.course_id): int(row.returned_pc_count or 0)
-                for row in returned_on_end_rows
-            }
+            for cid, (n_assigned, n_required, n_pending, n_returned) in stats.items():
+                assigned_pc_count_by_course[cid] = n_assigned
+                required_pc_count_by_course[cid] = n_required
+                pending_pc_count_by_course[cid] = n_pending
+                returned_pc_on_end_count_by_course[cid] = n_returned
 
         valid_itc_course_ids = set()
         if actor_dept == "itc support":
@@ -2174,7 +2045,9 @@ def api_calendar_events():
                 db.query(CourseAssetRequirement.course_id)
                 .filter(
                     CourseAssetRequirement.active.is_(True),
-                    CourseAssetRequirement.asset_type_id.in_([13, 15]),
+                    CourseAssetRequirement.asset_type_id.in_(
+                        sorted(itc_type_ids[PC_ROOT_CODE] | itc_type_ids[USB_ROOT_CODE])
+                    ),
                     CourseAssetRequirement.quantity > 0,
                 )
                 .distinct()
@@ -2308,9 +2181,16 @@ def api_calendar_events():
             reworks_q = (
                 db.query(models.CourseRework, Course)
                 .join(Course, models.CourseRework.course_id == Course.id)
+                .options(lazyload(Course.asset_requirements))
                 .filter(models.CourseRework.cancelled_at.is_(None))
             )
 
+            if windowed:
+                reworks_q = reworks_q.filter(
+                    models.CourseRework.rework_date >= range_start,
+                    models.CourseRework.rework_date < range_end,
+                )
+
             if actor_dept == "itc support":
                 reworks_q = reworks_q.filter(Course.id.in_(valid_itc_course_ids))
 
@@ -2360,6 +2240,12 @@ def api_calendar_events():
             movements_q = (
                 db.query(models.CourseDeviceMovement, Course)
                 .join(Course, models.CourseDeviceMovement.course_id == Course.id)
+                .options(
+                    lazyload(models.CourseDeviceMovement.course),
+                    lazyload(models.CourseDeviceMovement.device),
+                    lazyload(models.CourseDeviceMovement.creator),
+                    lazyload(Course.asset_requirements),
+                )
                 .filter(
                     models.CourseDeviceMovement.cancelled_at.is_(None),
                     models.CourseDeviceMovement.asset_kind == "pc",
@@ -2367,6 +2253,18 @@ def api_calendar_events():
                 )
             )
 
+            if windowed:
+                # movement_at es timestamptz: el rango se compara en UTC con
+                # un día de margen por cada lado; el día exacto se filtra abajo.
+                movements_q = movements_q.filter(
+                    models.CourseDeviceMovement.movement_at >= datetime.combine(
+                        range_start - timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc
+                    ),
+                    models.CourseDeviceMovement.movement_at < datetime.combine(
+                        range_end + timedelta(days=1), datetime.min.time(), tzinfo=timezone.utc
+                    ),
+                )
+
             if actor_dept == "itc support":
                 movements_q = movements_q.filter(Course.id.in_(valid_itc_course_ids))
 
@@ -2380,6 +2278,9 @@ def api_calendar_events():
 
                 movement_day = mv.movement_at.date()
 
+                if windowed and not (range_start <= movement_day < range_end):
+                    continue
+
                 # Si la devolución cae justo en el día de fin del curso,
                 # no pintamos un evento +X independiente.
                 # Ese +X se añade al evento de fin.
@@ -2457,7 +2358,10 @@ def api_calendar_events():
                     },
                 })
 
-        return jsonify(events)
+        resp = jsonify(events)
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
 
     finally:
         db.close()
@@ -2466,8 +2370,7 @@ def api_calendar_events():
 # ===========================
 
 def _course_rows(courses):
-    rows = []
-    rows.append([
+    yield [
         "ID",
         "Course code",
         "Name",
@@ -2475,7 +2378,7 @@ def _course_rows(courses):
         "Trainees",
         "Start date",
         "End date",
-    ])
+    ]
 
     for c in courses:
         start = c.start_date
@@ -2484,7 +2387,7 @@ def _course_rows(courses):
         start_str = start.strftime("%Y-%m-%d") if start else ""
         end_str = end.strftime("%Y-%m-%d") if end else ""
 
-        rows.append([
+        yield [
             c.id,
             c.course or "",
             c.name or "",
@@ -2492,46 +2395,15 @@ def _course_rows(courses):
             c.trainees if c.trainees is not None else "",
             start_str,
             end_str,
-        ])
-
-    return rows
+        ]
 
 
 def _export_courses_csv(courses):
-    output = StringIO()
-    writer = csv.writer(output)
-
-    for row in _course_rows(courses):
-        writer.writerow(row)
-
-    csv_data = output.getvalue()
-    output.close()
-
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=courses.csv"},
-    )
+    return stream_csv(_course_rows(courses), "courses.csv")
 
 
 def _export_courses_excel(courses):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Courses"
-
-    for row in _course_rows(courses):
-        ws.append(row)
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name="courses.xlsx",
-    )
+    return export_xlsx(_course_rows(courses), "courses.xlsx", "Courses")
 
 
 def _export_courses_pdf(courses):
@@ -2553,7 +2425,7 @@ def _export_courses_pdf(courses):
     elements.append(title)
     elements.append(Spacer(1, 12))
 
-    data = _course_rows(courses)
+    data = list(_course_rows(courses))
     table = Table(data, repeatRows=1)
 
     table_style = TableStyle([
@@ -2601,18 +2473,15 @@ def export_courses():
     page = max(int(request.args.get("page", 1)), 1)
     per_page = int(request.args.get("per_page", PER_PAGE))
 
-    db = SessionLocal()
-    try:
-        qry = build_courses_query(db, request.args)
-
-        courses = (
-            qry.order_by(models.Course.id.asc())
-               .offset((page - 1) * per_page)
-               .limit(per_page)
-               .all()
+    courses = iter_query(
+        lambda db: (
+            build_courses_query(db, request.args)
+            .options(lazyload(models.Course.asset_requirements))
+            .order_by(models.Course.id.asc())
+            .offset((page - 1) * per_page)
+            .limit(per_page)
         )
-    finally:
-        db.close()
+    )
 
     if fmt == "pdf":
         return _export_courses_pdf(courses)
@@ -2778,72 +2647,72 @@ def assign_pcs(course_id):
                 return redirect(url_for("courses.assign_pcs", course_id=course_id))
 
             now = datetime.now(timezone.utc)
+            user_id = getattr(current_user, "id", None)
 
-            # Solo asignamos devices disponibles
+            # Todo el lote en un número fijo de queries: devices, conflictos,
+            # UPDATE guardado, INSERT assignments y INSERT histórico.
             devices = (
                 db.query(models.Device)
-                .filter(
-                    models.Device.id.in_(device_ids),
-                    models.Device.status == "available",
-                )
+                .filter(models.Device.id.in_(device_ids))
                 .all()
             )
+            devices_by_id = {d.id: d for d in devices}
 
-            if not devices:
+            # Solo asignamos devices disponibles y sin assignment vivo.
+            # OJO: assignments es tabla viva, así que aquí miramos lo activo actual.
+            live = find_live_assignments(db, devices_by_id.keys())
+            candidates = [
+                d.id for d in devices
+                if d.status == "available" and d.id not in live
+            ]
+
+            if not candidates:
                 flash("No available PCs found in selection.", "danger")
                 return redirect(url_for("courses.assign_pcs", course_id=course_id))
 
-            created_assignments = []
-            created_devices = []
-
-            for d in devices:
-                # Evitar duplicados si ya tiene assignment vivo.
-                # OJO: assignments es tabla viva, así que aquí miramos lo activo actual.
-                existing = (
-                    db.query(models.Assignment.id)
-                    .filter(
-                        models.Assignment.device_id == d.id,
-                        models.Assignment.status.in_(["active", "overdue_1", "overdue_2"]),
-                    )
-                    .first()
-                )
-
-                if existing:
-                    continue
-
-                assignment = models.Assignment(
-                    device_id=d.id,
-                    course_id=c.id,
-                    status="active",
-                    assigned_at=now,
-                    created_at=now,
-                    updated_at=now,
-                    created_by=getattr(current_user, "id", None),
-                )
+            # Si otra petición se ha llevado alguno mientras tanto, no vuelve aquí
+            claimed = claim_devices(db, candidates)
+            lost_race = [devices_by_id[did] for did in candidates if did not in claimed]
 
-                db.add(assignment)
-                db.flush()  # Necesario para tener assignment.id
+            created_ids = insert_assignments(db, [
+                {
+                    "device_id": did,
+                    "course_id": c.id,
+                    "status": "active",
+                    "assigned_at": now,
+                    "created_at": now,
+                    "updated_at": now,
+                    "created_by": user_id,
+                }
+                for did in candidates if did in claimed
+            ])
 
-                # Movimiento histórico para calendario / trazabilidad.
-                # assignments sigue siendo tabla viva; esto es el histórico.
-                db.add(models.CourseDeviceMovement(
-                    course_id=c.id,
-                    device_id=d.id,
-                    movement_type="assigned",
-                    asset_kind="pc",
-                    movement_at=now,
-                    assignment_id=assignment.id,
-                    created_by=getattr(current_user, "id", None),
-                    notes=None,
-                ))
+            # Movimiento histórico para calendario / trazabilidad.
+            # assignments sigue siendo tabla viva; esto es el histórico.
+            insert_course_device_movements(db, [
+                {
+                    "course_id": c.id,
+                    "device_id": did,
+                    "movement_type": "assigned",
+                    "asset_kind": "pc",
+                    "movement_at": now,
+                    "assignment_id": aid,
+                    "created_by": user_id,
+                    "notes": None,
+                }
+                for did, aid in created_ids.items()
+            ])
 
-                d.status = "assigned"
-                d.updated_at = now
+            created_devices = [devices_by_id[did] for did in created_ids]
 
-                created_assignments.append(assignment)
-                created_devices.append(d)
+            if lost_race:
+                flash(
+                    "Some PCs were assigned by someone else meanwhile and were skipped: "
+                    + ", ".join(d.name or d.barcode or f"Device #{d.id}" for d in lost_race),
+                    "warning",
+                )
 
-            if not created_assignments:
+            if not created_ids:
                 flash("No PCs were assigned. Selected devices may already be assigned.", "warning")
                 return redirect(url_for("courses.assign_pcs", course_id=course_id))
 
@@ -2887,14 +2756,14 @@ def assign_pcs(course_id):
                     "devices_extra": extra_n,
                     "course_device_movements": [
                         {
-                            "assignment_id": a.id,
-                            "device_id": a.device_id,
-                            "course_id": a.course_id,
+                            "assignment_id": aid,
+                            "device_id": did,
+                            "course_id": c.id,
                             "movement_type": "assigned",
                             "asset_kind": "pc",
                             "movement_at": now.isoformat(),
                         }
-                        for a in created_assignments
+                        for did, aid in created_ids.items()
                     ],
                 },
                 description=description,
@@ -2930,115 +2799,27 @@ def api_pc_by_barcode():
     data = request.get_json(silent=True) or {}
     barcode = (data.get("barcode") or "").strip()
 
-    print("\n=== api_pc_by_barcode DEBUG ===")
-    print("payload:", data)
-    print("barcode:", repr(barcode))
-
     if not barcode:
-        print("ERROR: Missing barcode in payload")
         return jsonify({"success": False, "error": "Missing barcode"}), 400
 
     db = SessionLocal()
     try:
-        # 1) Comprobar device raw (SIN FILTROS de COMPUTER)
-        raw = (
-            db.query(models.Device)
-            .options(joinedload(models.Device.asset_type).joinedload(models.AssetType.parent))
-            .filter(models.Device.barcode == barcode)
-            .first()
-        )
-
-        if not raw:
-            print("RAW: No device found for barcode at all")
-        else:
-            print("RAW: device found")
-            print("  raw.id:", raw.id)
-            print("  raw.name:", raw.name)
-            print("  raw.uid:", raw.uid)
-            print("  raw.barcode:", raw.barcode)
-            print("  raw.active:", getattr(raw, "active", None))
-            print("  raw.asset_type_id:", getattr(raw, "asset_type_id", None))
-            print("  raw.status:", getattr(raw, "status", None))
-
-            if raw.asset_type:
-                print("  asset_type.id:", raw.asset_type.id)
-                print("  asset_type.code:", raw.asset_type.code)
-                print("  asset_type.name:", raw.asset_type.name)
-                print("  asset_type.active:", getattr(raw.asset_type, "active", None))
-                if raw.asset_type.parent:
-                    print("  parent.id:", raw.asset_type.parent.id)
-                    print("  parent.code:", raw.asset_type.parent.code)
-                    print("  parent.name:", raw.asset_type.parent.name)
-                    print("  parent.active:", getattr(raw.asset_type.parent, "active", None))
-                else:
-                    print("  parent: None")
-            else:
-                print("  asset_type: None (asset_type_id might be NULL or FK mismatch)")
-
-        # 2) Query final: COMPUTER root o hijo de COMPUTER (robusto)
-        Parent = aliased(models.AssetType)
-
-        d = (
-            db.query(models.Device)
-            .join(models.AssetType, models.Device.asset_type_id == models.AssetType.id)
-            .outerjoin(Parent, models.AssetType.parent_id == Parent.id)
-            .options(joinedload(models.Device.asset_type).joinedload(models.AssetType.parent))
-            .filter(
-                models.Device.barcode == barcode,
-                models.AssetType.active.is_(True),
-                or_(
-                    models.AssetType.code == "COMPUTER",
-                    Parent.code == "COMPUTER",
-                ),
-            )
-            .first()
-        )
-
-        if not d:
-            print("FINAL: Not found with COMPUTER filters.")
-            # check: device exists and active?
-            active_only = (
-                db.query(models.Device.id, models.Device.asset_type_id)
-                .filter(models.Device.barcode == barcode)
-                .first()
-            )
-            print("CHECK device by barcode (id, active, asset_type_id):", active_only)
-
-            # check: asset type active?
-            if raw and raw.asset_type:
-                at_row = (
-                    db.query(models.AssetType.id, models.AssetType.code, models.AssetType.active, models.AssetType.parent_id)
-                    .filter(models.AssetType.id == raw.asset_type.id)
-                    .first()
-                )
-                print("CHECK asset_type row:", at_row)
+        # Device COMPUTER (raíz o subtipo activo) + assignment vivo, en una query
+        r = resolve_device(db, barcode, fields=("barcode",), family=PC_ROOT_CODE)
 
+        if not r:
             return jsonify({
                 "success": False,
                 "reason": "not_found",
-                "error": "PC not found for this barcode (see server logs DEBUG)."
+                "error": "PC not found for this barcode."
             }), 404
 
-        print("FINAL: Found device under COMPUTER filters.")
-        print("  d.id:", d.id, "d.uid:", d.uid, "d.barcode:", d.barcode)
-
-        # 3) Assignment activo más reciente
-        a = (
-            db.query(models.Assignment)
-            .options(joinedload(models.Assignment.course))
-            .filter(
-                models.Assignment.device_id == d.id,
-                models.Assignment.status.in_(["active", "overdue_1", "overdue_2"]),
-            )
-            .order_by(models.Assignment.assigned_at.desc())
-            .first()
-        )
-
+        d = r.device
         assigned_course = None
-        if a and a.course:
+        if r.course:
             assigned_course = {
-                "id": a.course.id,
-                "label": (a.course.course or a.course.name or f"Course #{a.course.id}"),
+                "id": r.course.id,
+                "label": (r.course.course or r.course.name or f"Course #{r.course.id}"),
             }
 
         return jsonify({
@@ -3049,8 +2830,8 @@ def api_pc_by_barcode():
                 "barcode": d.barcode,
                 "uid": d.uid,
                 "status": d.status,
-                "asset_type_code": d.asset_type.code if d.asset_type else None,
-                "asset_parent_code": d.asset_type.parent.code if d.asset_type and d.asset_type.parent else None,
+                "asset_type_code": r.asset_type_code,
+                "asset_parent_code": r.asset_parent_code,
             },
             "assigned_course": assigned_course,
         })
@@ -3108,51 +2889,41 @@ def return_pcs():
 
                 return code or name or f"Course #{getattr(c, 'id', '?')}"
 
+            ids = []
             for raw_id in device_ids:
                 try:
-                    did = int(raw_id)
+                    ids.append(int(raw_id))
                 except ValueError:
                     skipped += 1
-                    continue
 
-                d = (
-                    db.query(models.Device)
-                    .options(
-                        joinedload(models.Device.asset_type)
-                        .joinedload(models.AssetType.parent)
-                    )
-                    .filter(models.Device.id == did)
-                    .first()
-                )
+            # Devices + assignment vivo (con curso) de todo el lote: 2 queries
+            devices = (
+                db.query(models.Device)
+                .filter(models.Device.id.in_(ids))
+                .all()
+            ) if ids else []
+            devices_by_id = {d.id: d for d in devices}
+            skipped += sum(1 for did in ids if did not in devices_by_id)
 
-                if not d:
-                    skipped += 1
-                    continue
+            live = find_live_assignments(db, devices_by_id.keys(), with_course=True)
 
-                # Buscar assignment vivo y cargar curso antes de borrarlo
-                a = (
-                    db.query(models.Assignment)
-                    .options(joinedload(models.Assignment.course))
-                    .filter(
-                        models.Assignment.device_id == d.id,
-                        models.Assignment.status.in_(["active", "overdue_1", "overdue_2"]),
-                    )
-                    .order_by(models.Assignment.assigned_at.desc())
-                    .first()
-                )
+            # Siempre dejamos el PC como available, como ya hacía tu lógica (1 UPDATE)
+            claim_devices(db, devices_by_id.keys(), from_statuses=None, to_status="available")
 
-                # Siempre dejamos el PC como available, como ya hacía tu lógica
-                d.status = "available"
-                d.updated_at = now
+            picked = {did: rows[0] for did, rows in live.items()}
+            skipped += sum(1 for did in devices_by_id if did not in picked)
 
-                if not a:
+            # Borrar las asignaciones vivas (1 DELETE). Si otra petición ya
+            # la había devuelto, no vuelve en el RETURNING y se cuenta como saltada.
+            deleted = delete_assignments(db, [a.id for a in picked.values()])
+
+            movement_rows = []
+            for did, a in picked.items():
+                if a.id not in deleted:
                     skipped += 1
                     continue
 
-                # Capturar datos ANTES de borrar assignment
-                assignment_id = a.id
-                course_id = a.course_id
-                device_id = d.id
+                d = devices_by_id[did]
                 c = getattr(a, "course", None)
                 c_label = course_label(c)
 
@@ -3176,23 +2947,22 @@ def return_pcs():
                 # assignments sigue siendo tabla viva y se borra,
                 # pero antes registramos el retorno real.
                 # --------------------------------------------------
-                db.add(models.CourseDeviceMovement(
-                    course_id=course_id,
-                    device_id=device_id,
-                    movement_type="returned",
-                    asset_kind="pc",
-                    movement_at=now,
-                    assignment_id=assignment_id,
-                    created_by=user_id,
-                    notes=None,
-                ))
-
-                movement_count += 1
-
-                # Borrar la asignación viva
-                db.delete(a)
+                movement_rows.append({
+                    "course_id": a.course_id,
+                    "device_id": did,
+                    "movement_type": "returned",
+                    "asset_kind": "pc",
+                    "movement_at": now,
+                    "assignment_id": a.id,
+                    "created_by": user_id,
+                    "notes": None,
+                })
                 returned += 1
 
+            # 1 INSERT multi-fila para el histórico
+            insert_course_device_movements(db, movement_rows)
+            movement_count = len(movement_rows)
+
             db.flush()
 
             courses_count = len(by_course)
@@ -3304,21 +3074,10 @@ def api_update_itc_status(course_id):
     finally:
         db.close()
 
-def _find_assigned_course_for_device(db, device_id: int):
-    row = (
-        db.query(models.Assignment, models.Course)
-        .join(models.Course, models.Course.id == models.Assignment.course_id)
-        .filter(
-            models.Assignment.device_id == device_id,
-            models.Assignment.status == "active",  # o tu condición
-        )
-        .order_by(models.Assignment.id.desc())
-        .first()
-    )
-    if not row:
+def _assigned_course_payload(a, c):
+    if not a or not c:
         return None
 
-    a, c = row
     return {
         "assignment_id": a.id,
         "course_id": c.id,
@@ -3329,6 +3088,43 @@ def _find_assigned_course_for_device(db, device_id: int):
         "end_date": c.end_date.isoformat() if c.end_date else None,
     }
 
+
+def _lookup_by_identifier_or_name(db, q, *, fields, family):
+    """
+    Lectores de /api/pc-lookup y /api/card-lookup:
+    1) identificador exacto (resolver, una query con assignment vivo)
+    2) nombre exacto / parcial (máx. 10), y si sólo hay uno se resuelve igual
+
+    Devuelve (ResolvedDevice | None, matches)
+    """
+    r = resolve_device(db, q, fields=fields, family=family)
+    if r:
+        return r, []
+
+    type_ids = family_type_ids(family)
+    if not type_ids:
+        return None, []
+
+    base = db.query(models.Device).filter(models.Device.asset_type_id.in_(type_ids))
+
+    matches = (
+        base.filter(func.lower(models.Device.name) == q.lower())
+        .limit(10)
+        .all()
+    )
+    if not matches and len(q) >= 3:
+        matches = (
+            base.filter(models.Device.name.ilike(f"%{q}%"))
+            .limit(10)
+            .all()
+        )
+
+    if len(matches) == 1:
+        return resolve_device(db, matches[0].uid, fields=("uid",), family=family), []
+
+    return None, matches
+
+
 @bp.route("/api/pc-lookup", methods=["POST"])
 @login_required
 def api_pc_lookup():
@@ -3342,49 +3138,15 @@ def api_pc_lookup():
 
     db = SessionLocal()
     try:
-        Parent = aliased(models.AssetType)
-
-        base = (
-            db.query(models.Device)
-            .join(models.AssetType, models.Device.asset_type_id == models.AssetType.id)
-            .outerjoin(Parent, models.AssetType.parent_id == Parent.id)
-            .options(joinedload(models.Device.asset_type).joinedload(models.AssetType.parent))
-            .filter(
-                models.AssetType.active.is_(True),
-                or_(models.AssetType.code == "COMPUTER", Parent.code == "COMPUTER"),
-            )
+        # barcode exacto > UID exacto > nombre
+        r, matches = _lookup_by_identifier_or_name(
+            db, q, fields=("barcode", "uid"), family=PC_ROOT_CODE
         )
 
-        # 1) exact barcode
-        d = base.filter(models.Device.barcode == q).first()
-        if not d:
-            # 2) exact UID
-            d = base.filter(models.Device.uid == q).first()
-
-        matches = []
-        if not d:
-            # 3) name exact (case-insensitive)
-            matches = (
-                base.filter(func.lower(models.Device.name) == q.lower())
-                .limit(10)
-                .all()
-            )
-
-            # 4) name partial
-            if not matches and len(q) >= 3:
-                matches = (
-                    base.filter(models.Device.name.ilike(f"%{q}%"))
-                    .limit(10)
-                    .all()
-                )
-
-            if len(matches) == 1:
-                d = matches[0]
-
-        if not d and not matches:
+        if not r and not matches:
             return jsonify({"success": False, "error": "Not found"}), 404
 
-        if not d and len(matches) > 1:
+        if not r:
             return jsonify({
                 "success": False,
                 "error": "Multiple matches",
@@ -3394,8 +3156,7 @@ def api_pc_lookup():
                 ]
             }), 409
 
-        # Reutiliza tu lógica de “assigned_course” si ya la montas en api_pc_by_barcode
-        assigned = _find_assigned_course_for_device(db, d.id)  # o tu función/consulta actual
+        d = r.device
 
         return jsonify({
             "success": True,
@@ -3405,32 +3166,17 @@ def api_pc_lookup():
                 "uid": d.uid,
                 "barcode": d.barcode,
                 "status": d.status,
-                "asset_type_code": (d.asset_type.code if d.asset_type else None),
+                "asset_type_code": r.asset_type_code,
             },
-            "assigned_course": assigned
+            "assigned_course": _assigned_course_payload(r.assignment, r.course),
         })
     finally:
         db.close()
 
-def _find_active_loan_for_card(db, card_device_id: int):
-    CLOSED = {"returned", "cancelled", "lost"}  # ajusta a tus valores reales
-
-    row = (
-        db.query(models.Assignment, models.Course)
-        .join(models.Course, models.Course.id == models.Assignment.course_id)
-        .filter(
-            models.Assignment.device_id == card_device_id,
-            ~models.Assignment.status.in_(CLOSED),
-        )
-        .order_by(models.Assignment.id.desc())
-        .first()
-    )
-
-    if not row:
+def _active_loan_payload(a, c):
+    if not a or not c:
         return None
 
-    a, c = row
-
     course_code = (c.course or "").strip()
     parts = [course_code, (c.name or "").strip(), (c.client or "").strip()]
     label = " | ".join([p for p in parts if p]) or (f"Course #{c.id}")
@@ -3453,45 +3199,15 @@ def api_card_lookup():
 
     db = SessionLocal()
     try:
-        Parent = aliased(models.AssetType)
-
-        base = (
-            db.query(models.Device)
-            .join(models.AssetType, models.Device.asset_type_id == models.AssetType.id)
-            .outerjoin(Parent, models.AssetType.parent_id == Parent.id)
-            .options(joinedload(models.Device.asset_type).joinedload(models.AssetType.parent))
-            .filter(
-                models.AssetType.active.is_(True),
-                or_(
-                    models.AssetType.code == "CARD",
-                    Parent.code == "CARD",
-                ),
-            )
-        )
-
         # Tarjetas: en tu tabla pone Barcode=No, así que aquí el match real es UID y nombre.
-        d = base.filter(models.Device.uid == q).first()
-
-        matches = []
-        if not d:
-            matches = (
-                base.filter(func.lower(models.Device.name) == q.lower())
-                .limit(10)
-                .all()
-            )
-            if not matches and len(q) >= 3:
-                matches = (
-                    base.filter(models.Device.name.ilike(f"%{q}%"))
-                    .limit(10)
-                    .all()
-                )
-            if len(matches) == 1:
-                d = matches[0]
+        r, matches = _lookup_by_identifier_or_name(
+            db, q, fields=("uid",), family=CARD_ROOT_CODE
+        )
 
-        if not d and not matches:
+        if not r and not matches:
             return jsonify({"success": False, "error": "Not found"}), 404
 
-        if not d and len(matches) > 1:
+        if not r:
             return jsonify({
                 "success": False,
                 "error": "Multiple matches",
@@ -3501,7 +3217,7 @@ def api_card_lookup():
                 ]
             }), 409
 
-        active_loan = _find_active_loan_for_card(db, d.id)
+        d = r.device
 
         return jsonify({
             "success": True,
@@ -3511,9 +3227,9 @@ def api_card_lookup():
                 "uid": d.uid,
                 "barcode": d.barcode,  # probablemente None, y está bien
                 "status": d.status,
-                "asset_type_code": (d.asset_type.code if d.asset_type else None),
+                "asset_type_code": r.asset_type_code,
             },
-            "active_loan": active_loan,
+            "active_loan": _active_loan_payload(r.assignment, r.course),
         })
     finally:
         db.close()
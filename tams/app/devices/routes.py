@@ -1,14 +1,15 @@
 from flask import render_template, request, redirect, url_for, flash, send_file, Response
 from flask_login import login_required, current_user
 from . import bp
-from io import StringIO, BytesIO
-import csv
-from openpyxl import Workbook
+from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet
 from app.db import SessionLocal
+from app.scripts.exports import iter_query, stream_csv, export_xlsx
+from app.scripts.text_search import devices_search_text, search_available
+from app.scripts.asset_hierarchy import CARD_ROOT_CODE, get_hierarchy
 import app.models as models
 from sqlalchemy import or_,func
 from sqlalchemy.exc import IntegrityError
@@ -46,52 +47,8 @@ def _find_device_by_uid_or_barcode(db, uid: str | None, barcode: str | None, exc
 
     return q.first()
 
-def _notif_dept_scope():
-    role = (getattr(current_user, "role", "") or "").strip().lower()
-    dept = (getattr(current_user, "department", "") or "").strip()
-
-    # Admin ve todo
-    if "admin" in role:
-        return None
-
-    if dept.lower() == "itc support":
-        return "ITC support"
-    if dept.upper() == "TCO":
-        return "TCO"
-
-    # Si no tiene dept válido, no enseñamos nada (evita leaks)
-    return "__none__"
-
-
-@bp.app_context_processor
-def inject_notifications_unread_count():
-    """
-    Disponible en TODOS los templates:
-    notifications_unread_count
-    """
-    if not current_user.is_authenticated:
-        return dict(notifications_unread_count=0)
-
-    scope = _notif_dept_scope()
-    if scope == "__none__":
-        return dict(notifications_unread_count=0)
-
-    db = SessionLocal()
-    try:
-        q = db.query(models.Notification.id).filter(models.Notification.active.is_(True))
-
-        if scope is not None:
-            q = q.filter(models.Notification.department_target == scope)
-
-        # Unread = no leída y no cerrada
-        q = q.filter(
-            models.Notification.read_at.is_(None),
-            models.Notification.status.notin_(["done", "dismissed"]),
-        )
-
-        return dict(notifications_unread_count=q.count())
-    finally:
-        db.close()
+# notifications_unread_count lo inyecta main.inject_notifications_badge
+# (perezoso y una sola vez por request).
 
 
 def get_asset_roots_and_children_map(db):
@@ -102,17 +59,8 @@ def get_asset_roots_and_children_map(db):
     is_itc = (dept == "itc support") or role.startswith("itc")
     is_tco = (dept == "tco")
 
-    # Root CARD id (si existe)
-    card_root = (
-        db.query(models.AssetType)
-          .filter(
-              models.AssetType.parent_id.is_(None),
-              models.AssetType.active.is_(True),
-              models.AssetType.code == "CARD",
-          )
-          .first()
-    )
-    card_root_id = card_root.id if card_root else None
+    # Root CARD id (si existe), del índice en memoria
+    card_root_id = get_hierarchy().root_id(CARD_ROOT_CODE, active_only=True)
 
     # Roots visibles según perfil
     roots_q = (
@@ -222,51 +170,60 @@ def build_devices_query(db, args):
     )
 
     # -------------------------
-    # Root CARD
-    # -------------------------
-    card_root = (
-        db.query(models.AssetType)
-          .filter(
-              models.AssetType.parent_id.is_(None),
-              models.AssetType.active.is_(True),
-              models.AssetType.code == "CARD",
-          )
-          .first()
-    )
-    card_root_id = card_root.id if card_root else None
-
-    # -------------------------
-    # Filtro por perfil (root)
+    # Filtro por perfil (root): familia CARD desde el índice en memoria
     # -------------------------
+    hierarchy = get_hierarchy()
+    card_root_id = hierarchy.root_id(CARD_ROOT_CODE, active_only=True)
     if not is_admin and card_root_id:
-        is_card_root = or_(
-            Parent.id == card_root_id,          # subtypes de CARD
-            models.AssetType.id == card_root_id # CARD root directo
-        )
+        card_family_ids = sorted(hierarchy.family(CARD_ROOT_CODE))
 
         if is_tco:
-            query = query.filter(is_card_root)
+            query = query.filter(models.Device.asset_type_id.in_(card_family_ids))
         elif is_itc:
-            query = query.filter(~is_card_root)
+            query = query.filter(models.Device.asset_type_id.notin_(card_family_ids))
 
     # -------------------------
     # Search global (q)
     # -------------------------
     if q:
         like = f"%{q}%"
-        query = query.filter(
-            or_(
-                models.Device.name.ilike(like),
-                models.Device.uid.ilike(like),
-                models.Device.barcode.ilike(like),
-                models.Device.status.ilike(like),
-                models.Device.notes.ilike(like),
-                models.AssetType.name.ilike(like),
-                models.AssetType.code.ilike(like),
-                Parent.name.ilike(like),
-                Parent.code.ilike(like),
+        if search_available(db):
+            # asset_types es pequeña: tipos que casan (por nombre/código propio
+            # o del padre) resueltos antes, para que el OR use índices
+            MatchParent = aliased(models.AssetType)
+            type_ids = [
+                tid for (tid,) in db.query(models.AssetType.id)
+                  .outerjoin(MatchParent, models.AssetType.parent_id == MatchParent.id)
+                  .filter(
+                      or_(
+                          models.AssetType.name.ilike(like),
+                          models.AssetType.code.ilike(like),
+                          MatchParent.name.ilike(like),
+                          MatchParent.code.ilike(like),
+                      )
+                  )
+                  .all()
+            ]
+
+            text_match = devices_search_text().ilike(like)
+            if type_ids:
+                query = query.filter(or_(text_match, models.Device.asset_type_id.in_(type_ids)))
+            else:
+                query = query.filter(text_match)
+        else:
+            query = query.filter(
+                or_(
+                    models.Device.name.ilike(like),
+                    models.Device.uid.ilike(like),
+                    models.Device.barcode.ilike(like),
+                    models.Device.status.ilike(like),
+                    models.Device.notes.ilike(like),
+                    models.AssetType.name.ilike(like),
+                    models.AssetType.code.ilike(like),
+                    Parent.name.ilike(like),
+                    Parent.code.ilike(like),
+                )
             )
-        )
 
     # -------------------------
     # Filtro Name
@@ -907,20 +864,16 @@ def delete_device(device_id):
 def export_devices():
     fmt = request.args.get("format", "csv").lower()
 
-    db = SessionLocal()
-    try:
-        query = build_devices_query(db, request.args)
-
-        # ✅ Exporta TODO lo filtrado (sin paginación)
-        devices = (
-            query.options(
+    # ✅ Exporta TODO lo filtrado (sin paginación), en streaming por chunks
+    devices = iter_query(
+        lambda db: (
+            build_devices_query(db, request.args)
+            .options(
                 joinedload(models.Device.asset_type).joinedload(models.AssetType.parent)
             )
             .order_by(models.Device.id.asc())
-            .all()
         )
-    finally:
-        db.close()
+    )
 
     if fmt == "csv":
         return _export_devices_csv(devices)
@@ -943,11 +896,10 @@ def _device_rows(devices):
 
     (Sin ID de BD, sin UID, sin Barcode)
     """
-    rows = []
 
     # Header
     header = ["#", "Name", "Root type", "Subtype", "Status", "Notes"]
-    rows.append(header)
+    yield header
 
     for idx, d in enumerate(devices, start=1):
         root_name = ""
@@ -967,44 +919,15 @@ def _device_rows(devices):
             d.notes or "",
         ]
 
-        rows.append(row)
+        yield row
 
-    return rows
 
 def _export_devices_csv(devices):
-    output = StringIO()
-    writer = csv.writer(output)
-    for row in _device_rows(devices):
-        writer.writerow(row)
-
-    csv_data = output.getvalue()
-    output.close()
-
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=devices.csv"}
-    )
+    return stream_csv(_device_rows(devices), "devices.csv")
 
 
 def _export_devices_excel(devices):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Devices"
-
-    for row in _device_rows(devices):
-        ws.append(row)
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name="devices.xlsx"
-    )
+    return export_xlsx(_device_rows(devices), "devices.xlsx", "Devices")
 
 
 def _export_devices_pdf(devices):
@@ -1025,7 +948,7 @@ def _export_devices_pdf(devices):
     elements.append(title)
     elements.append(Spacer(1, 12))
 
-    data = _device_rows(devices)
+    data = list(_device_rows(devices))
     table = Table(data, repeatRows=1)
 
     table_style = TableStyle([
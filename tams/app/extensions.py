@@ -3,6 +3,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_bcrypt import Bcrypt
 
-db = SQLAlchemy()
+
+class SharedEngineSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy sin engine propio: el bind por defecto es app.db.engine,
+    el mismo que usa SessionLocal. Así hay UN pool por proceso en vez de dos.
+    """
+
+    def _make_engine(self, bind_key, options, app):
+        if bind_key is None:
+            from .db import engine  # import tardío: app.db importa este módulo
+            return engine
+        return super()._make_engine(bind_key, options, app)
+
+
+db = SharedEngineSQLAlchemy()
 login_manager = LoginManager()
 bcrypt = Bcrypt()
@@ -8,8 +8,8 @@ from app.scripts.get_overdue_assignments import (
     get_overdue_course_alerts,
     get_cards_vs_trainees_alerts,
 )
-from app.models import User, Device, Course, Assignment, Movements, Notification
-from sqlalchemy import func, case, or_
+from app.models import Device, Course, Movements, Notification
+from sqlalchemy import func
 from sqlalchemy.orm import joinedload
 import app.models as models
 from app.scripts.alerts_service import get_alerts_for_user, build_alerts_summary
@@ -17,6 +17,9 @@ from app.scripts.alert_filters import reason_counts_for_calendar
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
 from app.notifications.service import get_itc_pickup_notifications
+from app.scripts.request_globals import lazy_global
+from app.scripts.device_resolver import resolve_devices
+from app.scripts.dashboard_metrics import get_dashboard_alerts, get_dashboard_metrics
 
 PICKUP_NOTIFICATION_TYPES = (
     "pickup_needed",
@@ -49,34 +52,38 @@ def _notif_scope_for_user():
     return "__NONE__"
 
 
-@bp.app_context_processor
-def inject_notifications_badge():
+def _notifications_unread_count(db):
     """
-    Inyecta notifications_unread_count en TODOS los templates.
     Unread = status NO cerrado (no done/dismissed) y read_at IS NULL.
     """
     if not current_user.is_authenticated:
-        return dict(notifications_unread_count=0)
+        return 0
 
-    db = SessionLocal()
-    try:
-        scope = _notif_scope_for_user()
-        if scope == "__NONE__":
-            return dict(notifications_unread_count=0)
-
-        q = db.query(func.count(models.Notification.id)).filter(
-            models.Notification.active.is_(True),
-            models.Notification.read_at.is_(None),
-            models.Notification.status.notin_(["done", "dismissed"]),
-        )
+    scope = _notif_scope_for_user()
+    if scope == "__NONE__":
+        return 0
 
-        if scope is not None:
-            q = q.filter(models.Notification.department_target == scope)
+    q = db.query(func.count(models.Notification.id)).filter(
+        models.Notification.active.is_(True),
+        models.Notification.read_at.is_(None),
+        models.Notification.status.notin_(["done", "dismissed"]),
+    )
+
+    if scope is not None:
+        q = q.filter(models.Notification.department_target == scope)
+
+    return q.scalar() or 0
 
-        count = q.scalar() or 0
-        return dict(notifications_unread_count=count)
-    finally:
-        db.close()
+
+@bp.app_context_processor
+def inject_notifications_badge():
+    """
+    Inyecta notifications_unread_count en TODOS los templates (perezoso:
+    sólo se cuenta si la plantilla lo lee).
+    """
+    return dict(
+        notifications_unread_count=lazy_global("notifications_unread_count", _notifications_unread_count)
+    )
 
 def _alerts_scope_for_user():
     dept = (getattr(current_user, "department", "") or "").strip()
@@ -98,41 +105,43 @@ def _alerts_scope_for_user():
     return None
 
 
+def _sidebar_alerts_summary(db):
+    """
+    Summary para pintar "hoy": SOLO cuenta reasons open (o snooze vencido).
+    """
+    now_utc = datetime.now(timezone.utc)
+
+    alerts = get_alerts_for_user(db, current_user, include_hidden=True, read_only=True) or []
+
+    summary = {"notice": 0, "warning": 0, "critical": 0}
+
+    for a in alerts:
+        a_sev = (a.get("severity") or "notice").strip().lower()
+        reasons = a.get("reasons") or []
+
+        if reasons:
+            for r in reasons:
+                if not reason_counts_for_calendar(r, now_utc):
+                    continue
+                sev = (r.get("severity") or a_sev or "notice").strip().lower()
+                if sev not in summary:
+                    sev = "notice"
+                summary[sev] += 1
+        else:
+            # alertas sin reasons: cuentan como 1
+            sev = a_sev if a_sev in summary else "notice"
+            summary[sev] += 1
+
+    return summary
+
+
 @bp.app_context_processor
 def inject_alerts_summary():
     """
     Hace que 'alerts_summary' esté disponible en TODOS los templates,
-    para que el badge del sidebar funcione siempre.
+    para que el badge del sidebar funcione siempre (perezoso).
     """
-    db = SessionLocal()
-    try:
-        now_utc = datetime.now(timezone.utc)
-
-        alerts = get_alerts_for_user(db, current_user, include_hidden=True) or []
-
-        # Summary para pintar "hoy": SOLO cuenta reasons open (o snooze vencido)
-        summary = {"notice": 0, "warning": 0, "critical": 0}
-
-        for a in alerts:
-            a_sev = (a.get("severity") or "notice").strip().lower()
-            reasons = a.get("reasons") or []
-
-            if reasons:
-                for r in reasons:
-                    if not reason_counts_for_calendar(r, now_utc):
-                        continue
-                    sev = (r.get("severity") or a_sev or "notice").strip().lower()
-                    if sev not in summary:
-                        sev = "notice"
-                    summary[sev] += 1
-            else:
-                # alertas sin reasons: cuentan como 1
-                sev = a_sev if a_sev in summary else "notice"
-                summary[sev] += 1
-
-        return dict(alerts_summary=summary)
-    finally:
-        db.close()
+    return dict(alerts_summary=lazy_global("alerts_summary", _sidebar_alerts_summary))
 
 @bp.route("/")
 @login_required
@@ -140,19 +149,11 @@ def index():
     db = SessionLocal()
     try:
         # =====================================================
-        # Métricas rápidas
+        # Métricas (una sentencia, cacheadas por scope) y alertas
+        # (una pasada de motores para las dos vistas)
         # =====================================================
-        total_users = db.query(func.count(User.id)).scalar() or 0
-        total_devices = db.query(func.count(Device.id)).scalar() or 0
-        total_courses = db.query(func.count(Course.id)).scalar() or 0
-        total_assignments = db.query(func.count(Assignment.id)).scalar() or 0
-        total_movements = db.query(func.count(Movements.id)).scalar() or 0
-
-        total_active_cards = (
-            db.query(func.count(Assignment.id))
-              .filter(Assignment.released_at.is_(None))
-              .scalar()
-        ) or 0
+        metrics = get_dashboard_metrics(current_user)
+        alerts, alerts_summary = get_dashboard_alerts(db, current_user)
 
         # =====================================================
         # Contexto usuario
@@ -162,201 +163,7 @@ def index():
 
         is_admin = ("admin" in actor_role)
         is_itc = (actor_dept == "itc support") or actor_role.startswith("itc")
-        is_tco = (actor_dept == "tco")
-
-        # =====================================================
-        # Devices stats (basados en AssetTypes)
-        # =====================================================
-        from app.models import AssetType
-
-        # Cargar todos los asset types activos
-        all_types = (
-            db.query(AssetType)
-              .filter(AssetType.active.is_(True))
-              .order_by(AssetType.sort_order.asc(), AssetType.code.asc())
-              .all()
-        )
-
-        by_id = {t.id: t for t in all_types}
-
-        # -----------------------------------------------------
-        # Utilidades de jerarquía
-        # -----------------------------------------------------
-        def descendants_ids(root: AssetType) -> set[int]:
-            if not root:
-                return set()
-            out = set()
-            queue = [root]
-            while queue:
-                cur = queue.pop(0)
-                if cur.id in out:
-                    continue
-                out.add(cur.id)
-                for ch in getattr(cur, "children", []) or []:
-                    if getattr(ch, "active", True):
-                        queue.append(ch)
-            return out
-
-        def has_ancestor_code(asset_type_id: int | None, code_upper: str) -> bool:
-            if not asset_type_id:
-                return False
-            seen = set()
-            cur = by_id.get(asset_type_id)
-            target = code_upper.upper()
-            while cur and cur.id not in seen:
-                seen.add(cur.id)
-                if (cur.code or "").upper() == target:
-                    return True
-                pid = cur.parent_id
-                cur = by_id.get(pid) if pid else None
-            return False
-
-        # -----------------------------------------------------
-        # Familia CARD
-        # -----------------------------------------------------
-        card_root = next(
-            (t for t in all_types if (t.code or "").upper() == "CARD"),
-            None
-        )
-        card_family_ids = descendants_ids(card_root)
 
-        # =====================================================
-        # Tipos visibles según perfil
-        # =====================================================
-        if is_admin:
-            # Admin: SOLO hijos (todos los árboles)
-            visible_types = [t for t in all_types if t.parent_id is not None]
-
-        elif is_tco:
-            # TCO: SOLO hijos de CARD
-            visible_types = [
-                t for t in all_types
-                if t.parent_id is not None and t.id in card_family_ids
-            ]
-
-        elif is_itc:
-            # ITC: SOLO hijos que NO sean de CARD
-            visible_types = [
-                t for t in all_types
-                if t.parent_id is not None and t.id not in card_family_ids
-            ]
-
-        else:
-            # Otros: solo hijos
-            visible_types = [t for t in all_types if t.parent_id is not None]
-
-        # -----------------------------------------------------
-        # Regla extra: excluir TODO lo que cuelgue de USB
-        # -----------------------------------------------------
-        visible_types = [
-            t for t in visible_types
-            if not has_ancestor_code(t.id, "USB")
-        ]
-
-        # =====================================================
-        # Conteo de devices por asset_type_id
-        # =====================================================
-        counts_by_asset_type_id = {
-            r.asset_type_id: {
-                "total": int(r.total or 0),
-                "assigned": int(r.assigned or 0),
-            }
-            for r in (
-                db.query(
-                    Device.asset_type_id.label("asset_type_id"),
-                    func.count(Device.id).label("total"),
-                    func.sum(case((Device.status == "assigned", 1), else_=0)).label("assigned"),
-                )
-                .filter(Device.active.is_(True))
-                .group_by(Device.asset_type_id)
-                .all()
-            )
-        }
-
-        # =====================================================
-        # Legacy devices (sin asset_type_id)
-        # =====================================================
-        legacy_to_asset_code = {
-            "vending": "CARD_VENDING",
-            "canteen": "CARD_CANTEEN",
-            "instructor": "CARD_INSTRUCTOR",
-            "guest": "CARD_GUEST",
-        }
-
-        asset_id_by_code = {
-            (t.code or "").upper(): t.id for t in all_types
-        }
-
-        legacy_counts = (
-            db.query(
-                func.lower(Device.type).label("legacy_type"),
-                func.count(Device.id).label("total"),
-                func.sum(case((Device.status == "assigned", 1), else_=0)).label("assigned"),
-            )
-            .filter(Device.active.is_(True))
-            .filter(Device.asset_type_id.is_(None))
-            .group_by(func.lower(Device.type))
-            .all()
-        )
-
-        for row in legacy_counts:
-            legacy = (row.legacy_type or "").lower()
-            target_code = legacy_to_asset_code.get(legacy)
-            if not target_code:
-                continue
-
-            target_id = asset_id_by_code.get(target_code.upper())
-            if not target_id:
-                continue
-
-            slot = counts_by_asset_type_id.setdefault(
-                target_id, {"total": 0, "assigned": 0}
-            )
-            slot["total"] += int(row.total or 0)
-            slot["assigned"] += int(row.assigned or 0)
-
-        # =====================================================
-        # Construir device_stats (lo que consume el template)
-        # =====================================================
-        device_stats = []
-        for at in visible_types:
-            code = (at.code or "").lower()
-            counts = counts_by_asset_type_id.get(at.id, {"total": 0, "assigned": 0})
-
-            total = counts["total"]
-            assigned = counts["assigned"]
-            ratio = (assigned / total * 100) if total else 0
-
-            device_stats.append({
-                "type": code,
-                "total": total,
-                "assigned": assigned,
-                "ratio": ratio,
-            })
-
-        # =====================================================
-        # Alertas
-        # =====================================================
-        alerts = get_alerts_for_user(db, current_user, include_hidden=False) or []
-
-        now_utc = datetime.now(timezone.utc)
-        alerts_all = get_alerts_for_user(db, current_user, include_hidden=True) or []
-        alerts_summary = {"notice": 0, "warning": 0, "critical": 0}
-
-        for a in alerts_all:
-            a_sev = (a.get("severity") or "notice").strip().lower()
-            reasons = a.get("reasons") or []
-            if reasons:
-                for r in reasons:
-                    if not reason_counts_for_calendar(r, now_utc):
-                        continue
-                    sev = (r.get("severity") or a_sev or "notice").strip().lower()
-                    if sev not in alerts_summary:
-                        sev = "notice"
-                    alerts_summary[sev] += 1
-            else:
-                sev = a_sev if a_sev in alerts_summary else "notice"
-                alerts_summary[sev] += 1
         # =====================================================
         # ITC: aviso rápido de "pickup needed" (si existe)
         # =====================================================
@@ -403,13 +210,13 @@ def index():
         # =====================================================
         return render_template(
             "index.html",
-            total_users=total_users,
-            total_devices=total_devices,
-            total_courses=total_courses,
-            total_assignments=total_assignments,
-            total_movements=total_movements,
-            total_active_cards=total_active_cards,
-            device_stats=device_stats,
+            total_users=metrics["total_users"],
+            total_devices=metrics["total_devices"],
+            total_courses=metrics["total_courses"],
+            total_assignments=metrics["total_assignments"],
+            total_movements=metrics["total_movements"],
+            total_active_cards=metrics["total_active_cards"],
+            device_stats=metrics["device_stats"],
             alerts=alerts,
             alerts_summary=alerts_summary,
             pickup_cards=pickup_cards,
@@ -514,33 +321,32 @@ def filter_alerts(alerts: list[dict], severity=None, type_q=None, q=None, respon
     return out
 
 
-@bp.app_context_processor
-def inject_notifications_summary():
-    db = SessionLocal()
-    try:
-        if not current_user.is_authenticated:
-            return dict(notifications_summary={"unread": 0})
+def _notifications_summary(db):
+    if not current_user.is_authenticated:
+        return {"unread": 0}
 
-        role = (getattr(current_user, "role", "") or "").strip().lower()
-        dept = (getattr(current_user, "department", "") or "").strip()
+    role = (getattr(current_user, "role", "") or "").strip().lower()
+    dept = (getattr(current_user, "department", "") or "").strip()
 
-        q = (
-            db.query(models.Notification.id)
-              .filter(models.Notification.active.is_(True))
-              .filter(models.Notification.read_at.is_(None))
-              .filter(models.Notification.status == "open")
-        )
+    q = (
+        db.query(func.count(models.Notification.id))
+          .filter(models.Notification.active.is_(True))
+          .filter(models.Notification.read_at.is_(None))
+          .filter(models.Notification.status == "open")
+    )
 
-        # admin ve todo, el resto solo su dept
-        if "admin" not in role:
-            if not dept:
-                return dict(notifications_summary={"unread": 0})
-            q = q.filter(models.Notification.department_target == dept)
+    # admin ve todo, el resto solo su dept
+    if "admin" not in role:
+        if not dept:
+            return {"unread": 0}
+        q = q.filter(models.Notification.department_target == dept)
 
-        unread = q.count()
-        return dict(notifications_summary={"unread": unread})
-    finally:
-        db.close()
+    return {"unread": q.scalar() or 0}
+
+
+@bp.app_context_processor
+def inject_notifications_summary():
+    return dict(notifications_summary=lazy_global("notifications_summary", _notifications_summary))
 
 @bp.route("/dashboard/pickup/<int:notif_id>/done", methods=["POST"])
 @login_required
@@ -711,37 +517,34 @@ def dashboard_itc_support_search():
             })
 
         if search_type == "device":
-            devices = (
-                db.query(Device)
-                .filter(Device.active.is_(True))
-                .filter(
-                    or_(
-                        func.lower(func.coalesce(Device.uid, "")) == q_lower,
-                        func.lower(func.coalesce(Device.barcode, "")) == q_lower,
-                        func.lower(func.coalesce(Device.name, "")) == q_lower,
-                    )
+            # UID / barcode exacto (normalizado, indexado) con su assignment vivo
+            resolved = resolve_devices(db, [q], active_only=True)
+            r = next(iter(resolved.values()), None)
+
+            if not r:
+                # último recurso: nombre exacto (sin distinguir mayúsculas)
+                named = (
+                    db.query(Device.uid)
+                    .filter(Device.active.is_(True))
+                    .filter(func.lower(Device.name) == q_lower)
+                    .all()
                 )
-                .all()
-            )
+                resolved = resolve_devices(
+                    db, [u for (u,) in named], fields=("uid",), active_only=True
+                )
+                # si hay varios con el mismo nombre, el que tenga assignment vivo más reciente
+                live = [x for x in resolved.values() if x.assignment]
+                live.sort(key=lambda x: x.assignment.assigned_at, reverse=True)
+                r = live[0] if live else next(iter(resolved.values()), None)
 
-            if not devices:
+            if not r:
                 return jsonify({
                     "ok": False,
                     "level": "danger",
                     "message": f"Equipment '{q}' was not found."
                 }), 404
 
-            device_ids = [d.id for d in devices]
-
-            assignment = (
-                db.query(Assignment)
-                .join(Course, Course.id == Assignment.course_id)
-                .filter(Assignment.device_id.in_(device_ids))
-                .filter(Assignment.released_at.is_(None))
-                .filter(Assignment.status.in_(["active", "overdue_1", "overdue_2"]))
-                .order_by(Assignment.assigned_at.desc())
-                .first()
-            )
+            assignment = r.assignment
 
             if not assignment:
                 return jsonify({
@@ -750,7 +553,7 @@ def dashboard_itc_support_search():
                     "message": f"Equipment '{q}' exists, but it is not linked to any active course."
                 })
 
-            course = assignment.course
+            course = r.course
 
             return jsonify({
                 "ok": True,
@@ -12,9 +12,10 @@ from sqlalchemy import (
     ForeignKey,
     Text,
     text,
+    Computed,
 )
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from sqlalchemy import text
 from sqlalchemy.sql.sqltypes import Boolean
@@ -79,6 +80,20 @@ class Device(db.Model):
     # NUEVO: para equipos que van por barcode (laptop/usb)
     barcode = db.Column(db.String(128), nullable=True, unique=False)
 
+    # Identificadores normalizados (sólo A-Z0-9, mayúsculas) para los lectores.
+    # Columnas generadas por PostgreSQL: misma regla que
+    # app/scripts/device_resolver.normalize_identifier(). Ver sql/004.
+    # deferred: una BD sin sql/004 no las tiene, y ninguna query normal de
+    # Device debe pedirlas. Para buscar, device_resolver.identifier_column().
+    uid_norm = deferred(db.Column(
+        db.String(64),
+        Computed("NULLIF(regexp_replace(upper(uid), '[^A-Z0-9]', '', 'g'), '')", persisted=True),
+    ))
+    barcode_norm = deferred(db.Column(
+        db.String(128),
+        Computed("NULLIF(regexp_replace(upper(barcode), '[^A-Z0-9]', '', 'g'), '')", persisted=True),
+    ))
+
     asset_type = db.relationship("AssetType", back_populates="devices")
 
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -91,6 +106,19 @@ class Device(db.Model):
 
     assignments = relationship("Assignment", back_populates="device")
 
+    # Sin RETURNING de valores del servidor en INSERT/UPDATE: incluiría
+    # uid_norm / barcode_norm aunque sean deferred (y no existen sin sql/004).
+    # Los server_default (active) se cargan al leerlos.
+    __mapper_args__ = {"eager_defaults": False}
+
+    __table_args__ = (
+        db.Index("ux_devices_uid_norm", "uid_norm", unique=True),
+        db.Index(
+            "ux_devices_barcode_norm", "barcode_norm", unique=True,
+            postgresql_where=text("barcode_norm IS NOT NULL"),
+        ),
+    )
+
     def __repr__(self):
         return (
             f"<Device id={self.id} uid={self.uid} "
@@ -118,8 +146,8 @@ class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     course = db.Column(db.String(120), nullable=False)
 
-    start_date = db.Column(Date, nullable=True)
-    end_date = db.Column(Date, nullable=True)
+    start_date = db.Column(Date, nullable=True, index=True)
+    end_date = db.Column(Date, nullable=True, index=True)
 
     # Estado negocio (TCO)
     status_tco = db.Column(db.String(20), nullable=True)
@@ -237,6 +265,11 @@ class Movements(db.Model):
 
     user = relationship("User", back_populates="movements")
 
+    # Paginación por cursor (created_at, id) en movements.index
+    __table_args__ = (
+        db.Index("ix_movements_created_at_id", created_at.desc(), id.desc()),
+    )
+
     def __repr__(self):
         return (
             f"<Movement id={self.id} user_id={self.user_id} "
@@ -262,6 +295,14 @@ class Assignment(db.Model):
     # Relaciones
     device = relationship("Device", back_populates="assignments")
     course = relationship("Course", back_populates="assignments")
+
+    __table_args__ = (
+        # assignment vivo / último assignment de un device (device_resolver)
+        db.Index("ix_assignments_device_assigned_at", "device_id", assigned_at.desc()),
+        # detalle de curso: vivos (released_at NULL) + devueltos (course_detail)
+        db.Index("ix_assignments_course_released_at", "course_id", "released_at"),
+    )
+
     is_temporary = db.Column(db.Boolean, nullable=False, default=False, server_default="false")
     # usuario que creó el assignment
     creator = relationship(
@@ -1,8 +1,11 @@
+import base64
+import os
+import time
+from datetime import datetime
+
 from flask import render_template, request, redirect, url_for, flash, send_file, Response
 from flask_login import login_required, current_user
 from io import BytesIO
-import csv  # solo si luego quieres CSV
-from openpyxl import Workbook  # solo si quieres Excel
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -12,11 +15,12 @@ from math import ceil
 from flask import Blueprint, render_template, request
 from flask_login import login_required
 from sqlalchemy.orm import joinedload
-from sqlalchemy import or_, cast, String
+from sqlalchemy import or_, cast, String, text, tuple_
 from . import bp
 from app.db import SessionLocal
+from app.scripts.exports import iter_query, stream_csv, export_xlsx
+from app.scripts.text_search import movements_search_text, search_available
 from app.models import Movements, User
-from io import StringIO, BytesIO
 from flask import render_template, request, redirect, url_for, flash, send_file, Response, abort
 
 def build_movements_query(db, args):
@@ -38,26 +42,38 @@ def build_movements_query(db, args):
     query = (
         db.query(Movements)
         .options(joinedload(Movements.user))
-        .order_by(Movements.created_at.desc())
+        .order_by(Movements.created_at.desc(), Movements.id.desc())
     )
 
     if q:
         term = f"%{q}%"
-        query = query.filter(
-            or_(
+
+        # users es pequeña: resolvemos los ids antes para que el OR sea
+        # "índice trigram OR user_id IN (...)" y no un EXISTS por fila
+        user_ids = [
+            uid for (uid,) in db.query(User.id).filter(
+                or_(
+                    User.username.ilike(term),
+                    User.email.ilike(term),
+                )
+            ).all()
+        ]
+
+        if search_available(db):
+            text_match = movements_search_text().ilike(term)
+        else:
+            text_match = or_(
                 Movements.action.ilike(term),
                 Movements.entity_type.ilike(term),
                 Movements.description.ilike(term),
                 Movements.user_agent.ilike(term),
                 cast(Movements.entity_id, String).ilike(term),
-                Movements.user.has(
-                    or_(
-                        User.username.ilike(term),
-                        User.email.ilike(term),
-                    )
-                ),
             )
-        )
+
+        if user_ids:
+            query = query.filter(or_(text_match, Movements.user_id.in_(user_ids)))
+        else:
+            query = query.filter(text_match)
 
     if f_user:
         term = f"%{f_user}%"
@@ -103,6 +119,128 @@ def build_movements_query(db, args):
     return query
 
 
+# ===========================
+#   KEYSET PAGINATION + TOTAL
+# ===========================
+# El listado se pagina por cursor (created_at, id) en vez de OFFSET:
+#   ?after=<cursor>  -> página siguiente (más antiguos)
+#   ?before=<cursor> -> página anterior (más recientes)
+# "page" se mantiene sólo como número de página para pintar; si llega un
+# page>1 sin cursor (enlaces antiguos) se sigue usando OFFSET.
+
+MOVEMENTS_COUNT_TTL_SECONDS = int(os.getenv("TAMS_MOVEMENTS_COUNT_TTL", "60"))
+MOVEMENTS_ACTIONS_TTL_SECONDS = 300
+# Por encima de esto, sin filtros, el total sale de las estadísticas de PG
+MOVEMENTS_ESTIMATE_MIN_ROWS = 100_000
+
+_FILTER_KEYS = ("q", "user", "action", "entity_type", "description", "success", "date_from", "date_to")
+
+_count_cache: dict[tuple, tuple[float, int]] = {}
+_actions_cache: list = []  # [(computed_at, actions)]
+
+
+def _encode_cursor(m) -> str:
+    raw = f"{m.created_at.isoformat()}|{m.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(raw: str | None):
+    if not raw:
+        return None
+    try:
+        padded = raw + "=" * (-len(raw) % 4)
+        created_at_s, id_s = base64.urlsafe_b64decode(padded).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(created_at_s), int(id_s)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _keyset_page_query(query, args, per_page: int, extra: int = 0):
+    """
+    Aplica cursor/orden/límite a build_movements_query().
+    Devuelve (query, direction) con direction "after" | "before" | None.
+    En "before" las filas salen en orden ASC: hay que darles la vuelta.
+    """
+    key_cols = tuple_(Movements.created_at, Movements.id)
+
+    before = _decode_cursor(args.get("before"))
+    after = _decode_cursor(args.get("after"))
+
+    if before:
+        query = (
+            query.filter(key_cols > tuple_(*before))
+            .order_by(None)
+            .order_by(Movements.created_at.asc(), Movements.id.asc())
+        )
+        return query.limit(per_page + extra), "before"
+
+    if after:
+        query = query.filter(key_cols < tuple_(*after))
+        return query.limit(per_page + extra), "after"
+
+    page = max(args.get("page", 1, type=int) or 1, 1)
+    if page > 1:
+        query = query.offset((page - 1) * per_page)
+    return query.limit(per_page + extra), None
+
+
+def _estimated_movements_rows(db) -> int:
+    """
+    Estimación barata (pg_class.reltuples), sumando particiones si las hay.
+    """
+    return int(
+        db.execute(
+            text(
+                """
+                SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint
+                FROM pg_class c
+                WHERE c.oid = 'movements'::regclass
+                   OR c.oid IN (
+                       SELECT inhrelid FROM pg_inherits WHERE inhparent = 'movements'::regclass
+                   )
+                """
+            )
+        ).scalar()
+        or 0
+    )
+
+
+def _movements_total(db, args, query):
+    """
+    Total para la cabecera: (total, is_estimate).
+    - sin filtros y tabla grande -> estimación de PG
+    - resto -> COUNT exacto cacheado TAMS_MOVEMENTS_COUNT_TTL segundos
+    """
+    key = tuple((k, (args.get(k) or "").strip()) for k in _FILTER_KEYS)
+
+    if not any(v for _, v in key):
+        estimate = _estimated_movements_rows(db)
+        if estimate >= MOVEMENTS_ESTIMATE_MIN_ROWS:
+            return estimate, True
+
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and now - cached[0] <= MOVEMENTS_COUNT_TTL_SECONDS:
+        return cached[1], False
+
+    total = query.order_by(None).count()
+
+    if len(_count_cache) > 256:
+        _count_cache.clear()
+    _count_cache[key] = (now, total)
+    return total, False
+
+
+def _distinct_actions(db) -> list[str]:
+    now = time.monotonic()
+    if _actions_cache and now - _actions_cache[0][0] <= MOVEMENTS_ACTIONS_TTL_SECONDS:
+        return _actions_cache[0][1]
+
+    actions = [r[0] for r in db.query(Movements.action).distinct().order_by(Movements.action.asc()).all()]
+    _actions_cache[:] = [(now, actions)]
+    return actions
+
+
 @bp.route("/", methods=["GET"])
 @login_required
 def index():
@@ -112,7 +250,7 @@ def index():
     q = (request.args.get("q") or "").strip()
 
     # Pagination
-    page = request.args.get("page", 1, type=int)
+    page = max(request.args.get("page", 1, type=int) or 1, 1)
     per_page = request.args.get("per_page", 20, type=int)
 
     # Column filters (para mantenerlos en el template)
@@ -130,14 +268,19 @@ def index():
     try:
         query = build_movements_query(db, request.args)
 
-        total = query.count()
+        page_query, direction = _keyset_page_query(query, request.args, per_page, extra=1)
+        movements = page_query.all()
 
-        movements = (
-            query
-            .offset((page - 1) * per_page)
-            .limit(per_page)
-            .all()
-        )
+        has_more = len(movements) > per_page
+        movements = movements[:per_page]
+
+        if direction == "before":
+            movements.reverse()
+            has_prev = has_more
+            has_next = True
+        else:
+            has_prev = direction == "after" or page > 1
+            has_next = has_more
 
         # Si hay parámetro export → devolvemos fichero en vez de HTML
         if export_fmt:
@@ -151,20 +294,24 @@ def index():
                 return Response("Unsupported format", status=400)
 
         # Modo normal: HTML
-        has_prev = page > 1
-        has_next = page * per_page < total
+        total, total_is_estimate = _movements_total(db, request.args, query)
 
-        actions = [r[0] for r in db.query(Movements.action).distinct().order_by(Movements.action.asc()).all()]
+        actions = _distinct_actions(db)
 
         return render_template(
             "movements/index.html",
             movements=movements,
             total=total,
+            total_is_estimate=total_is_estimate,
             q=q,
             page=page,
             per_page=per_page,
             has_prev=has_prev,
             has_next=has_next,
+            prev_cursor=_encode_cursor(movements[0]) if movements else None,
+            next_cursor=_encode_cursor(movements[-1]) if movements else None,
+            cursor_after=request.args.get("after") or None,
+            cursor_before=request.args.get("before") or None,
             # filters
             filter_user=f_user,
             filter_action=f_action,
@@ -179,71 +326,28 @@ def index():
     finally:
         db.close()
 
-def _movement_rows(movements):
-    """
-    Filas para export: cabecera + datos.
-    """
-    rows = []
-    # Cabecera
-    rows.append([
-        "ID",
-        "Date",
-        "User",
-        "Action",
-        "Entity type",
-        "Entity ID",
-        "Success",
-        "Description",
-    ])
-
-    for m in movements:
-        if m.user:
-            user_label = m.user.username or m.user.email or ""
-        else:
-            user_label = ""
-
-        date_str = m.created_at.strftime("%Y-%m-%d %H:%M") if m.created_at else ""
-        success_str = "Yes" if m.success else "No"
-
-        rows.append([
-            m.id,
-            date_str,
-            user_label,
-            m.action or "",
-            m.entity_type or "",
-            str(m.entity_id) if m.entity_id is not None else "",
-            success_str,
-            (m.description or "")[:120],
-        ])
-
-    return rows
-
 
 @bp.route("/export", methods=["GET"])
 @login_required
 def export_movements():
     """
     Exporta EXACTAMENTE los movements que el usuario está viendo:
-    mismos filtros + misma página.
+    mismos filtros + misma página (mismo cursor).
     Endpoint: movements.export_movements
     """
     fmt = (request.args.get("format") or "pdf").lower()
 
-    page = request.args.get("page", 1, type=int)
     per_page = request.args.get("per_page", 20, type=int)
 
-    db = SessionLocal()
-    try:
-        query = build_movements_query(db, request.args)
+    def build_page_query(db):
+        page_query, _ = _keyset_page_query(build_movements_query(db, request.args), request.args, per_page)
+        return page_query
 
-        movements = (
-            query
-            .offset((page - 1) * per_page)
-            .limit(per_page)
-            .all()
-        )
-    finally:
-        db.close()
+    movements = iter_query(build_page_query)
+
+    # página "anterior": viene en orden ASC (como mucho per_page filas)
+    if _decode_cursor(request.args.get("before")):
+        movements = list(movements)[::-1]
 
     if fmt == "pdf":
         return _export_movements_pdf(movements)
@@ -253,43 +357,51 @@ def export_movements():
         return _export_movements_excel(movements)
     else:
         return Response("Unsupported format", status=400)
-    
 
-def _export_movements_csv(movements):
-    output = StringIO()
-    writer = csv.writer(output)
 
-    for row in _movement_rows(movements):
-        writer.writerow(row)
+def _export_movements_csv(movements):
+    return stream_csv(_movement_rows(movements), "movements.csv")
 
-    csv_data = output.getvalue()
-    output.close()
 
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=movements.csv"},
-    )
+def _export_movements_excel(movements):
+    return export_xlsx(_movement_rows(movements), "movements.xlsx", "Movements")
 
 
-def _export_movements_excel(movements):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Movements"
+def _movement_rows(movements):
+    """
+    Filas para export: cabecera + datos.
+    """
+    # Cabecera
+    yield [
+        "ID",
+        "Date",
+        "User",
+        "Action",
+        "Entity type",
+        "Entity ID",
+        "Success",
+        "Description",
+    ]
 
-    for row in _movement_rows(movements):
-        ws.append(row)
+    for m in movements:
+        if m.user:
+            user_label = m.user.username or m.user.email or ""
+        else:
+            user_label = ""
 
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
+        date_str = m.created_at.strftime("%Y-%m-%d %H:%M") if m.created_at else ""
+        success_str = "Yes" if m.success else "No"
 
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name="movements.xlsx",
-    )
+        yield [
+            m.id,
+            date_str,
+            user_label,
+            m.action or "",
+            m.entity_type or "",
+            str(m.entity_id) if m.entity_id is not None else "",
+            success_str,
+            (m.description or "")[:120],
+        ]
 
 
 def _export_movements_pdf(movements):
@@ -311,7 +423,7 @@ def _export_movements_pdf(movements):
     elements.append(title)
     elements.append(Spacer(1, 12))
 
-    data = _movement_rows(movements)
+    data = list(_movement_rows(movements))
     table = Table(data, repeatRows=1)
 
     table_style = TableStyle([
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import Dict, List, Tuple
@@ -14,6 +15,9 @@ TERMINAL = {"ignored", "resolved"}
 
 VALID_STATUS = {"open", "acked", "snoozed", "ignored", "done"}
 
+# No re-marcar "seen" una alerta cuyo last_seen_at es más reciente que esto
+ALERT_SEEN_GRANULARITY_SECONDS = int(os.getenv("TAMS_ALERT_SEEN_GRANULARITY", "300"))
+
 def now_utc():
     return datetime.now(timezone.utc)
 
@@ -305,3 +309,112 @@ def resolve_missing_alerts(db, *, scope: str, course_id: int, active_keys: set[s
         },
         synchronize_session=False,
     )
+
+
+def record_seen_alerts(
+    db,
+    scope: str,
+    seen_pairs,
+    updated_by: str | None = None,
+    granularity_seconds: int = ALERT_SEEN_GRANULARITY_SECONDS,
+):
+    """
+    Versión set-based de upsert_seen_alert + resolve_missing_alerts para
+    todo un scope, en UNA sentencia:
+
+    - seen_pairs: iterable de (course_id, alert_key) que el motor genera ahora.
+    - INSERT de los que no existen (status=open).
+    - Los existentes sólo se tocan si estaban en 'done' (se reabren) o si su
+      last_seen_at es más viejo que granularity_seconds. Así occurrences
+      cuenta periodos en los que se ha visto, no polls.
+    - open/acked/snoozed del scope que ya no están en seen_pairs -> done.
+
+    Devuelve (filas_upsert, filas_reabiertas, filas_resueltas). No hace commit.
+    """
+    scope = _norm_scope(scope)
+    if not scope:
+        return (0, 0, 0)
+
+    pairs = sorted({
+        (int(cid), _norm_key(k))
+        for cid, k in (seen_pairs or ())
+        if cid and _norm_key(k)
+    })
+
+    ts = now_utc()
+
+    stmt = text("""
+        WITH seen AS (
+            SELECT s.course_id, s.alert_key
+            FROM unnest(
+                CAST(:course_ids AS integer[]),
+                CAST(:alert_keys AS varchar[])
+            ) AS s(course_id, alert_key)
+        ),
+        reopened AS (
+            -- snapshot previo a la sentencia: cuántas 'done' vamos a reabrir
+            SELECT 1
+            FROM alert_states AS st
+            JOIN seen ON seen.course_id = st.course_id AND seen.alert_key = st.alert_key
+            WHERE st.scope = :scope AND st.status = 'done'
+        ),
+        upserted AS (
+            INSERT INTO alert_states (
+                scope, course_id, alert_key,
+                status,
+                first_seen_at, last_seen_at,
+                occurrences,
+                updated_by, updated_at
+            )
+            SELECT
+                :scope, seen.course_id, seen.alert_key,
+                'open',
+                :ts, :ts,
+                1,
+                :updated_by, :ts
+            FROM seen
+            ON CONFLICT ON CONSTRAINT uq_alert_states_scope_course_key
+            DO UPDATE SET
+                last_seen_at = :ts,
+                updated_at  = :ts,
+                updated_by  = :updated_by,
+                occurrences = alert_states.occurrences + 1,
+                status = CASE
+                    WHEN alert_states.status = 'done' THEN 'open'
+                    ELSE alert_states.status
+                END
+            WHERE alert_states.status = 'done'
+               OR alert_states.last_seen_at < CAST(:ts AS timestamptz) - make_interval(secs => :granularity)
+            RETURNING 1
+        ),
+        resolved AS (
+            UPDATE alert_states AS st
+            SET status = 'done',
+                updated_at = :ts
+            WHERE st.scope = :scope
+              AND st.status IN ('open', 'acked', 'snoozed')
+              AND NOT EXISTS (
+                  SELECT 1 FROM seen
+                  WHERE seen.course_id = st.course_id
+                    AND seen.alert_key = st.alert_key
+              )
+            RETURNING 1
+        )
+        SELECT
+            (SELECT count(*) FROM upserted) AS upserted,
+            (SELECT count(*) FROM reopened) AS reopened,
+            (SELECT count(*) FROM resolved) AS resolved
+    """)
+
+    row = db.execute(stmt, {
+        "scope": scope,
+        "course_ids": [cid for cid, _k in pairs],
+        "alert_keys": [k for _cid, k in pairs],
+        "ts": ts,
+        "updated_by": updated_by,
+        "granularity": int(granularity_seconds or 0),
+    }).fetchone()
+
+    if not row:
+        return (0, 0, 0)
+    return (int(row[0] or 0), int(row[1] or 0), int(row[2] or 0))
@@ -0,0 +1,162 @@
+# app/scripts/alerts_cache.py
+"""
+Caché compartido de alertas por scope (admin / tco / itc).
+
+El resultado de los motores TCO/ITC sólo depende del scope y de los datos,
+no del usuario. Guardamos la pasada de los motores por scope y, derivadas de
+ella, las vistas (scope, include_hidden), cada una con la versión de datos
+con la que se calculó (ver data_version.py). Mientras la versión no cambie,
+todas las peticiones (context processors, /api/counters, calendario,
+dashboard...) reutilizan el mismo snapshot.
+
+Además hay una edad máxima, porque parte del resultado depende del reloj
+(date.today(), snoozes que vencen).
+
+Los snapshots NO llevan objetos ORM: los Course se copian a CourseSnapshot
+para que se puedan compartir entre peticiones/hilos sin sesión abierta.
+"""
+
+import os
+import threading
+import time
+
+from app.models import Course, User
+from app.scripts import data_version
+
+ALERT_SOURCE_TABLES = (
+    "courses",
+    "assignments",
+    "devices",
+    "course_asset_requirements",
+    "asset_types",
+    "alert_states",
+)
+
+ALERTS_CACHE_MAX_AGE_SECONDS = int(os.getenv("TAMS_ALERTS_CACHE_MAX_AGE", "60"))
+
+_lock = threading.Lock()
+_key_locks: dict[tuple, threading.Lock] = {}
+_snapshots: dict[tuple, tuple[int, float, object]] = {}  # (scope, variant) -> (ver, t, valor)
+
+
+class UserSnapshot:
+    """Copia mínima del responsable (lo que pintan las plantillas de alertas)."""
+
+    __slots__ = ("id", "username", "email", "name", "surname")
+
+    def __init__(self, user: User):
+        self.id = user.id
+        self.username = user.username
+        self.email = user.email
+        self.name = user.name
+        self.surname = user.surname
+
+
+class CourseSnapshot:
+    """Copia de solo lectura de un Course, desacoplada de la sesión."""
+
+    __slots__ = (
+        "id", "course", "name", "client", "trainees",
+        "start_date", "end_date", "status_tco", "status_itc",
+        "responsible_id", "responsible",
+    )
+
+    def __init__(self, course: Course, responsible: UserSnapshot | None = None):
+        self.id = course.id
+        self.course = course.course
+        self.name = course.name
+        self.client = course.client
+        self.trainees = course.trainees
+        self.start_date = course.start_date
+        self.end_date = course.end_date
+        self.status_tco = course.status_tco
+        self.status_itc = course.status_itc
+        self.responsible_id = course.responsible_id
+        self.responsible = responsible
+
+    # misma regla que Course.auto_status (sólo usa fechas y status_tco)
+    auto_status = property(Course.auto_status.fget)
+
+    def __repr__(self):
+        return f"<CourseSnapshot id={self.id} course={self.course!r}>"
+
+
+def snapshot_courses(db, alerts: list[dict]) -> list[dict]:
+    """
+    Sustituye a["course"] por CourseSnapshot. Los responsables se cargan
+    en una sola query.
+    """
+    courses = [a.get("course") for a in alerts if isinstance(a.get("course"), Course)]
+
+    resp_ids = {c.responsible_id for c in courses if c.responsible_id}
+    responsibles = {}
+    if resp_ids:
+        for u in db.query(User).filter(User.id.in_(resp_ids)).all():
+            responsibles[u.id] = UserSnapshot(u)
+
+    by_id = {}
+    for c in courses:
+        if c.id not in by_id:
+            by_id[c.id] = CourseSnapshot(c, responsibles.get(c.responsible_id))
+
+    for a in alerts:
+        c = a.get("course")
+        if isinstance(c, Course):
+            a["course"] = by_id[c.id]
+
+    return alerts
+
+
+def _lock_for(key: tuple) -> threading.Lock:
+    with _lock:
+        lk = _key_locks.get(key)
+        if lk is None:
+            lk = _key_locks[key] = threading.Lock()
+        return lk
+
+
+def _fresh(entry, ver: int, now: float):
+    if not entry:
+        return None
+    entry_ver, computed_at, value = entry
+    if entry_ver != ver:
+        return None
+    if now - computed_at > ALERTS_CACHE_MAX_AGE_SECONDS:
+        return None
+    return value
+
+
+def get_or_compute(scope: str, variant, compute):
+    """
+    Devuelve el snapshot de (scope, variant). Si no está o está obsoleto, lo
+    calcula UNA vez (el resto de hilos esperan y lo reutilizan).
+
+    variant: "engine" (salida cruda de los motores) o include_hidden
+    (True / False) para las vistas derivadas de ella.
+
+    El valor es compartido: quien lo use debe copiar antes de modificar.
+    """
+    key = (scope, variant)
+
+    ver = data_version.version(ALERT_SOURCE_TABLES)
+    value = _fresh(_snapshots.get(key), ver, time.monotonic())
+
+    if value is None:
+        with _lock_for(key):
+            # otro hilo pudo calcularlo mientras esperábamos
+            ver = data_version.version(ALERT_SOURCE_TABLES)
+            value = _fresh(_snapshots.get(key), ver, time.monotonic())
+            if value is None:
+                value = compute()
+                _snapshots[key] = (ver, time.monotonic(), value)
+
+    return value
+
+
+def invalidate(scope: str | None = None):
+    with _lock:
+        if scope is None:
+            _snapshots.clear()
+            return
+        for key in [k for k in _snapshots if k[0] == scope]:
+            _snapshots.pop(key, None)
@@ -1,5 +1,6 @@
 from datetime import date, timedelta
-from sqlalchemy import func
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.orm import lazyload
 
 from app.models import Course, Assignment, Device, AssetType, CourseAssetRequirement
 
@@ -73,60 +74,48 @@ def _required_itc_by_course(db, course_ids: list[int]) -> dict[int, dict]:
     return out
 
 
-def _assigned_laptops_by_course(db, course_ids: list[int]) -> dict[int, int]:
-    if not course_ids:
-        return {}
-
-    rows = (
-        db.query(
-            Assignment.course_id,
-            func.count(Assignment.id).label("cnt"),
-        )
+def _live_itc_assignments_query(db, *columns):
+    """
+    Assignments vivos (released_at NULL, status active) de devices ITC.
+    """
+    return (
+        db.query(*columns)
         .join(Device, Device.id == Assignment.device_id)
         .join(AssetType, AssetType.id == Device.asset_type_id)
         .filter(
-            Assignment.course_id.in_(course_ids),
             Assignment.released_at.is_(None),
             func.lower(Assignment.status) == "active",
             AssetType.active.is_(True),
             AssetType.managed_by_department == ITC_DEPT,
-            AssetType.code == "LAPTOP",
         )
-        .group_by(Assignment.course_id)
-        .all()
     )
 
-    out = {cid: 0 for cid in course_ids}
-    for cid, cnt in rows:
-        out[cid] = int(cnt or 0)
-    return out
 
-def _assigned_pendrives_by_course(db, course_ids: list[int]) -> dict[int, int]:
+def _assigned_itc_by_course(db, course_ids: list[int]) -> dict[int, dict]:
+    """
+    assigned LAPTOP / PENDRIVE vivos por curso, en una sola query.
+    """
     if not course_ids:
         return {}
 
     rows = (
-        db.query(
+        _live_itc_assignments_query(
+            db,
             Assignment.course_id,
+            AssetType.code,
             func.count(Assignment.id).label("cnt"),
         )
-        .join(Device, Device.id == Assignment.device_id)
-        .join(AssetType, AssetType.id == Device.asset_type_id)
         .filter(
             Assignment.course_id.in_(course_ids),
-            Assignment.released_at.is_(None),
-            func.lower(Assignment.status) == "active",
-            AssetType.active.is_(True),
-            AssetType.managed_by_department == ITC_DEPT,
-            AssetType.code == "PENDRIVE",
+            AssetType.code.in_(ITC_CODES),
         )
-        .group_by(Assignment.course_id)
+        .group_by(Assignment.course_id, AssetType.code)
         .all()
     )
 
-    out = {cid: 0 for cid in course_ids}
-    for cid, cnt in rows:
-        out[cid] = int(cnt or 0)
+    out = {cid: {"LAPTOP": 0, "PENDRIVE": 0} for cid in course_ids}
+    for cid, code, cnt in rows:
+        out[cid][code] = int(cnt or 0)
     return out
 
 def _bump_sev(cur: str | None, new: str) -> str:
@@ -139,53 +128,68 @@ def get_itc_upcoming_and_overdue_alerts(db) -> list[dict]:
     today = date.today()
     max_date = today + timedelta(days=3)
 
-    # --- UPCOMING
-    upcoming = (
-        db.query(Course)
-        .filter(
-            Course.start_date.isnot(None),
-            Course.start_date >= today,
-            Course.start_date <= max_date,
-        )
-        .all()
+    # ------------------------------------------------------------
+    # UN solo scan de cursos, particionado por fechas:
+    # - upcoming: empieza en [hoy, hoy+3]
+    # - active:   empezado y sin terminar (incluye end_date None)
+    # - overdue:  terminado, pero SOLO si tiene laptops vivos asignados.
+    #   Se parte de los assignments vivos (trabajo pendiente), no del
+    #   histórico de cursos terminados.
+    # ------------------------------------------------------------
+    overdue_ids_sq = (
+        _live_itc_assignments_query(db, Assignment.course_id)
+        .filter(AssetType.code == "LAPTOP")
+        .distinct()
+        .subquery()
     )
 
-    ids = [c.id for c in upcoming]
-    required = _required_itc_by_course(db, ids)
-    assigned_laptops = _assigned_laptops_by_course(db, ids)
-    assigned_pendrives = _assigned_pendrives_by_course(db, ids)
-
-    # --- ACTIVE (curso activo hoy)
-    active = (
+    candidates = (
         db.query(Course)
+        .options(lazyload(Course.asset_requirements))
         .filter(
-            Course.start_date.isnot(None),
-            Course.start_date <= today,
-            func.coalesce(Course.end_date, today) >= today,  # incluye end_date None
+            or_(
+                and_(
+                    Course.start_date.isnot(None),
+                    Course.start_date >= today,
+                    Course.start_date <= max_date,
+                ),
+                and_(
+                    Course.start_date.isnot(None),
+                    Course.start_date <= today,
+                    func.coalesce(Course.end_date, today) >= today,  # incluye end_date None
+                ),
+                and_(
+                    Course.end_date.isnot(None),
+                    Course.end_date < today,
+                    Course.id.in_(select(overdue_ids_sq.c.course_id)),
+                ),
+            )
         )
         .all()
     )
-    active_ids = [c.id for c in active]
-    required_active = _required_itc_by_course(db, active_ids)
-    assigned_active_laptops = _assigned_laptops_by_course(db, active_ids)
-    assigned_active_pendrives = _assigned_pendrives_by_course(db, active_ids)
 
-    # --- OVERDUE base (curso acabado)
-    finished = (
-        db.query(Course)
-        .filter(Course.end_date.isnot(None), Course.end_date < today)
-        .all()
-    )
-    finished_ids = [c.id for c in finished]
-    required_finished = _required_itc_by_course(db, finished_ids)
+    upcoming = []
+    active = []
+    finished = []
+    for c in candidates:
+        sd = c.start_date
+        ed = c.end_date
+        if sd is not None and today <= sd <= max_date:
+            upcoming.append(c)
+        if sd is not None and sd <= today and (ed or today) >= today:
+            active.append(c)
+        if ed is not None and ed < today:
+            finished.append(c)
+
+    ids = [c.id for c in candidates]
+    required = _required_itc_by_course(db, ids)
+    assigned = _assigned_itc_by_course(db, ids)
 
-    # Solo cursos que requerían laptops
+    # Solo cursos acabados que requerían laptops
     laptop_courses = [
         c for c in finished
-        if required_finished.get(c.id, {}).get("LAPTOP", 0) > 0
+        if required.get(c.id, {}).get("LAPTOP", 0) > 0
     ]
-    laptop_ids = [c.id for c in laptop_courses]
-    alive = _assigned_laptops_by_course(db, laptop_ids)
 
     # UNA alerta por curso con reasons
     by_course: dict[int, dict] = {}
@@ -247,7 +251,7 @@ def get_itc_upcoming_and_overdue_alerts(db) -> list[dict]:
 
         # Laptops mismatch
         if req_l > 0:
-            asg_l = assigned_laptops.get(c.id, 0)
+            asg_l = assigned.get(c.id, {}).get("LAPTOP", 0)
 
             if asg_l != req_l and days_left in (3, 2, 1, 0):
                 sev_m = "critical" if days_left == 0 else sev
@@ -334,8 +338,8 @@ def get_itc_upcoming_and_overdue_alerts(db) -> list[dict]:
     # ACTIVE rules (primer 25% del curso) - EXCLUYE día 0
     # -------------------------
     for c in active:
-        req_l = required_active.get(c.id, {}).get("LAPTOP", 0)
-        req_p = required_active.get(c.id, {}).get("PENDRIVE", 0)
+        req_l = required.get(c.id, {}).get("LAPTOP", 0)
+        req_p = required.get(c.id, {}).get("PENDRIVE", 0)
 
         if req_l <= 0 and req_p <= 0:
             continue
@@ -359,7 +363,7 @@ def get_itc_upcoming_and_overdue_alerts(db) -> list[dict]:
 
         # Laptops mismatch activo
         if req_l > 0:
-            asg_l = assigned_active_laptops.get(c.id, 0)
+            asg_l = assigned.get(c.id, {}).get("LAPTOP", 0)
 
             if asg_l < req_l:
                 progress = (days_since_start + 1) / miss_window
@@ -402,7 +406,7 @@ def get_itc_upcoming_and_overdue_alerts(db) -> list[dict]:
     # OVERDUE laptops (curso acabado y assignments vivos)
     # -------------------------
     for c in laptop_courses:
-        alive_cnt = alive.get(c.id, 0)
+        alive_cnt = assigned.get(c.id, {}).get("LAPTOP", 0)
         if alive_cnt <= 0:
             continue
 
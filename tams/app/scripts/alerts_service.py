@@ -1,11 +1,22 @@
+import threading
+import time
+
 from flask import current_app
 from app.scripts.alerts_itc import get_itc_upcoming_and_overdue_alerts
 from app.scripts.alerts_tco import get_tco_alerts
-from app.scripts.alert_state_service import upsert_seen_alert, apply_alert_states, resolve_missing_alerts
-from app.models import AlertState, Course
+from app.scripts.alert_state_service import (
+    ALERT_SEEN_GRANULARITY_SECONDS,
+    apply_alert_states,
+    record_seen_alerts,
+)
+from app.scripts import alerts_cache, data_version
+from app.models import AlertState
 
 SEV_RANK = {"notice": 1, "warning": 2, "critical": 3}
 
+_seen_sync_lock = threading.Lock()
+_last_seen_sync: dict[str, tuple[int, float]] = {}
+
 def _aggregate_alerts_by_course_and_severity(alerts: list[dict]) -> list[dict]:
     """
     Agrega alertas por curso.
@@ -98,10 +109,9 @@ def _aggregate_alerts_by_course_and_severity(alerts: list[dict]) -> list[dict]:
     return out
 
 
-def get_alerts_for_user(db, user, include_hidden: bool = False):
+def _user_scope_flags(user) -> tuple[str, bool, bool, bool]:
     role = (getattr(user, "role", "") or "").strip().lower()
-    dept_raw = (getattr(user, "department", "") or "").strip()
-    dept = dept_raw.lower()
+    dept = (getattr(user, "department", "") or "").strip().lower()
 
     is_admin = ("admin" in role)
     is_tco = (dept == "tco") or dept.startswith("tco") or ("tco" in dept)
@@ -116,6 +126,74 @@ def get_alerts_for_user(db, user, include_hidden: bool = False):
     else:
         scope = "other"
 
+    return scope, is_admin, is_tco, is_itc
+
+
+def get_alerts_for_user(db, user, include_hidden: bool = False, read_only: bool = False):
+    """
+    Alertas visibles para el usuario.
+
+    El resultado sólo depende del scope (admin/tco/itc), así que se sirve
+    desde el snapshot compartido de alerts_cache; los motores sólo se
+    ejecutan cuando cambian los datos (o vence la edad máxima).
+
+    read_only=True: no escribe nada en alert_states. Es lo que deben usar
+    los GET de polling (contadores, context processors, calendario...).
+    Con read_only=False se registra el "seen"/auto-close, como mucho una
+    vez por granularidad (TAMS_ALERT_SEEN_GRANULARITY).
+    """
+    scope, is_admin, is_tco, is_itc = _user_scope_flags(user)
+    if scope == "other":
+        return []
+
+    # En tu DB existe updated_by (varchar)
+    updated_by = getattr(user, "email", None) or getattr(user, "username", None)
+
+    # Motores: UNA pasada por scope, compartida por las dos vistas
+    # (include_hidden False / True).
+    engine_alerts, seen_pairs = alerts_cache.get_or_compute(
+        scope,
+        "engine",
+        lambda: _run_engines_for_scope(
+            db,
+            scope,
+            is_admin=is_admin,
+            is_tco=is_tco,
+            is_itc=is_itc,
+            updated_by=updated_by,
+        ),
+    )
+
+    alerts = alerts_cache.get_or_compute(
+        scope,
+        bool(include_hidden),
+        lambda: _compute_alerts_for_scope(
+            db,
+            scope,
+            engine_alerts,
+            include_hidden=include_hidden,
+        ),
+    )
+
+    if not read_only:
+        _sync_seen_alerts(db, scope, seen_pairs, updated_by)
+
+    return [dict(a) for a in alerts]
+
+
+def _run_engines_for_scope(
+    db,
+    scope: str,
+    *,
+    is_admin: bool,
+    is_tco: bool,
+    is_itc: bool,
+    updated_by: str | None,
+):
+    """
+    Salida cruda de los motores TCO/ITC para el scope, con los cursos ya
+    copiados fuera de la sesión. Devuelve (alerts, seen_pairs).
+    """
     alerts_tco = []
     alerts_itc = []
 
@@ -134,13 +212,11 @@ def get_alerts_for_user(db, user, include_hidden: bool = False):
             alerts_itc = []
 
     current_app.logger.warning(
-        "GA: user=%s role=%r dept=%r admin=%s tco=%s itc=%s tco_n=%s itc_n=%s include_hidden=%s",
-        getattr(user, "email", None),
-        getattr(user, "role", None),
-        dept_raw,
+        "GA: computed by=%s scope=%s admin=%s tco=%s itc=%s tco_n=%s itc_n=%s",
+        updated_by,
+        scope,
         is_admin, is_tco, is_itc,
         len(alerts_tco), len(alerts_itc),
-        include_hidden,
     )
 
     if is_admin:
@@ -152,11 +228,27 @@ def get_alerts_for_user(db, user, include_hidden: bool = False):
     else:
         alerts = []
 
+    # (course_id, key) que el motor genera ahora: base del tracking "seen"
+    seen_pairs = _engine_reason_pairs(alerts)
+
+    # El resultado se comparte entre vistas/peticiones: sin objetos ORM
+    alerts = alerts_cache.snapshot_courses(db, alerts)
+
+    return alerts, seen_pairs
+
+
+def _compute_alerts_for_scope(db, scope: str, engine_alerts: list[dict], *, include_hidden: bool):
+    """
+    Vista de alertas (visible u "con ocultas") a partir de la pasada de
+    motores. engine_alerts es compartido: no se modifica.
+    """
+    alerts = list(engine_alerts)
+
     # ---------------------------------------------------------------------
     # ✅ CLAVE: si include_hidden=True, inyectar alertas persistidas en DB
     # (snoozed/ignored/ack) aunque el motor ya no las genere ahora.
     # ---------------------------------------------------------------------
-    if include_hidden and scope != "other":
+    if include_hidden:
         try:
             rows = (
                 db.query(AlertState)
@@ -187,16 +279,10 @@ def get_alerts_for_user(db, user, include_hidden: bool = False):
                 if (cid, key) in present:
                     continue
 
-                # cargar el curso (opcional, pero mejora la UX)
-                course_obj = None
-                try:
-                    course_obj = db.query(Course).get(cid)
-                except Exception:
-                    course_obj = None
-
                 alerts.append({
                     "course_id": cid,
-                    "course": course_obj,
+                    # AlertState.course es lazy="joined": ya viene en la query
+                    "course": st.course,
                     "severity": "notice",
                     "reasons": [{
                         "key": key,
@@ -218,119 +304,75 @@ def get_alerts_for_user(db, user, include_hidden: bool = False):
     # 1) Agregamos por curso/severidad
     alerts = _aggregate_alerts_by_course_and_severity(alerts)
 
-    # 2.5) Auto-close: marcar como done las keys que ya no aparecen para ese curso/scope
-# 2.5) Auto-close: marcar como done las keys que ya no aparecen para ese curso/scope
-    if scope != "other":
-        try:
-            # Mapa curso -> keys activas actuales (lo que el motor genera ahora)
-            active_by_course: dict[int, set[str]] = {}
-            for a in alerts:
-                cid = a.get("course_id") or getattr(a.get("course"), "id", None)
-                if not cid:
-                    continue
-                cid = int(cid)
-                ks = set()
-                for k in (a.get("keys") or []):
-                    if k:
-                        ks.add(str(k))
-                active_by_course[cid] = ks
+    # 1.5) Copiamos los cursos fuera de la sesión (el snapshot se comparte)
+    alerts = alerts_cache.snapshot_courses(db, alerts)
 
-            # Cursos a barrer:
-            # - los que tienen alertas ahora (active_by_course)
-            # - + los que tienen estados no terminales en BD (aunque ya no salgan en UI)
-            rows = (
-                db.query(AlertState.course_id)
-                .filter(AlertState.scope == scope)
-                .filter(AlertState.status.in_(["open", "acked", "snoozed"]))
-                .distinct()
-                .all()
-            )
-            course_ids_to_sweep = set(active_by_course.keys()) | {int(r[0]) for r in rows}
+    # 2) Aplicar estados (oculta snoozed/ignored si include_hidden=False)
+    try:
+        alerts = apply_alert_states(db, scope, alerts, include_hidden=include_hidden)
+        current_app.logger.warning(
+            "GA: after_apply n=%s scope=%s include_hidden=%s",
+            len(alerts), scope, include_hidden
+        )
+    except Exception:
+        current_app.logger.exception("apply_alert_states failed")
 
-            for cid in course_ids_to_sweep:
-                resolve_missing_alerts(
-                    db,
-                    scope=scope,
-                    course_id=cid,
-                    active_keys=active_by_course.get(cid, set()),
-                )
+    # 3) Scope para frontend
+    for a in alerts:
+        a["scope"] = scope
 
-            db.commit()
-        except Exception:
-            current_app.logger.exception("GA: resolve_missing_alerts failed")
-            try:
-                db.rollback()
-            except Exception:
-                pass
+    return alerts
 
-            db.commit()
-        except Exception:
-            current_app.logger.exception("GA: resolve_missing_alerts failed")
-            try:
-                db.rollback()
-            except Exception:
-                pass
 
+def _engine_reason_pairs(alerts: list[dict]) -> frozenset:
+    pairs = set()
+    for a in alerts:
+        cid = a.get("course_id") or getattr(a.get("course"), "id", None)
+        if not cid:
+            continue
+        for r in (a.get("reasons") or []):
+            k = ((r or {}).get("key") or "").strip()
+            if k:
+                pairs.add((int(cid), k))
+    return frozenset(pairs)
 
-    # En tu DB existe updated_by (varchar)
-    updated_by = getattr(user, "email", None) or getattr(user, "username", None)
 
-    # 2) UPSERT "seen" en alert_states por cada reason key
-    try:
-        for a in alerts:
-            cid = a.get("course_id") or getattr(a.get("course"), "id", None)
-            if not cid:
-                continue
+def _sync_seen_alerts(db, scope: str, seen_pairs: frozenset, updated_by: str | None):
+    """
+    Tracking "seen" + auto-close en alert_states, en UNA sentencia
+    (ver record_seen_alerts). Además se omite entero si este proceso ya lo
+    hizo para el mismo scope y versión de datos dentro de la granularidad.
+    """
+    ver = data_version.version(alerts_cache.ALERT_SOURCE_TABLES)
+    now = time.monotonic()
 
-            reasons = a.get("reasons") or []
-            if reasons:
-                for r in reasons:
-                    k = (r or {}).get("key")
-                    if k:
-                        upsert_seen_alert(
-                            db,
-                            scope,
-                            int(cid),
-                            str(k),
-                            updated_by=updated_by
-                        )
-            else:
-                for k in (a.get("keys") or []):
-                    if k:
-                        upsert_seen_alert(
-                            db,
-                            scope,
-                            int(cid),
-                            str(k),
-                            updated_by=updated_by
-                        )
+    with _seen_sync_lock:
+        last = _last_seen_sync.get(scope)
+        if last and last[0] == ver and now - last[1] < ALERT_SEEN_GRANULARITY_SECONDS:
+            return
+        _last_seen_sync[scope] = (ver, now)
 
+    try:
+        _upserted, reopened, resolved = record_seen_alerts(
+            db, scope, seen_pairs, updated_by=updated_by
+        )
+        # Si sólo se ha tocado last_seen_at/occurrences no cambia nada visible:
+        # no invalidamos el snapshot. Reabrir/resolver sí cambia estados.
+        if not (reopened or resolved):
+            data_version.discard_pending(db, "alert_states")
         db.commit()
     except Exception:
-        current_app.logger.exception("AlertState upsert_seen_alert failed")
+        current_app.logger.exception("GA: record_seen_alerts failed")
+        with _seen_sync_lock:
+            _last_seen_sync.pop(scope, None)
         try:
             db.rollback()
         except Exception:
             pass
 
-    # 3) Aplicar estados (oculta snoozed/ignored si include_hidden=False)
-    try:
-        alerts = apply_alert_states(db, scope, alerts, include_hidden=include_hidden)
-        current_app.logger.warning(
-            "GA: after_apply n=%s scope=%s include_hidden=%s",
-            len(alerts), scope, include_hidden
-        )
-    except Exception:
-        current_app.logger.exception("apply_alert_states failed")
-
-    # 4) Scope para frontend
-    for a in alerts:
-        a["scope"] = scope
-
-    return alerts
 
-def build_alerts_summary(db, user, include_hidden=False):
-    alerts = get_alerts_for_user(db, user, include_hidden=include_hidden) or []
+def build_alerts_summary(db, user, include_hidden=False, read_only=True):
+    alerts = get_alerts_for_user(db, user, include_hidden=include_hidden, read_only=read_only) or []
 
     summary = {
         "notice": 0,
@@ -1,38 +1,94 @@
 from datetime import date, timedelta
 from flask import current_app
-from sqlalchemy import func
+from sqlalchemy import and_, case, func
+from sqlalchemy.orm import lazyload
 from app.models import Device, Course, Assignment, AssetType, CourseAssetRequirement
+from app.scripts.asset_hierarchy import CARD_ROOT_CODE, get_hierarchy
 
 SEV_RANK = {"notice": 1, "warning": 2, "critical": 3}
 
 
 def card_asset_type_ids(db) -> list[int]:
     """
-    Devuelve IDs de AssetType que representan tarjetas:
-    - el padre CARD
-    - sus hijos directos (AssetType.parent_id == CARD.id)
-
-    Si tienes nietos (más niveles), habrá que hacerlo recursivo.
+    Devuelve IDs de AssetType que representan tarjetas: la raíz CARD y todos
+    sus descendientes activos (desde el índice en memoria, sin queries).
     """
-    parent = (
-        db.query(AssetType)
-        .filter(func.upper(AssetType.code) == "CARD", AssetType.active.is_(True))
-        .first()
-    )
-    if not parent:
+    ids = get_hierarchy().family(CARD_ROOT_CODE, active_only=True)
+    if not ids:
         current_app.logger.warning("card_asset_type_ids: no AssetType with code=CARD found")
         return []
+    return sorted(ids)
+
+
+def _card_counts_by_course(db, card_ids: list[int], window_filter) -> list[tuple]:
+    """
+    UNA query para todos los cursos de la ventana:
+      (Course, required_cards, linked_permanent, linked_temporary)
+
+    - required: suma de requirements activos de tipos tarjeta
+    - linked_*: tarjetas enlazadas vivas (released_at IS NULL), DISTINCT por device,
+      separando permanentes (is_temporary = False) y temporales (True)
+    """
+    if card_ids:
+        required_sq = (
+            db.query(
+                CourseAssetRequirement.course_id.label("course_id"),
+                func.coalesce(func.sum(CourseAssetRequirement.quantity), 0).label("required"),
+            )
+            .join(Course, Course.id == CourseAssetRequirement.course_id)
+            .filter(
+                window_filter,
+                CourseAssetRequirement.active.is_(True),
+                CourseAssetRequirement.asset_type_id.in_(card_ids),
+            )
+            .group_by(CourseAssetRequirement.course_id)
+            .subquery()
+        )
 
-    ids = [parent.id]
+        linked_sq = (
+            db.query(
+                Assignment.course_id.label("course_id"),
+                func.count(func.distinct(
+                    case((Assignment.is_temporary.is_(False), Assignment.device_id))
+                )).label("linked_perm"),
+                func.count(func.distinct(
+                    case((Assignment.is_temporary.is_(True), Assignment.device_id))
+                )).label("linked_temp"),
+            )
+            .join(Course, Course.id == Assignment.course_id)
+            .join(Device, Device.id == Assignment.device_id)
+            .filter(
+                window_filter,
+                Assignment.released_at.is_(None),
+                Device.asset_type_id.in_(card_ids),
+            )
+            .group_by(Assignment.course_id)
+            .subquery()
+        )
+
+        rows = (
+            db.query(
+                Course,
+                func.coalesce(required_sq.c.required, 0),
+                func.coalesce(linked_sq.c.linked_perm, 0),
+                func.coalesce(linked_sq.c.linked_temp, 0),
+            )
+            .outerjoin(required_sq, required_sq.c.course_id == Course.id)
+            .outerjoin(linked_sq, linked_sq.c.course_id == Course.id)
+            .options(lazyload(Course.asset_requirements))
+            .filter(window_filter)
+            .all()
+        )
+        return [(c, int(req or 0), int(lp or 0), int(lt or 0)) for c, req, lp, lt in rows]
 
-    child_ids = (
-        db.query(AssetType.id)
-        .filter(AssetType.active.is_(True), AssetType.parent_id == parent.id)
+    # Sin tipos tarjeta: requeridas = trainees, enlazadas = 0
+    courses = (
+        db.query(Course)
+        .options(lazyload(Course.asset_requirements))
+        .filter(window_filter)
         .all()
     )
-    ids.extend([cid for (cid,) in child_ids])
-
-    return ids
+    return [(c, 0, 0, 0) for c in courses]
 
 
 def get_tco_alerts(db):
@@ -41,19 +97,18 @@ def get_tco_alerts(db):
     window_start = today - timedelta(days=30)
     window_end = today + timedelta(days=30)
 
-    courses = (
-        db.query(Course)
-        .filter(
-            Course.start_date.isnot(None),
-            Course.start_date <= window_end,
-            func.coalesce(Course.end_date, Course.start_date) >= window_start,
-        )
-        .all()
+    window_filter = and_(
+        Course.start_date.isnot(None),
+        Course.start_date <= window_end,
+        func.coalesce(Course.end_date, Course.start_date) >= window_start,
     )
 
     # Tipos de tarjeta válidos
     card_ids = card_asset_type_ids(db)
 
+    # Cursos + requeridas + enlazadas (perm/temp) en una sola query
+    rows = _card_counts_by_course(db, card_ids, window_filter)
+
     def active_missing_window_days(sd: date, ed: date | None) -> int:
         """
         Ventana (en días) durante la cual, con el curso activo, avisamos de faltan tarjetas.
@@ -70,63 +125,6 @@ def get_tco_alerts(db):
         w = int(duration * 0.25)  # floor
         return max(1, w)
 
-    def required_cards_for_course(course: Course) -> int:
-        """
-        Requeridas = suma de requirements cuyo asset_type_id está en card_ids.
-        Si no hay requirements válidos, fallback a course.trainees.
-        """
-        req = 0
-        if card_ids:
-            try:
-                req = (
-                    db.query(func.coalesce(func.sum(CourseAssetRequirement.quantity), 0))
-                    .filter(
-                        CourseAssetRequirement.course_id == course.id,
-                        CourseAssetRequirement.active.is_(True),
-                        CourseAssetRequirement.asset_type_id.in_(card_ids),
-                    )
-                    .scalar()
-                )
-                req = int(req or 0)
-            except Exception:
-                current_app.logger.exception(
-                    "required_cards_for_course failed (course_id=%s)", course.id
-                )
-                req = 0
-
-        trainees = int(getattr(course, "trainees", 0) or 0)
-        return req if req > 0 else trainees
-
-    def linked_cards_for_course_split(course_id: int) -> tuple[int, int]:
-        """
-        Cuenta tarjetas enlazadas vivas (released_at IS NULL), separando:
-        - permanentes (is_temporary = False)
-        - temporales  (is_temporary = True)
-        """
-        if not card_ids:
-            return (0, 0)
-
-        try:
-            base = (
-                db.query(func.count(func.distinct(Assignment.device_id)))
-                .join(Device, Device.id == Assignment.device_id)
-                .filter(
-                    Assignment.course_id == course_id,
-                    Assignment.released_at.is_(None),
-                    Device.asset_type_id.in_(card_ids),
-                )
-            )
-
-            linked_perm = base.filter(Assignment.is_temporary.is_(False)).scalar() or 0
-            linked_temp = base.filter(Assignment.is_temporary.is_(True)).scalar() or 0
-
-            return (int(linked_perm), int(linked_temp))
-        except Exception:
-            current_app.logger.exception(
-                "linked_cards_for_course_split failed (course_id=%s)", course_id
-            )
-            return (0, 0)
-
     def bump_severity(cur: str | None, new: str) -> str:
         if not cur:
             return new
@@ -134,15 +132,14 @@ def get_tco_alerts(db):
 
     alerts = []
 
-    for c in courses:
+    for c, req_cards, linked_perm, linked_temp in rows:
         sd = c.start_date
         ed = c.end_date
         if not sd:
             continue
 
-        req = required_cards_for_course(c)
-
-        linked_perm, linked_temp = linked_cards_for_course_split(c.id)
+        # Requeridas = requirements de tarjeta; si no hay, fallback a trainees
+        req = req_cards if req_cards > 0 else int(getattr(c, "trainees", 0) or 0)
         linked = linked_perm                  # <- IMPORTANT: planned/active usan SOLO permanentes
         linked_total = linked_perm + linked_temp  # <- finished usa total
 
@@ -0,0 +1,229 @@
+# app/scripts/asset_hierarchy.py
+"""
+Índice en memoria de la jerarquía de AssetType (COMPUTER / USB / CARD ...).
+
+Se construye con UNA query y es inmutable: cierre de ancestros/descendientes,
+raíz de cada tipo y "bucket" (pc / usb / card) por id. Se comparte entre
+peticiones e hilos y sólo se reconstruye cuando sube la versión de datos de
+`asset_types` (ver data_version.py: cualquier COMMIT que escriba la tabla,
+también desde otros workers vía NOTIFY).
+
+Uso:
+    h = get_hierarchy()
+    h.family("CARD")            -> frozenset de ids (raíz + descendientes)
+    h.bucket(asset_type_id)     -> "pc" | "usb" | "card" | None
+    h.has_ancestor_code(id, "USB")
+"""
+
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from app.models import AssetType
+from app.scripts import data_version
+
+PC_ROOT_CODE = "COMPUTER"
+USB_ROOT_CODE = "USB"
+CARD_ROOT_CODE = "CARD"
+
+ROOT_BUCKETS = {
+    PC_ROOT_CODE: "pc",
+    USB_ROOT_CODE: "usb",
+    CARD_ROOT_CODE: "card",
+}
+
+TypeInfo = namedtuple("TypeInfo", "id code name parent_id active sort_order")
+
+_lock = threading.Lock()
+_cached: tuple[int, "AssetHierarchy"] | None = None  # (versión, índice)
+
+
+def _legacy_bucket(info: TypeInfo, parent: TypeInfo | None) -> str | None:
+    """
+    Tipos que no cuelgan de una raíz conocida: misma heurística por
+    nombre/código que se usaba antes en courses/assignments.
+    """
+    code = (info.code or "").strip().upper()
+    name = (info.name or "").strip().upper()
+    parent_code = ((parent.code or "") if parent else "").strip().upper()
+    parent_name = ((parent.name or "") if parent else "").strip().upper()
+
+    if "USB" in name or "USB" in parent_name:
+        return "usb"
+    if (
+        code == "PC"
+        or "COMPUTER" in name
+        or "COMPUTER" in parent_name
+        or "LAPTOP" in name
+        or "LAPTOP" in parent_name
+    ):
+        return "pc"
+    if parent_code == CARD_ROOT_CODE:
+        return "card"
+    return None
+
+
+class AssetHierarchy:
+    """Foto inmutable de la jerarquía. Todas las consultas son O(1)."""
+
+    def __init__(self, types):
+        by_id = {t.id: t for t in types}
+
+        children = {}
+        for t in types:
+            if t.parent_id is not None and t.parent_id in by_id:
+                children.setdefault(t.parent_id, []).append(t.id)
+        for ids in children.values():
+            ids.sort(key=lambda i: (by_id[i].sort_order or 0, by_id[i].code or ""))
+
+        ancestors = {}
+        root_of = {}
+        for t in types:
+            chain = []
+            seen = {t.id}
+            cur = by_id.get(t.parent_id) if t.parent_id else None
+            while cur and cur.id not in seen:
+                seen.add(cur.id)
+                chain.append(cur.id)
+                cur = by_id.get(cur.parent_id) if cur.parent_id else None
+            ancestors[t.id] = tuple(chain)
+            root_of[t.id] = chain[-1] if chain else t.id
+
+        descendants = {tid: {tid} for tid in by_id}
+        for tid, chain in ancestors.items():
+            for anc in chain:
+                descendants[anc].add(tid)
+
+        # descendientes alcanzables sin pasar por tipos inactivos
+        active_descendants = {}
+        for tid in by_id:
+            out = set()
+            stack = [tid] if by_id[tid].active else []
+            while stack:
+                cur = stack.pop()
+                if cur in out:
+                    continue
+                out.add(cur)
+                stack.extend(c for c in children.get(cur, ()) if by_id[c].active)
+            active_descendants[tid] = frozenset(out)
+
+        roots_by_code = {}
+        for t in sorted(types, key=lambda t: (not t.active, t.sort_order or 0, t.id)):
+            if t.parent_id is None:
+                roots_by_code.setdefault((t.code or "").strip().upper(), t.id)
+
+        buckets = {}
+        for tid, t in by_id.items():
+            root_code = (by_id[root_of[tid]].code or "").strip().upper()
+            bucket = ROOT_BUCKETS.get(root_code)
+            if bucket is None:
+                bucket = _legacy_bucket(t, by_id.get(t.parent_id))
+            buckets[tid] = bucket
+
+        self.by_id = MappingProxyType(by_id)
+        self.children = MappingProxyType({k: tuple(v) for k, v in children.items()})
+        self.ancestors = MappingProxyType(ancestors)
+        self.descendants = MappingProxyType({k: frozenset(v) for k, v in descendants.items()})
+        self.active_descendants = MappingProxyType(active_descendants)
+        self.root_of = MappingProxyType(root_of)
+        self.roots_by_code = MappingProxyType(roots_by_code)
+        self.buckets = MappingProxyType(buckets)
+
+    def root_id(self, code: str, active_only: bool = False) -> int | None:
+        rid = self.roots_by_code.get((code or "").strip().upper())
+        if rid is None or (active_only and not self.by_id[rid].active):
+            return None
+        return rid
+
+    def family(self, code: str, active_only: bool = False) -> frozenset:
+        """Raíz `code` + todos sus descendientes (vacío si no existe)."""
+        rid = self.root_id(code, active_only=active_only)
+        if rid is None:
+            return frozenset()
+        return self.active_descendants[rid] if active_only else self.descendants[rid]
+
+    def root_code(self, asset_type_id: int | None) -> str | None:
+        rid = self.root_of.get(asset_type_id)
+        if rid is None:
+            return None
+        return (self.by_id[rid].code or "").strip().upper()
+
+    def has_ancestor_code(self, asset_type_id: int | None, code: str) -> bool:
+        """True si el propio tipo o alguno de sus ancestros tiene ese código."""
+        info = self.by_id.get(asset_type_id)
+        if not info:
+            return False
+        target = (code or "").strip().upper()
+        if (info.code or "").strip().upper() == target:
+            return True
+        return any(
+            (self.by_id[a].code or "").strip().upper() == target
+            for a in self.ancestors[asset_type_id]
+        )
+
+    def bucket(self, asset_type_id: int | None) -> str | None:
+        return self.buckets.get(asset_type_id)
+
+
+def _load(db) -> AssetHierarchy:
+    rows = (
+        db.query(
+            AssetType.id,
+            AssetType.code,
+            AssetType.name,
+            AssetType.parent_id,
+            AssetType.active,
+            AssetType.sort_order,
+        )
+        .all()
+    )
+    return AssetHierarchy([
+        TypeInfo(r.id, r.code, r.name, r.parent_id, bool(r.active), r.sort_order)
+        for r in rows
+    ])
+
+
+def get_hierarchy() -> AssetHierarchy:
+    """
+    Índice vigente. Si asset_types cambió desde la última vez, se reconstruye
+    (una sola vez; el resto de hilos esperan).
+
+    Se carga con su propia sesión para ver sólo datos confirmados: si se
+    usara la del llamante, una escritura aún sin COMMIT (o que acabe en
+    ROLLBACK) quedaría cacheada.
+    """
+    global _cached
+
+    ver = data_version.version(["asset_types"])
+    cached = _cached
+    if cached is not None and cached[0] == ver:
+        return cached[1]
+
+    with _lock:
+        ver = data_version.version(["asset_types"])
+        if _cached is not None and _cached[0] == ver:
+            return _cached[1]
+
+        from app.db import SessionLocal
+        db = SessionLocal()
+        try:
+            idx = _load(db)
+        finally:
+            db.close()
+
+        _cached = (ver, idx)
+        return idx
+
+
+def asset_type_bucket(asset_type) -> str | None:
+    """Bucket ("pc" / "usb" / "card") de un AssetType (objeto o id)."""
+    if asset_type is None:
+        return None
+    type_id = asset_type if isinstance(asset_type, int) else getattr(asset_type, "id", None)
+    return get_hierarchy().bucket(type_id)
+
+
+def invalidate():
+    global _cached
+    with _lock:
+        _cached = None
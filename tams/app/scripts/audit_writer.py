@@ -0,0 +1,157 @@
+# app/scripts/audit_writer.py
+"""
+Escritor de auditoría (movements) en segundo plano, por lotes.
+
+Con TAMS_AUDIT_ASYNC=1, log_movement() ya no inserta dentro de la
+transacción del llamante: deja la fila apuntada en la sesión y, cuando esa
+sesión hace COMMIT, la fila pasa a una cola en memoria. Un hilo la vacía
+con INSERT multi-fila cada AUDIT_BATCH_SIZE filas o AUDIT_FLUSH_SECONDS.
+Si la sesión hace ROLLBACK, las filas se descartan (igual que antes).
+
+Garantías / límites:
+- Cola llena o hilo caído -> se escribe en síncrono (fallback).
+- Al salir del proceso (atexit) se vacía la cola.
+- Un kill -9 puede perder lo que esté en cola (como mucho ~1 lote).
+"""
+
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import insert
+
+import app.models as models
+from app.scripts import data_version
+
+log = logging.getLogger(__name__)
+
+AUDIT_ASYNC = os.getenv("TAMS_AUDIT_ASYNC", "0") == "1"
+AUDIT_BATCH_SIZE = int(os.getenv("TAMS_AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("TAMS_AUDIT_FLUSH_SECONDS", "1.0"))
+AUDIT_QUEUE_MAX = int(os.getenv("TAMS_AUDIT_QUEUE_MAX", "20000"))
+
+_queue: queue.Queue = queue.Queue(maxsize=AUDIT_QUEUE_MAX)
+_stop = threading.Event()
+_thread = None
+_thread_lock = threading.Lock()
+_engine = None
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        from app.db import engine
+        _engine = engine
+    return _engine
+
+
+def write_rows(rows: list[dict]):
+    """INSERT multi-fila síncrono en su propia transacción."""
+    if not rows:
+        return
+    with _get_engine().begin() as conn:
+        conn.execute(insert(models.Movements.__table__), rows)
+    # va por Core, fuera de Session: avisamos a mano a los cachés locales
+    data_version.bump(["movements"])
+
+
+def _ensure_started():
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return True
+
+    with _thread_lock:
+        if _thread is not None and _thread.is_alive():
+            return True
+        if _stop.is_set():
+            return False
+
+        _thread = threading.Thread(target=_run, name="tams-audit-writer", daemon=True)
+        _thread.start()
+        return True
+
+
+def enqueue(rows: list[dict]):
+    """
+    Encola filas ya confirmadas (after_commit). Si no se puede, escribe ya.
+    """
+    if not rows:
+        return
+
+    if not _ensure_started():
+        write_rows(rows)
+        return
+
+    overflow = []
+    for row in rows:
+        try:
+            _queue.put_nowait(row)
+        except queue.Full:
+            overflow.append(row)
+
+    if overflow:
+        log.warning("audit queue full: writing %s movements synchronously", len(overflow))
+        write_rows(overflow)
+
+
+def _drain(max_rows: int) -> list[dict]:
+    batch = []
+    while len(batch) < max_rows:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _flush(batch: list[dict]):
+    try:
+        write_rows(batch)
+    except Exception:
+        # un reintento; si vuelve a fallar lo dejamos en el log con el detalle
+        time.sleep(0.5)
+        try:
+            write_rows(batch)
+        except Exception:
+            log.exception("audit writer: %s movements could not be written: %r", len(batch), batch)
+
+
+def _run():
+    while not _stop.is_set():
+        try:
+            first = _queue.get(timeout=AUDIT_FLUSH_SECONDS)
+        except queue.Empty:
+            continue
+
+        batch = [first]
+        deadline = time.monotonic() + AUDIT_FLUSH_SECONDS
+        while len(batch) < AUDIT_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        _flush(batch)
+
+
+def flush_now():
+    """Vacía la cola en el hilo actual (tests, jobs, apagado)."""
+    while True:
+        batch = _drain(AUDIT_BATCH_SIZE)
+        if not batch:
+            return
+        _flush(batch)
+
+
+@atexit.register
+def shutdown():
+    _stop.set()
+    if _thread is not None and _thread.is_alive():
+        _thread.join(timeout=AUDIT_FLUSH_SECONDS * 2)
+    flush_now()
@@ -0,0 +1,102 @@
+# app/scripts/auto_lost_overdue.py
+"""
+Job: devices de cursos en overdue_2 -> status 'lost'.
+
+Antes lo hacía get_overdue_course_alerts() mientras pintaba (en cada
+render). Ahora es un batch idempotente:
+  - un solo UPDATE ... FROM ... RETURNING
+  - sólo toca devices que siguen en 'assigned' (los ya 'lost' no se
+    vuelven a procesar ni a loguear)
+  - un movement por device marcado
+
+Uso (cron / tarea programada):
+    python -m app.scripts.auto_lost_overdue
+"""
+
+from datetime import date, timedelta
+
+from sqlalchemy import update
+
+from app.db import SessionLocal
+from app.models import Assignment, Course, Device, AssetType
+from app.scripts.get_overdue_assignments import OVERDUE_7_DAYS
+from app.scripts.movements import log_movement
+
+
+def run(days: int = OVERDUE_7_DAYS, managed_by: str | None = None) -> dict:
+    db = SessionLocal()
+    try:
+        today = date.today()
+        # overdue_2 == days_late > days  <=>  end_date < today - days
+        cutoff = today - timedelta(days=days)
+
+        stmt = (
+            update(Device)
+            .where(
+                Device.status == "assigned",
+                Assignment.device_id == Device.id,
+                Assignment.status == "active",
+                Assignment.released_at.is_(None),
+                Course.id == Assignment.course_id,
+                Course.end_date.isnot(None),
+                Course.end_date < cutoff,
+                AssetType.id == Device.asset_type_id,
+                AssetType.show_in_calendar.is_(True),
+            )
+            .values(status="lost")
+            .returning(
+                Device.id,
+                Device.uid,
+                Device.name,
+                Assignment.id,
+                Course.id,
+                Course.course,
+                Course.end_date,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+        if managed_by:
+            stmt = stmt.where(AssetType.managed_by_department == managed_by)
+
+        rows = db.execute(stmt).all()
+
+        for device_id, uid, name, assignment_id, course_id, course_code, end_date in rows:
+            log_movement(
+                db,
+                user_id=None,
+                entity_type="device",
+                entity_id=device_id,
+                action="auto_lost_overdue",
+                before_data={
+                    "device": {"id": device_id, "uid": uid, "name": name, "status": "assigned"},
+                    "assignment_id": assignment_id,
+                    "course": {
+                        "id": course_id,
+                        "course": course_code,
+                        "end_date": end_date.isoformat() if end_date else None,
+                    },
+                    "policy": {"overdue_days": days},
+                },
+                after_data={"device": {"id": device_id, "status": "lost"}},
+                description=(
+                    f"AUTO: marked device LOST (overdue > {days} days) "
+                    f"(device_id={device_id}, assignment_id={assignment_id}, "
+                    f"course_id={course_id}, course={course_code})"
+                ),
+                user_agent="system/auto_lost_overdue_job",
+                success=True,
+            )
+
+        db.commit()
+        return {"ok": True, "processed": len(rows)}
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(run())
@@ -0,0 +1,168 @@
+# app/scripts/bulk_assignments.py
+"""
+Operaciones por lotes sobre assignments / devices (asignar y devolver en masa).
+
+Cada función es UNA sentencia para todo el lote, sea cual sea su tamaño:
+- find_live_assignments: conflictos (assignment vivo) de todos los devices
+- claim_devices:          UPDATE devices ... WHERE status IN (...) RETURNING id
+- insert_assignments:     INSERT multi-fila ... RETURNING id, device_id
+- release_assignments:    UPDATE assignments ... WHERE released_at IS NULL RETURNING
+- delete_assignments:     DELETE assignments ... RETURNING id
+- insert_course_device_movements: histórico ITC multi-fila
+- live_counts_by_course:  COUNT agrupado por curso
+
+Los UPDATE llevan la condición de estado en el WHERE: si otra petición se ha
+adelantado con un device, simplemente no sale en el RETURNING (perdió la
+carrera) y el llamante lo reporta. No hacen commit.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, update
+from sqlalchemy.orm import joinedload
+
+from app.models import Assignment, CourseDeviceMovement, Device
+from app.scripts.device_resolver import LIVE_ASSIGNMENT_STATUSES
+
+
+def find_live_assignments(db, device_ids, *, with_course=False) -> dict[int, list]:
+    """
+    {device_id: [Assignment vivo, ...]} (más reciente primero) en una query.
+    Vivo = released_at NULL y estado active/overdue.
+    """
+    device_ids = sorted(set(device_ids or ()))
+    if not device_ids:
+        return {}
+
+    query = db.query(Assignment)
+    if with_course:
+        query = query.options(joinedload(Assignment.course))
+
+    rows = (
+        query
+        .filter(
+            Assignment.device_id.in_(device_ids),
+            Assignment.released_at.is_(None),
+            Assignment.status.in_(LIVE_ASSIGNMENT_STATUSES),
+        )
+        .order_by(Assignment.device_id, Assignment.assigned_at.desc(), Assignment.id.desc())
+        .all()
+    )
+
+    out = {}
+    for a in rows:
+        out.setdefault(a.device_id, []).append(a)
+    return out
+
+
+def claim_devices(db, device_ids, *, from_statuses=("available",), to_status="assigned") -> set[int]:
+    """
+    Cambia el estado de los devices que SIGAN en from_statuses
+    (from_statuses=None: sin condición de estado).
+    Devuelve los ids que se han actualizado.
+    """
+    device_ids = sorted(set(device_ids or ()))
+    if not device_ids:
+        return set()
+
+    stmt = update(Device).where(Device.id.in_(device_ids))
+    if from_statuses is not None:
+        stmt = stmt.where(Device.status.in_(from_statuses))
+
+    result = db.execute(
+        stmt
+        .values(status=to_status, updated_at=datetime.utcnow())
+        .returning(Device.id)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id for row in result}
+
+
+def insert_assignments(db, rows: list[dict]) -> dict[int, int]:
+    """
+    Inserta todas las filas en un INSERT multi-fila.
+    rows: dicts con columnas de Assignment (device_id, course_id, ...).
+    Devuelve {device_id: assignment_id}.
+    """
+    if not rows:
+        return {}
+
+    now = datetime.utcnow()
+    values = [
+        {
+            "assigned_at": now,
+            "status": "active",
+            "is_temporary": False,
+            "created_at": now,
+            "updated_at": now,
+            **row,
+        }
+        for row in rows
+    ]
+
+    result = db.execute(
+        insert(Assignment).returning(Assignment.id, Assignment.device_id),
+        values,
+    )
+    return {row.device_id: row.id for row in result}
+
+
+def release_assignments(db, assignment_ids, *, status="closed", released_at=None) -> list:
+    """
+    Cierra los assignments que sigan abiertos (released_at NULL).
+    Devuelve filas (id, device_id, course_id) de los realmente cerrados.
+    """
+    assignment_ids = sorted(set(assignment_ids or ()))
+    if not assignment_ids:
+        return []
+
+    released_at = released_at or datetime.utcnow()
+    result = db.execute(
+        update(Assignment)
+        .where(Assignment.id.in_(assignment_ids), Assignment.released_at.is_(None))
+        .values(status=status, released_at=released_at, updated_at=datetime.utcnow())
+        .returning(Assignment.id, Assignment.device_id, Assignment.course_id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.all()
+
+
+def delete_assignments(db, assignment_ids) -> set[int]:
+    """
+    Borra assignments vivos (flujos que no cierran sino que borran la fila).
+    Devuelve los ids realmente borrados (si otro se adelantó, no vuelven).
+    """
+    assignment_ids = sorted(set(assignment_ids or ()))
+    if not assignment_ids:
+        return set()
+
+    result = db.execute(
+        delete(Assignment)
+        .where(Assignment.id.in_(assignment_ids))
+        .returning(Assignment.id)
+        .execution_options(synchronize_session=False)
+    )
+    return {row.id for row in result}
+
+
+def insert_course_device_movements(db, rows: list[dict]):
+    """Histórico de course_device_movements para todo el lote (INSERT multi-fila)."""
+    if rows:
+        db.execute(insert(CourseDeviceMovement), rows)
+
+
+def live_counts_by_course(db, course_ids) -> dict[int, int]:
+    """Assignments con released_at NULL por curso, en una query."""
+    course_ids = sorted(set(course_ids or ()))
+    if not course_ids:
+        return {}
+
+    rows = (
+        db.query(Assignment.course_id, func.count(Assignment.id))
+        .filter(Assignment.course_id.in_(course_ids), Assignment.released_at.is_(None))
+        .group_by(Assignment.course_id)
+        .all()
+    )
+    out = {cid: 0 for cid in course_ids}
+    out.update({cid: int(n or 0) for cid, n in rows})
+    return out
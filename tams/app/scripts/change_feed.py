@@ -0,0 +1,100 @@
+# app/scripts/change_feed.py
+"""
+Canales del stream SSE (/api/stream) y qué tablas los alimentan.
+
+El stream no hace polling a la BD: espera en data_version.wait_for_change()
+y, cuando sube la versión, mira qué canales tienen tablas afectadas.
+Cada canal se traduce en un evento SSE:
+
+  counters  -> payload con los contadores del sidebar (igual que /api/counters)
+  alerts    -> "recarga el parcial de alertas del dashboard"
+  pickup    -> "recarga el fragmento de ITC pickup"
+  calendar  -> "refetchEvents()" (el endpoint responde 304 si no cambió nada)
+
+Además hay un resync periódico para lo que depende del reloj y no de los
+datos (snoozes que vencen, cambio de día).
+"""
+
+import json
+import os
+import time
+
+from app.scripts import data_version
+from app.scripts.alerts_cache import ALERT_SOURCE_TABLES, ALERTS_CACHE_MAX_AGE_SECONDS
+
+CALENDAR_SOURCE_TABLES = (
+    "courses",
+    "course_asset_requirements",
+    "assignments",
+    "devices",
+    "asset_types",
+    "course_device_movements",
+    "course_reworks",
+    "alert_states",
+)
+
+CHANNEL_TABLES = {
+    "counters": ALERT_SOURCE_TABLES + ("notifications",),
+    "alerts": ALERT_SOURCE_TABLES,
+    "pickup": ("notifications",),
+    "calendar": CALENDAR_SOURCE_TABLES,
+}
+
+# Canales que dependen del reloj: se reenvían en cada resync
+CLOCK_CHANNELS = ("counters", "alerts", "calendar")
+
+STREAM_ENABLED = os.getenv("TAMS_SSE_ENABLED", "1") == "1"
+STREAM_HEARTBEAT_SECONDS = int(os.getenv("TAMS_SSE_HEARTBEAT", "15"))
+STREAM_MAX_SECONDS = int(os.getenv("TAMS_SSE_MAX_SECONDS", "300"))
+STREAM_RESYNC_SECONDS = ALERTS_CACHE_MAX_AGE_SECONDS
+STREAM_RETRY_MS = 5000
+
+
+def sse_event(event: str, data=None) -> str:
+    payload = json.dumps(data if data is not None else {}, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def sse_comment(text: str = "ping") -> str:
+    return f": {text}\n\n"
+
+
+def iter_changes(
+    heartbeat_seconds: float = STREAM_HEARTBEAT_SECONDS,
+    max_seconds: float = STREAM_MAX_SECONDS,
+    resync_seconds: float = STREAM_RESYNC_SECONDS,
+):
+    """
+    Generador de cambios para un stream:
+      - set() vacío   -> nada nuevo (toca heartbeat)
+      - {"alerts",..} -> canales cuyos datos cambiaron (o resync por reloj)
+
+    Termina al llegar a max_seconds (el navegador reconecta solo).
+    """
+    seen = {ch: data_version.version(tables) for ch, tables in CHANNEL_TABLES.items()}
+    current = data_version.version()
+
+    now = time.monotonic()
+    deadline = now + max_seconds
+    next_resync = now + resync_seconds
+
+    while True:
+        now = time.monotonic()
+        if now >= deadline:
+            return
+
+        timeout = max(0.0, min(heartbeat_seconds, next_resync - now, deadline - now))
+        current = data_version.wait_for_change(current, timeout)
+
+        changed = set()
+        for ch, tables in CHANNEL_TABLES.items():
+            ver = data_version.version(tables)
+            if ver != seen[ch]:
+                seen[ch] = ver
+                changed.add(ch)
+
+        if time.monotonic() >= next_resync:
+            changed.update(CLOCK_CHANNELS)
+            next_resync = time.monotonic() + resync_seconds
+
+        yield changed
@@ -0,0 +1,172 @@
+# app/scripts/course_detail.py
+"""
+Lectura del detalle de un curso (courses.detail / detail_fragment).
+
+El coste no depende del histórico del curso:
+- sólo se cargan los assignments VIVOS (released_at NULL y estado
+  activo/overdue), con device y creador, en una query
+- el estado overdue y los días de retraso salen de una expresión SQL sobre
+  courses.end_date: no se escriben en assignments (antes se reescribían
+  dentro del GET)
+- el resumen de equipos ITC (pc / usb: required / assigned / returned /
+  pending) se cuenta en SQL agrupando por asset_type; el bucket de cada
+  tipo sale del índice en memoria de asset_hierarchy
+
+Índice: assignments (course_id, released_at), sql/005_course_detail_assignments.sql.
+"""
+
+from datetime import date
+
+from sqlalchemy import Integer, case, func, literal, select, union_all
+from sqlalchemy.orm import joinedload
+
+from app.models import Assignment, Course, CourseAssetRequirement, Device
+from app.scripts.asset_hierarchy import get_hierarchy
+from app.scripts.device_resolver import LIVE_ASSIGNMENT_STATUSES
+from app.scripts.get_overdue_assignments import OVERDUE_7_DAYS
+
+SUMMARY_BUCKETS = ("pc", "usb")
+
+
+def days_late_expr(today: date):
+    """Días de retraso del curso respecto a `today` (0 si no ha acabado o no tiene fin)."""
+    return case(
+        (Course.end_date.is_(None), 0),
+        else_=func.greatest(literal(today) - Course.end_date, 0),
+    )
+
+
+def overdue_status_expr(today: date):
+    """Mismas reglas que la alerta de overdue: active / overdue_1 (≤ 7 días) / overdue_2."""
+    days_late = days_late_expr(today)
+    return case(
+        (days_late <= 0, "active"),
+        (days_late <= OVERDUE_7_DAYS, "overdue_1"),
+        else_="overdue_2",
+    )
+
+
+class LiveAssignment:
+    """Assignment vivo con su estado calculado (no es un objeto de la sesión)."""
+
+    __slots__ = (
+        "id", "device_id", "device", "creator", "assigned_at",
+        "notes", "is_temporary", "status", "days_late",
+    )
+
+    def __init__(self, assignment, status, days_late):
+        self.id = assignment.id
+        self.device_id = assignment.device_id
+        self.device = assignment.device
+        self.creator = assignment.creator
+        self.assigned_at = assignment.assigned_at
+        self.notes = assignment.notes
+        self.is_temporary = assignment.is_temporary
+        self.status = status
+        self.days_late = int(days_late or 0)
+
+    def __repr__(self):
+        return f"<LiveAssignment id={self.id} device_id={self.device_id} status={self.status}>"
+
+
+def load_live_assignments(db, course_id: int, *, today: date | None = None) -> list[LiveAssignment]:
+    today = today or date.today()
+    stmt = (
+        select(
+            Assignment,
+            overdue_status_expr(today).label("computed_status"),
+            days_late_expr(today).label("days_late"),
+        )
+        .join(Course, Course.id == Assignment.course_id)
+        .where(
+            Assignment.course_id == course_id,
+            Assignment.released_at.is_(None),
+            Assignment.status.in_(LIVE_ASSIGNMENT_STATUSES),
+        )
+        .options(joinedload(Assignment.device), joinedload(Assignment.creator))
+        .order_by(Assignment.assigned_at, Assignment.id)
+    )
+    return [
+        LiveAssignment(a, status, days_late)
+        for a, status, days_late in db.execute(stmt).all()
+        if a.device is not None
+    ]
+
+
+def _summary_statement(course_id: int):
+    required = (
+        select(
+            CourseAssetRequirement.asset_type_id.label("asset_type_id"),
+            func.coalesce(func.sum(CourseAssetRequirement.quantity), 0).label("required"),
+            literal(0, Integer).label("returned"),
+            literal(0, Integer).label("assigned"),
+        )
+        .where(
+            CourseAssetRequirement.course_id == course_id,
+            CourseAssetRequirement.active.isnot(False),
+        )
+        .group_by(CourseAssetRequirement.asset_type_id)
+    )
+    assigned = (
+        select(
+            Device.asset_type_id.label("asset_type_id"),
+            literal(0, Integer).label("required"),
+            func.count().filter(Assignment.released_at.isnot(None)).label("returned"),
+            func.count().filter(
+                Assignment.released_at.is_(None),
+                Assignment.status.in_(LIVE_ASSIGNMENT_STATUSES),
+            ).label("assigned"),
+        )
+        .select_from(Assignment)
+        .join(Device, Device.id == Assignment.device_id)
+        .where(Assignment.course_id == course_id, Device.asset_type_id.isnot(None))
+        .group_by(Device.asset_type_id)
+    )
+    return union_all(required, assigned)
+
+
+def load_equipment_summary(db, course_id: int) -> dict:
+    """
+    {"pc": {...}, "usb": {...}} con required / assigned / returned /
+    pending / total_assigned. Una query; filas = tipos usados por el curso.
+    """
+    summary = {
+        bucket: {"required": 0, "assigned": 0, "returned": 0, "pending": 0, "total_assigned": 0}
+        for bucket in SUMMARY_BUCKETS
+    }
+    hierarchy = get_hierarchy()
+
+    for type_id, required, returned, assigned in db.execute(_summary_statement(course_id)).all():
+        bucket = hierarchy.bucket(type_id)
+        if bucket not in summary:
+            continue
+        row = summary[bucket]
+        row["required"] += int(required or 0)
+        row["returned"] += int(returned or 0)
+        row["assigned"] += int(assigned or 0)
+
+    for row in summary.values():
+        row["pending"] = row["assigned"]
+        row["total_assigned"] = row["assigned"] + row["returned"]
+    return summary
+
+
+class CourseDetail:
+    __slots__ = ("course", "active_assignments", "equipment_summary")
+
+    def __init__(self, course, active_assignments, equipment_summary):
+        self.course = course
+        self.active_assignments = active_assignments
+        self.equipment_summary = equipment_summary
+
+
+def load_course_detail(db, course_id: int, *, with_summary: bool = True, today: date | None = None):
+    """Curso + assignments vivos (+ resumen ITC). None si el curso no existe."""
+    course = db.get(Course, course_id)
+    if course is None:
+        return None
+    return CourseDetail(
+        course,
+        load_live_assignments(db, course.id, today=today),
+        load_equipment_summary(db, course.id) if with_summary else None,
+    )
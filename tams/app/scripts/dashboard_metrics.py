@@ -0,0 +1,279 @@
+# app/scripts/dashboard_metrics.py
+"""
+Métricas del dashboard (main.index).
+
+Todas las cifras salen de UNA sentencia: totales con subconsultas escalares,
+assignments vivos con COUNT(*) FILTER y el reparto de devices por
+asset_type (y por Device.type legacy cuando no tienen asset_type_id) como
+json_agg. El resultado se guarda por scope (admin / tco / itc / other) con:
+- invalidación por cambios: versión de datos de DASHBOARD_SOURCE_TABLES
+  (ver data_version.py)
+- edad máxima corta (TAMS_DASHBOARD_METRICS_TTL)
+
+`movements` no está en las tablas fuente a propósito: casi cualquier acción
+escribe una fila de auditoría y el total de movimientos invalidaría el
+caché en cada petición. Ese total se refresca por TTL.
+
+Las alertas del dashboard (visibles + resumen con ocultas) salen de una
+sola pasada de los motores: ver alerts_service.get_alerts_for_user.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import JSON, case, func, literal_column, select
+
+from app.models import Assignment, Course, Device, Movements, User
+from app.scripts import data_version
+from app.scripts.alert_filters import reason_counts_for_calendar
+from app.scripts.alerts_service import get_alerts_for_user
+from app.scripts.asset_hierarchy import CARD_ROOT_CODE, USB_ROOT_CODE, get_hierarchy
+
+DASHBOARD_SOURCE_TABLES = ("users", "devices", "courses", "assignments", "asset_types")
+
+DASHBOARD_METRICS_TTL_SECONDS = float(os.getenv("TAMS_DASHBOARD_METRICS_TTL", "15"))
+
+# Devices sin asset_type_id: Device.type legacy -> código de AssetType
+LEGACY_TYPE_TO_ASSET_CODE = {
+    "vending": "CARD_VENDING",
+    "canteen": "CARD_CANTEEN",
+    "instructor": "CARD_INSTRUCTOR",
+    "guest": "CARD_GUEST",
+}
+
+_COUNTS_KEY = "__counts__"
+
+_lock = threading.Lock()
+_key_locks: dict[str, threading.Lock] = {}
+_cache: dict[str, tuple[int, float, object]] = {}  # key -> (ver, t, valor)
+
+
+def dashboard_scope(user) -> str:
+    """Mismas reglas de perfil que usaba main.index."""
+    role = (getattr(user, "role", "") or "").strip().lower()
+    dept = (getattr(user, "department", "") or "").strip().lower()
+
+    if "admin" in role:
+        return "admin"
+    if dept == "tco":
+        return "tco"
+    if dept == "itc support" or role.startswith("itc"):
+        return "itc"
+    return "other"
+
+
+def _counts_statement():
+    live = Assignment.released_at.is_(None)
+    assignments = (
+        select(
+            func.count().label("total"),
+            func.count().filter(live).label("live"),
+        )
+        .select_from(Assignment)
+        .subquery()
+    )
+
+    legacy_type = case(
+        (Device.asset_type_id.is_(None), func.lower(Device.type)),
+        else_=None,
+    )
+    per_type = (
+        select(
+            Device.asset_type_id.label("asset_type_id"),
+            legacy_type.label("legacy_type"),
+            func.count().label("total"),
+            func.count().filter(Device.status == "assigned").label("assigned"),
+        )
+        .where(Device.active.is_(True))
+        .group_by(Device.asset_type_id, legacy_type)
+        .subquery()
+    )
+    per_type_json = select(
+        func.coalesce(
+            func.json_agg(
+                func.json_build_array(
+                    per_type.c.asset_type_id,
+                    per_type.c.legacy_type,
+                    per_type.c.total,
+                    per_type.c.assigned,
+                )
+            ),
+            literal_column("'[]'::json"),
+            type_=JSON,
+        )
+    ).scalar_subquery()
+
+    def total(model):
+        return select(func.count()).select_from(model).scalar_subquery()
+
+    return (
+        select(
+            total(User).label("users"),
+            total(Device).label("devices"),
+            total(Course).label("courses"),
+            total(Movements).label("movements"),
+            assignments.c.total.label("assignments"),
+            assignments.c.live.label("live_assignments"),
+            per_type_json.label("devices_by_type"),
+        )
+        .select_from(assignments)
+    )
+
+
+def load_counts(db) -> dict:
+    """Todas las cifras del dashboard en una ida a la BD."""
+    row = db.execute(_counts_statement()).one()
+
+    hierarchy = get_hierarchy()
+    asset_id_by_code = {
+        (t.code or "").upper(): t.id
+        for t in hierarchy.by_id.values()
+        if t.active
+    }
+
+    by_asset_type = {}
+    for asset_type_id, legacy, total, assigned in row.devices_by_type or ():
+        if asset_type_id is None:
+            target_code = LEGACY_TYPE_TO_ASSET_CODE.get((legacy or "").lower())
+            asset_type_id = asset_id_by_code.get(target_code) if target_code else None
+            if asset_type_id is None:
+                continue
+        slot = by_asset_type.setdefault(asset_type_id, {"total": 0, "assigned": 0})
+        slot["total"] += int(total or 0)
+        slot["assigned"] += int(assigned or 0)
+
+    return {
+        "total_users": int(row.users or 0),
+        "total_devices": int(row.devices or 0),
+        "total_courses": int(row.courses or 0),
+        "total_movements": int(row.movements or 0),
+        "total_assignments": int(row.assignments or 0),
+        "total_active_cards": int(row.live_assignments or 0),
+        "devices_by_asset_type": by_asset_type,
+    }
+
+
+def _visible_types(scope: str, hierarchy) -> list:
+    """Subtipos (no raíces) que ve cada perfil; nunca lo que cuelga de USB."""
+    all_types = sorted(
+        (t for t in hierarchy.by_id.values() if t.active),
+        key=lambda t: (t.sort_order or 0, t.code or ""),
+    )
+    card_family_ids = hierarchy.family(CARD_ROOT_CODE, active_only=True)
+
+    children = [t for t in all_types if t.parent_id is not None]
+    if scope == "tco":
+        children = [t for t in children if t.id in card_family_ids]
+    elif scope == "itc":
+        children = [t for t in children if t.id not in card_family_ids]
+
+    return [t for t in children if not hierarchy.has_ancestor_code(t.id, USB_ROOT_CODE)]
+
+
+def _device_stats(scope: str, by_asset_type: dict) -> list[dict]:
+    out = []
+    for at in _visible_types(scope, get_hierarchy()):
+        counts = by_asset_type.get(at.id, {"total": 0, "assigned": 0})
+        total = counts["total"]
+        assigned = counts["assigned"]
+        out.append({
+            "type": (at.code or "").lower(),
+            "total": total,
+            "assigned": assigned,
+            "ratio": (assigned / total * 100) if total else 0,
+        })
+    return out
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _lock:
+        lk = _key_locks.get(key)
+        if lk is None:
+            lk = _key_locks[key] = threading.Lock()
+        return lk
+
+
+def _fresh(entry, ver: int, now: float):
+    if not entry:
+        return None
+    entry_ver, computed_at, value = entry
+    if entry_ver != ver or now - computed_at > DASHBOARD_METRICS_TTL_SECONDS:
+        return None
+    return value
+
+
+def _get_or_compute(key: str, compute):
+    ver = data_version.version(DASHBOARD_SOURCE_TABLES)
+    value = _fresh(_cache.get(key), ver, time.monotonic())
+    if value is not None:
+        return value
+
+    with _lock_for(key):
+        ver = data_version.version(DASHBOARD_SOURCE_TABLES)
+        value = _fresh(_cache.get(key), ver, time.monotonic())
+        if value is None:
+            value = compute()
+            _cache[key] = (ver, time.monotonic(), value)
+        return value
+
+
+def _load_counts_committed() -> dict:
+    # sesión propia: sólo datos confirmados (el valor se comparte)
+    from app.db import SessionLocal
+    db = SessionLocal()
+    try:
+        return load_counts(db)
+    finally:
+        db.close()
+
+
+def get_dashboard_metrics(user) -> dict:
+    """
+    Tiles + device_stats para el perfil del usuario. Valor compartido:
+    no modificar.
+    """
+    scope = dashboard_scope(user)
+
+    def compute():
+        counts = _get_or_compute(_COUNTS_KEY, _load_counts_committed)
+        metrics = {k: v for k, v in counts.items() if k != "devices_by_asset_type"}
+        metrics["device_stats"] = _device_stats(scope, counts["devices_by_asset_type"])
+        return metrics
+
+    return _get_or_compute(scope, compute)
+
+
+def get_dashboard_alerts(db, user) -> tuple[list[dict], dict]:
+    """
+    (alertas visibles, resumen por severidad incluyendo ocultas).
+    Las dos vistas comparten la pasada de motores del scope.
+    """
+    alerts = get_alerts_for_user(db, user, include_hidden=False) or []
+    alerts_all = get_alerts_for_user(db, user, include_hidden=True, read_only=True) or []
+
+    now_utc = datetime.now(timezone.utc)
+    summary = {"notice": 0, "warning": 0, "critical": 0}
+
+    for a in alerts_all:
+        a_sev = (a.get("severity") or "notice").strip().lower()
+        reasons = a.get("reasons") or []
+        if reasons:
+            for r in reasons:
+                if not reason_counts_for_calendar(r, now_utc):
+                    continue
+                sev = (r.get("severity") or a_sev or "notice").strip().lower()
+                if sev not in summary:
+                    sev = "notice"
+                summary[sev] += 1
+        else:
+            sev = a_sev if a_sev in summary else "notice"
+            summary[sev] += 1
+
+    return alerts, summary
+
+
+def invalidate():
+    with _lock:
+        _cache.clear()
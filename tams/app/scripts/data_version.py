@@ -0,0 +1,233 @@
+# app/scripts/data_version.py
+"""
+Versión de datos por tabla (en proceso).
+
+Cada vez que una sesión hace COMMIT habiendo escrito en una tabla, se sube la
+versión de esa tabla. Los cachés derivados (alertas, calendario, dashboard...)
+guardan la versión con la que se calcularon y se invalidan solos cuando cambia.
+
+Se detectan escrituras de:
+- flush del ORM (session.new / dirty / deleted)
+- UPDATE / DELETE / INSERT masivos (query.update(), session.execute(update(...)))
+- SQL crudo con text() ("INSERT INTO x", "UPDATE x", "DELETE FROM x")
+
+Los listeners van sobre la clase Session, así que cubren tanto SessionLocal
+como la sesión de Flask-SQLAlchemy.
+
+Entre procesos (varios workers): si se activa enable_pg_notify(), cada COMMIT
+que escribió tablas manda un NOTIFY dentro de su propia transacción y el
+listener de app/scripts/pg_change_listener.py sube la versión en el resto.
+
+wait_for_change() permite esperar a un cambio sin hacer polling (SSE).
+"""
+
+import os
+import re
+import threading
+import uuid
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import TextClause
+
+_PENDING_KEY = "tams_data_version_tables"
+
+_WRITE_SQL_RE = re.compile(
+    r"^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+(?:ONLY\s+)?\"?([A-Za-z_][A-Za-z0-9_]*)\"?",
+    re.IGNORECASE,
+)
+
+NOTIFY_CHANNEL = "tams_data_version"
+
+_lock = threading.Lock()
+_changed = threading.Condition(_lock)
+_counter = 0
+_versions: dict[str, int] = {}
+_notify_enabled = False
+
+# Distingue procesos: los contadores son locales, así que un stamp de un
+# worker no vale para otro (p.ej. en un ETag), y apply_remote() lo usa para
+# descartar sus propios NOTIFY. Tiene que ser único por PROCESO: con
+# gunicorn --preload los workers salen de un fork del maestro y heredarían
+# el mismo valor, así que se regenera en el hijo tras cada fork.
+def _new_boot_id() -> str:
+    return f"{uuid.uuid4().hex[:12]}.{os.getpid()}"
+
+
+_BOOT_ID = _new_boot_id()
+
+
+def _reset_after_fork():
+    global _BOOT_ID, _lock, _changed
+    _BOOT_ID = _new_boot_id()
+    # el lock pudo quedar cogido por un hilo del padre que no existe aquí
+    _lock = threading.Lock()
+    _changed = threading.Condition(_lock)
+
+
+if hasattr(os, "register_at_fork"):  # no existe en Windows (no hay fork)
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def boot_id() -> str:
+    return _BOOT_ID
+
+
+def bump(tables) -> int:
+    """
+    Sube la versión de las tablas indicadas. Devuelve el nuevo contador global.
+    """
+    global _counter
+    tables = {t for t in (tables or ()) if t}
+    if not tables:
+        return _counter
+
+    with _lock:
+        _counter += 1
+        for t in tables:
+            _versions[t] = _counter
+        _changed.notify_all()
+        return _counter
+
+
+def bump_all() -> int:
+    """
+    Sube todas las tablas conocidas (p.ej. tras perder eventos de otro proceso).
+    """
+    with _lock:
+        tables = list(_versions)
+    return bump(tables or ["*"])
+
+
+def version(tables=None) -> int:
+    """
+    Versión actual de un conjunto de tablas (o global si tables=None).
+    Es monótona: si cualquiera de las tablas cambia, el valor sube.
+    """
+    with _lock:
+        if tables is None:
+            return _counter
+        return max((_versions.get(t, 0) for t in tables), default=0)
+
+
+def stamp(tables=None) -> str:
+    """
+    Versión como texto estable para ETags / claves de caché: "<boot>-<version>".
+    """
+    return f"{_BOOT_ID}-{version(tables)}"
+
+
+def wait_for_change(since: int, timeout: float) -> int:
+    """
+    Bloquea hasta que la versión global sea distinta de `since` o venza el
+    timeout. Devuelve la versión global actual.
+    """
+    with _changed:
+        _changed.wait_for(lambda: _counter != since, timeout=timeout)
+        return _counter
+
+
+def enable_pg_notify(enabled: bool = True):
+    """Activa el NOTIFY en COMMIT (sólo tiene sentido con PostgreSQL)."""
+    global _notify_enabled
+    _notify_enabled = bool(enabled)
+
+
+def apply_remote(payload: str):
+    """
+    Aplica un NOTIFY de otro proceso: "<boot>:tabla1,tabla2".
+    Los propios se ignoran (ya se subieron en after_commit).
+    """
+    boot, _, tables = (payload or "").partition(":")
+    if not boot or boot == _BOOT_ID:
+        return
+    bump([t for t in tables.split(",") if t])
+
+
+def mark_dirty(session, *tables):
+    """
+    Apunta tablas escritas en la transacción actual de la sesión.
+    Se publican (bump) en el COMMIT; en ROLLBACK se descartan.
+    """
+    pending = session.info.setdefault(_PENDING_KEY, set())
+    pending.update(t for t in tables if t)
+
+
+def discard_pending(session, *tables):
+    """
+    Quita tablas de la lista pendiente de la sesión (escrituras de
+    contabilidad interna que no deben invalidar cachés).
+    """
+    pending = session.info.get(_PENDING_KEY)
+    if pending:
+        pending.difference_update(tables)
+
+
+def _table_name(obj) -> str | None:
+    table = getattr(obj, "__table__", None)
+    return getattr(table, "name", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_tables(session, flush_context):
+    tables = set()
+    for obj in session.new:
+        tables.add(_table_name(obj))
+    for obj in session.deleted:
+        tables.add(_table_name(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            tables.add(_table_name(obj))
+    tables.discard(None)
+    if tables:
+        mark_dirty(session, *tables)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_executed_tables(orm_execute_state):
+    stmt = orm_execute_state.statement
+
+    if isinstance(stmt, TextClause):
+        m = _WRITE_SQL_RE.match(stmt.text or "")
+        if m:
+            mark_dirty(orm_execute_state.session, m.group(1).lower())
+        return
+
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        table = getattr(stmt, "table", None)
+        name = getattr(table, "name", None)
+        if name:
+            mark_dirty(orm_execute_state.session, name)
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_other_processes(session):
+    if not _notify_enabled:
+        return
+
+    # El flush final de commit() va DESPUÉS de before_commit: lo adelantamos
+    # para que las tablas de ese flush también viajen en el NOTIFY.
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+
+    pending = session.info.get(_PENDING_KEY)
+    if not pending:
+        return
+
+    # NOTIFY es transaccional: sólo se entrega si el COMMIT sale bien.
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": NOTIFY_CHANNEL, "payload": f"{_BOOT_ID}:{','.join(sorted(pending))}"},
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_on_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        bump(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_on_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,200 @@
+# app/scripts/device_resolver.py
+"""
+Resolución única de identificadores de device (UID NFC / barcode).
+
+Todos los endpoints de lectores (tarjetas, PCs, devolución masiva, búsqueda
+del dashboard...) pasan por aquí: misma normalización y UNA query que trae
+device + assignment vivo (o el último) + curso. La búsqueda va contra las
+columnas generadas devices.uid_norm / barcode_norm, con índice único
+(sql/004_device_identifier_lookup.sql).
+
+El bucket (pc / usb / card) y los códigos de tipo salen del índice en
+memoria de asset_hierarchy, sin JOIN a asset_types.
+
+Si la BD aún no tiene sql/004 (sin columnas *_norm) se busca con la misma
+expresión calculada en la query: funciona igual, pero sin índice.
+"""
+
+from sqlalchemy import func, or_, select, text
+from sqlalchemy.orm import lazyload
+
+from app.models import Assignment, Course, Device
+from app.scripts.asset_hierarchy import get_hierarchy
+
+LIVE_ASSIGNMENT_STATUSES = ("active", "overdue_1", "overdue_2")
+
+IDENTIFIER_FIELDS = ("uid", "barcode")
+
+_norm_columns = None
+
+
+def normalize_identifier(value) -> str:
+    """
+    Misma regla que las columnas uid_norm / barcode_norm:
+    "04:aa:bb cc" -> "04AABBCC".
+    """
+    if value is None:
+        return ""
+    return "".join(ch for ch in str(value).strip().upper() if ch.isascii() and ch.isalnum())
+
+
+def norm_columns_available(db) -> bool:
+    """¿Tiene devices las columnas uid_norm / barcode_norm? (se mira una vez por proceso)"""
+    global _norm_columns
+    if _norm_columns is None:
+        try:
+            _norm_columns = db.execute(
+                text(
+                    "SELECT count(*) FROM information_schema.columns "
+                    "WHERE table_schema = current_schema() AND table_name = 'devices' "
+                    "AND column_name IN ('uid_norm', 'barcode_norm')"
+                )
+            ).scalar() == 2
+        except Exception:
+            db.rollback()
+            _norm_columns = False
+    return _norm_columns
+
+
+def identifier_column(db, field: str):
+    """
+    Columna normalizada de `field` ("uid" / "barcode"): la generada si existe
+    (con índice único) o la misma regla como expresión.
+    """
+    if norm_columns_available(db):
+        return getattr(Device, f"{field}_norm")
+    raw = getattr(Device, field)
+    return func.nullif(func.regexp_replace(func.upper(raw), "[^A-Z0-9]", "", "g"), "")
+
+
+class ResolvedDevice:
+    """Resultado de resolve_devices() para un identificador."""
+
+    __slots__ = (
+        "key", "matched_by", "device", "assignment", "course",
+        "bucket", "asset_type_code", "asset_parent_code",
+    )
+
+    def __init__(self, key, matched_by, device, assignment, course, hierarchy):
+        self.key = key
+        self.matched_by = matched_by
+        self.device = device
+        self.assignment = assignment
+        self.course = course
+
+        info = hierarchy.by_id.get(device.asset_type_id)
+        parent = hierarchy.by_id.get(info.parent_id) if info and info.parent_id else None
+        self.bucket = hierarchy.bucket(device.asset_type_id)
+        self.asset_type_code = info.code if info else None
+        self.asset_parent_code = parent.code if parent else None
+
+    @property
+    def is_live(self) -> bool:
+        a = self.assignment
+        return bool(
+            a is not None
+            and a.released_at is None
+            and (a.status or "") in LIVE_ASSIGNMENT_STATUSES
+        )
+
+    def __repr__(self):
+        return f"<ResolvedDevice {self.key!r} device_id={self.device.id} by={self.matched_by}>"
+
+
+def family_type_ids(family: str, hierarchy=None) -> list[int]:
+    """Subtipos ACTIVOS de una raíz (el padre puede estar inactivo)."""
+    hierarchy = hierarchy or get_hierarchy()
+    return sorted(
+        tid for tid in hierarchy.family(family)
+        if hierarchy.by_id[tid].active
+    )
+
+
+def resolve_devices(
+    db,
+    identifiers,
+    *,
+    fields=IDENTIFIER_FIELDS,
+    family: str | None = None,
+    live_only: bool = True,
+    active_only: bool = False,
+) -> dict[str, ResolvedDevice]:
+    """
+    Resuelve muchos identificadores en UNA query.
+
+    - fields: columnas a mirar y su prioridad si un identificador casa con
+      dos devices distintos (p.ej. ("barcode", "uid") para PCs).
+    - family: limita a una raíz de la jerarquía (COMPUTER / USB / CARD) con
+      el subtipo activo.
+    - live_only: assignment vivo (released_at NULL y estado activo/overdue);
+      si es False, el último assignment que haya tenido el device.
+    - active_only: sólo devices activos.
+
+    Devuelve {identificador_normalizado: ResolvedDevice}. Los que no aparecen
+    no existen (o no pasan los filtros).
+    """
+    keys = {normalize_identifier(i) for i in (identifiers or ())}
+    keys.discard("")
+    fields = tuple(f for f in fields if f in IDENTIFIER_FIELDS)
+    if not keys or not fields:
+        return {}
+
+    hierarchy = get_hierarchy()
+
+    columns = {f: identifier_column(db, f) for f in IDENTIFIER_FIELDS}
+    key_list = sorted(keys)
+
+    # Assignment elegido por device (subquery correlada: usa
+    # ix_assignments_device_assigned_at y sigue siendo una sola ida a la BD).
+    pick = select(Assignment.id).where(Assignment.device_id == Device.id)
+    if live_only:
+        pick = pick.where(
+            Assignment.released_at.is_(None),
+            Assignment.status.in_(LIVE_ASSIGNMENT_STATUSES),
+        )
+    pick = (
+        pick.order_by(Assignment.assigned_at.desc(), Assignment.id.desc())
+        .limit(1)
+        .correlate(Device)
+        .scalar_subquery()
+    )
+
+    # Las claves vienen en la misma fila (uid_norm / barcode_norm son deferred)
+    query = (
+        db.query(
+            Device, Assignment, Course,
+            columns["uid"].label("uid_key"), columns["barcode"].label("barcode_key"),
+        )
+        .outerjoin(Assignment, Assignment.id == pick)
+        .outerjoin(Course, Course.id == Assignment.course_id)
+        .options(lazyload(Course.asset_requirements))
+        .filter(or_(*[columns[f].in_(key_list) for f in fields]))
+    )
+
+    if family:
+        type_ids = family_type_ids(family, hierarchy)
+        if not type_ids:
+            return {}
+        query = query.filter(Device.asset_type_id.in_(type_ids))
+
+    if active_only:
+        query = query.filter(Device.active.is_(True))
+
+    rows = query.all()
+
+    out: dict[str, ResolvedDevice] = {}
+    for field in fields:
+        for device, assignment, course, uid_key, barcode_key in rows:
+            key = uid_key if field == "uid" else barcode_key
+            if key in keys and key not in out:
+                out[key] = ResolvedDevice(key, field, device, assignment, course, hierarchy)
+
+    return out
+
+
+def resolve_device(db, identifier, **kwargs) -> ResolvedDevice | None:
+    """Atajo para un solo identificador (mismos filtros que resolve_devices)."""
+    key = normalize_identifier(identifier)
+    if not key:
+        return None
+    return resolve_devices(db, [key], **kwargs).get(key)
@@ -0,0 +1,92 @@
+# app/scripts/exports.py
+"""
+Exportaciones CSV / XLSX en streaming (memoria constante).
+
+- iter_query(): abre su propia SessionLocal y recorre la query con
+  yield_per (cursor de servidor en PostgreSQL). La sesión vive lo que dura
+  la iteración y se cierra aunque el cliente corte la descarga.
+- stream_csv(): Response con generador; el primer bloque sale en cuanto
+  llega el primer chunk de la BD.
+- export_xlsx(): openpyxl en modo write-only volcando a un fichero temporal.
+  XLSX es un zip, así que no se puede emitir hasta cerrarlo; pero la memoria
+  no crece con el número de filas.
+
+Los _*_rows() de cada blueprint son generadores (cabecera + filas).
+"""
+
+import csv
+import os
+import tempfile
+
+from flask import Response, send_file, stream_with_context
+from openpyxl import Workbook
+
+from app.db import SessionLocal
+
+EXPORT_CHUNK_SIZE = int(os.getenv("TAMS_EXPORT_CHUNK_SIZE", "1000"))
+CSV_FLUSH_ROWS = 500
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def iter_query(build_query, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Generador de objetos ORM de build_query(db), por chunks.
+    No abre la sesión hasta la primera iteración.
+    """
+    db = SessionLocal()
+    try:
+        yield from build_query(db).yield_per(chunk_size)
+    finally:
+        db.close()
+
+
+class _Echo:
+    """Pseudo-fichero para csv.writer: devuelve la línea en vez de guardarla."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, filename: str) -> Response:
+    writer = csv.writer(_Echo())
+
+    def generate():
+        buf = []
+        for row in rows:
+            buf.append(writer.writerow(row))
+            if len(buf) >= CSV_FLUSH_ROWS:
+                yield "".join(buf)
+                buf = []
+        if buf:
+            yield "".join(buf)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+def export_xlsx(rows, filename: str, sheet_title: str):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_title)
+
+    for row in rows:
+        ws.append(row)
+
+    # TemporaryFile se borra al cerrarse (send_file lo cierra al terminar)
+    output = tempfile.TemporaryFile(suffix=".xlsx")
+    try:
+        wb.save(output)
+        output.seek(0)
+    except Exception:
+        output.close()
+        raise
+
+    return send_file(
+        output,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name=filename,
+    )
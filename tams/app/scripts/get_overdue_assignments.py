@@ -64,16 +64,6 @@ def get_cards_vs_trainees_alerts(db, managed_by: str | None = None):
             "type": "cards_missing" if diff > 0 else "cards_extra",
             "responsible": getattr(course, "responsible", None),
         })
-        
-    rows = (
-    db.query(Assignment.id, Assignment.status, Assignment.released_at, Device.id, AssetType.code, AssetType.show_in_calendar)
-    .join(Device, Device.id == Assignment.device_id)
-    .outerjoin(AssetType, AssetType.id == Device.asset_type_id)
-    .filter(Assignment.course_id == 42)
-        .all()
-    )
-
-    print("DEBUG ASSIGNMENTS course=42:", rows)
 
     return alerts
 
@@ -86,8 +76,8 @@ def get_overdue_course_alerts(db, managed_by: str | None = None):
     - SOLO devices cuyo AssetType.show_in_calendar=True
     - Si managed_by != None, filtra por AssetType.managed_by_department == managed_by
 
-    Además:
-      - Si overdue_2, marca los devices asignados como 'lost' (si estaban 'assigned').
+    Solo lectura: NO cambia estados. El paso overdue_2 -> device 'lost'
+    lo hace el job app/scripts/auto_lost_overdue.py.
     """
     today = date.today()
 
@@ -128,13 +118,7 @@ def get_overdue_course_alerts(db, managed_by: str | None = None):
         days_late = data["days_late"]
         devices = data["devices"]
 
-        if days_late <= OVERDUE_7_DAYS:
-            alert_type = "overdue_1"
-        else:
-            alert_type = "overdue_2"
-            for d in devices:
-                if getattr(d, "status", None) == "assigned":
-                    d.status = "lost"
+        alert_type = "overdue_1" if days_late <= OVERDUE_7_DAYS else "overdue_2"
 
         alerts.append({
             "type": alert_type,
@@ -1,10 +1,13 @@
-from sqlalchemy import func
-from app.models import CourseAssetRequirement, AssetType, Assignment,Device
+from sqlalchemy import func, or_, select
+from app.models import CourseAssetRequirement, AssetType, Assignment,Device, Course, CourseDeviceMovement
+from app.scripts.asset_hierarchy import PC_ROOT_CODE, USB_ROOT_CODE, get_hierarchy
 
 ITC_DEPT = "ITC support"
 PC_CODE = "LAPTOP"
 PENDRIVE_CODE = "PENDRIVE"
 
+PENDING_ASSIGNMENT_STATUSES = ("active", "overdue_1", "overdue_2")
+
 def get_itc_requirements_by_course(db, course_ids):
     """
     requirements ITC por curso, usando CourseAssetRequirement + AssetType.
@@ -81,4 +84,119 @@ def count_assigned_laptops_by_course(db, course_ids):
     out = {cid: 0 for cid in course_ids}
     for r in rows:
         out[r.course_id] = int(r.cnt or 0)
-    return out
\ No newline at end of file
+    return out
+
+
+def itc_asset_type_ids(db) -> dict[str, set[int]]:
+    """
+    IDs de AssetType por raíz ITC, resueltos por jerarquía (no por IDs fijos):
+      {"COMPUTER": {root + descendientes}, "USB": {root + descendientes}}
+
+    No filtra por active: un subtipo desactivado puede seguir teniendo
+    requirements/assignments históricos que hay que contar.
+    """
+    h = get_hierarchy()
+    return {
+        PC_ROOT_CODE: set(h.family(PC_ROOT_CODE)),
+        USB_ROOT_CODE: set(h.family(USB_ROOT_CODE)),
+    }
+
+
+def get_itc_calendar_stats(db, pc_type_ids, course_ids=None):
+    """
+    Estadísticas de PCs para el calendario ITC en UNA query (CTEs):
+
+      out[course_id] = (assigned, required, pending, returned_on_end)
+
+      - assigned:        movimientos 'assigned' pc no cancelados (histórico)
+      - required:        sum(quantity) de requirements activos de tipo PC
+      - pending:         assignments vivos con device de tipo PC
+      - returned_on_end: movimientos 'returned' pc en el mismo día que end_date
+
+    course_ids=None -> todos los cursos. Sólo se devuelven cursos con algún valor.
+    """
+    if course_ids is not None and not course_ids:
+        return {}
+
+    pc_type_ids = list(pc_type_ids or ())
+
+    def scoped(stmt, course_col):
+        if course_ids is None:
+            return stmt
+        return stmt.where(course_col.in_(course_ids))
+
+    M = CourseDeviceMovement
+
+    assigned = scoped(
+        select(M.course_id.label("course_id"), func.count(M.id).label("n"))
+        .where(
+            M.cancelled_at.is_(None),
+            M.asset_kind == "pc",
+            M.movement_type == "assigned",
+        ),
+        M.course_id,
+    ).group_by(M.course_id).cte("assigned")
+
+    required = scoped(
+        select(
+            CourseAssetRequirement.course_id.label("course_id"),
+            func.sum(CourseAssetRequirement.quantity).label("n"),
+        )
+        .where(
+            CourseAssetRequirement.active.is_(True),
+            CourseAssetRequirement.asset_type_id.in_(pc_type_ids),
+            CourseAssetRequirement.quantity > 0,
+        ),
+        CourseAssetRequirement.course_id,
+    ).group_by(CourseAssetRequirement.course_id).cte("required")
+
+    pending = scoped(
+        select(Assignment.course_id.label("course_id"), func.count(Assignment.id).label("n"))
+        .join(Device, Assignment.device_id == Device.id)
+        .where(
+            Assignment.status.in_(PENDING_ASSIGNMENT_STATUSES),
+            Device.asset_type_id.in_(pc_type_ids),
+        ),
+        Assignment.course_id,
+    ).group_by(Assignment.course_id).cte("pending")
+
+    returned_on_end = scoped(
+        select(M.course_id.label("course_id"), func.count(M.id).label("n"))
+        .join(Course, M.course_id == Course.id)
+        .where(
+            M.cancelled_at.is_(None),
+            M.asset_kind == "pc",
+            M.movement_type == "returned",
+            Course.end_date.isnot(None),
+            func.date(M.movement_at) == Course.end_date,
+        ),
+        M.course_id,
+    ).group_by(M.course_id).cte("returned_on_end")
+
+    stmt = (
+        select(
+            Course.id,
+            func.coalesce(assigned.c.n, 0),
+            func.coalesce(required.c.n, 0),
+            func.coalesce(pending.c.n, 0),
+            func.coalesce(returned_on_end.c.n, 0),
+        )
+        .outerjoin(assigned, assigned.c.course_id == Course.id)
+        .outerjoin(required, required.c.course_id == Course.id)
+        .outerjoin(pending, pending.c.course_id == Course.id)
+        .outerjoin(returned_on_end, returned_on_end.c.course_id == Course.id)
+        .where(
+            or_(
+                assigned.c.n.isnot(None),
+                required.c.n.isnot(None),
+                pending.c.n.isnot(None),
+                returned_on_end.c.n.isnot(None),
+            )
+        )
+    )
+    stmt = scoped(stmt, Course.id)
+
+    out = {}
+    for cid, n_assigned, n_required, n_pending, n_returned in db.execute(stmt):
+        out[int(cid)] = (int(n_assigned), int(n_required), int(n_pending), int(n_returned))
+    return out
@@ -1,10 +1,14 @@
 # app/scripts/movements.py
 
 from typing import Optional, Any
+from sqlalchemy import event
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 import app.models as models
+from app.scripts import audit_writer
+
+_PENDING_KEY = "tams_pending_movements"
 
 
 def log_movement(
@@ -20,7 +24,7 @@ def log_movement(
     user_agent: Optional[str] = None,
     success: bool = True,
 ):
-    movement = models.Movements(
+    values = dict(
         user_id=user_id,
         entity_type=entity_type,
         entity_id=entity_id,
@@ -33,7 +37,26 @@ def log_movement(
         created_at=datetime.utcnow(),
     )
 
+    if audit_writer.AUDIT_ASYNC:
+        # Modo buffer: se encola al hacer COMMIT la sesión (ver audit_writer.py)
+        db.info.setdefault(_PENDING_KEY, []).append(values)
+        return models.Movements(**values)
+
+    movement = models.Movements(**values)
+
     db.add(movement)
     # OJO: aquí NO hace falta commit si lo vas a hacer en la vista
     # lo dejo sin commit y sin refresh
     return movement
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_committed_movements(session):
+    rows = session.info.pop(_PENDING_KEY, None)
+    if rows:
+        audit_writer.enqueue(rows)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_movements(session):
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,45 @@
+# app/scripts/movements_partitions.py
+"""
+Job mensual: crea por adelantado las particiones de movements
+(ver sql/002_movements_keyset_and_partitions.sql).
+
+Si un mes no tiene partición, sus filas caen en movements_default y luego
+no se puede crear la partición de ese mes sin moverlas; por eso conviene
+ir siempre unos meses por delante.
+
+Uso (cron / tarea programada):
+    python -m app.scripts.movements_partitions
+"""
+
+from sqlalchemy import text
+
+from app.db import SessionLocal
+
+MONTHS_AHEAD = 3
+
+
+def run(months_ahead: int = MONTHS_AHEAD) -> dict:
+    db = SessionLocal()
+    try:
+        partitioned = db.execute(
+            text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'movements'::regclass")
+        ).scalar()
+        if not partitioned:
+            return {"ok": True, "partitioned": False, "created": 0}
+
+        created = db.execute(
+            text("SELECT tams_ensure_movements_partitions(:months)"),
+            {"months": months_ahead},
+        ).scalar()
+        db.commit()
+        return {"ok": True, "partitioned": True, "created": int(created or 0)}
+
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    print(run())
@@ -0,0 +1,108 @@
+# app/scripts/pg_change_listener.py
+"""
+LISTEN de PostgreSQL para propagar la versión de datos entre procesos.
+
+Un hilo daemon mantiene una conexión dedicada (fuera del pool) escuchando
+data_version.NOTIFY_CHANNEL. Cada notificación de otro worker sube la
+versión local de esas tablas, así que los cachés (alertas, calendario...)
+y los streams SSE de este proceso se enteran igual que de un COMMIT propio.
+
+Si la conexión se cae, se reconecta con backoff y se sube todo
+(bump_all), porque durante el corte se han podido perder eventos.
+"""
+
+import logging
+import select
+import threading
+import time
+
+from app.scripts import data_version
+
+log = logging.getLogger(__name__)
+
+_thread = None
+_thread_lock = threading.Lock()
+_deferred_engine = None
+
+POLL_TIMEOUT_SECONDS = 30
+MAX_BACKOFF_SECONDS = 60
+
+
+def start_pg_listener(engine, *, defer: bool = False):
+    """
+    Arranca el hilo listener (una vez por proceso) y activa el NOTIFY en COMMIT.
+
+    defer=True (app precargada en el maestro de gunicorn): sólo se apunta el
+    engine; cada worker lo arranca tras el fork con start_deferred(), porque
+    los hilos no sobreviven al fork.
+    """
+    global _thread, _deferred_engine
+    with _thread_lock:
+        if _thread is not None:
+            return _thread
+
+        data_version.enable_pg_notify(True)
+
+        if defer:
+            _deferred_engine = engine
+            return None
+
+        _thread = threading.Thread(
+            target=_listen_forever,
+            args=(engine,),
+            name="tams-pg-listener",
+            daemon=True,
+        )
+        _thread.start()
+        return _thread
+
+
+def start_deferred():
+    """Post-fork: arranca el listener que start_pg_listener(defer=True) dejó pendiente."""
+    if _deferred_engine is not None:
+        return start_pg_listener(_deferred_engine)
+    return None
+
+
+def _listen_forever(engine):
+    backoff = 1
+    first = True
+
+    while True:
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            # conexión propia: no vuelve al pool con un LISTEN colgando
+            raw.detach()
+
+            conn = raw.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {data_version.NOTIFY_CHANNEL}")
+
+            if not first:
+                data_version.bump_all()
+            first = False
+            backoff = 1
+
+            while True:
+                ready, _, _ = select.select([conn], [], [], POLL_TIMEOUT_SECONDS)
+                if not ready:
+                    continue
+
+                conn.poll()
+                while conn.notifies:
+                    note = conn.notifies.pop(0)
+                    data_version.apply_remote(note.payload)
+
+        except Exception as e:
+            log.warning("pg change listener: %s (reintento en %ss)", e, backoff)
+            time.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+        finally:
+            if raw is not None:
+                try:
+                    raw.close()
+                except Exception:
+                    pass
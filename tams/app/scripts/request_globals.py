@@ -0,0 +1,52 @@
+# app/scripts/request_globals.py
+"""
+Globals de plantilla perezosos y cacheados por request.
+
+Los context processors devuelven lazy_global(...) en vez del valor: es un
+LocalProxy que sólo calcula cuando una plantilla lo lee de verdad
+({{ x }}, x.notice, x|int, {% if x %}...), como mucho UNA vez por request,
+y siempre sobre la misma SessionLocal compartida (request_db()).
+
+Así un fragmento que no pinta badges (p.ej. _alerts_accordion.html) o el
+login no pagan por ellos.
+"""
+
+from flask import g
+from werkzeug.local import LocalProxy
+
+from app.db import SessionLocal
+
+_DB_KEY = "_tams_request_db"
+_CACHE_KEY = "_tams_lazy_globals"
+
+
+def request_db():
+    """SessionLocal compartida por los globals de la request actual."""
+    db = g.get(_DB_KEY)
+    if db is None:
+        db = SessionLocal()
+        setattr(g, _DB_KEY, db)
+    return db
+
+
+def close_request_db(exc=None):
+    db = g.pop(_DB_KEY, None)
+    if db is not None:
+        db.close()
+
+
+def request_cached(name: str, compute):
+    """Valor de compute(db) calculado como mucho una vez por request."""
+    cache = g.setdefault(_CACHE_KEY, {})
+    if name not in cache:
+        cache[name] = compute(request_db())
+    return cache[name]
+
+
+def lazy_global(name: str, compute):
+    """Proxy perezoso para devolver desde un context processor."""
+    return LocalProxy(lambda: request_cached(name, compute))
+
+
+def init_app(app):
+    app.teardown_appcontext(close_request_db)
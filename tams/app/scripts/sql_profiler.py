@@ -0,0 +1,186 @@
+# app/scripts/sql_profiler.py
+"""
+Instrumentación SQL por request (opt-in: TAMS_SQL_PROFILE=1).
+
+Cuelga de before/after_cursor_execute del engine único (app.db.engine), así
+que ve tanto SessionLocal como la sesión de Flask-SQLAlchemy. Por request
+apunta:
+- número de queries y tiempo total en BD
+- las N sentencias más lentas
+- sentencias repetidas (mismo SQL, distintos parámetros) >= umbral:
+  sospechosas de N+1 (p.ej. un lazy load dentro de un bucle)
+
+Y lo publica:
+- cabecera Server-Timing (db, app, n+1) -> pestaña Timing de las devtools
+- una línea JSON en el logger "tams.sql_profile" si la request es lenta
+  (TAMS_SLOW_REQUEST_MS) o tiene sospechosos de N+1
+
+Sólo cuenta lo que corre en el hilo de la request (g): el writer de
+auditoría, el listener de NOTIFY, etc. quedan fuera. Las respuestas en
+streaming (SSE) dejan de medirse al devolver las cabeceras.
+"""
+
+import json
+import logging
+import os
+import time
+
+from flask import g, has_app_context, request
+from sqlalchemy import event
+
+SQL_PROFILE = os.getenv("TAMS_SQL_PROFILE", "0") == "1"
+SLOW_REQUEST_MS = float(os.getenv("TAMS_SLOW_REQUEST_MS", "500"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("TAMS_SQL_NPLUS1_THRESHOLD", "5"))
+SLOWEST_KEEP = int(os.getenv("TAMS_SQL_SLOWEST_KEEP", "5"))
+
+_G_KEY = "_tams_sql_profile"
+_CONN_KEY = "tams_sql_profile_start"
+_SQL_PREVIEW_CHARS = 300
+
+log = logging.getLogger("tams.sql_profile")
+
+
+class RequestProfile:
+    """Contadores SQL de una request."""
+
+    __slots__ = ("started", "queries", "db_seconds", "by_statement", "slowest")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.by_statement: dict[str, list] = {}  # sql -> [veces, segundos]
+        self.slowest: list[tuple[float, str]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.queries += 1
+        self.db_seconds += seconds
+
+        entry = self.by_statement.get(statement)
+        if entry is None:
+            self.by_statement[statement] = [1, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+
+        slowest = self.slowest
+        if len(slowest) < SLOWEST_KEEP or seconds > slowest[-1][0]:
+            slowest.append((seconds, statement))
+            slowest.sort(key=lambda x: x[0], reverse=True)
+            del slowest[SLOWEST_KEEP:]
+
+    def n_plus_one(self) -> list[tuple[str, int, float]]:
+        """(sql, veces, segundos) de las sentencias repetidas >= umbral."""
+        out = [
+            (sql, n, secs)
+            for sql, (n, secs) in self.by_statement.items()
+            if n >= N_PLUS_ONE_THRESHOLD
+        ]
+        out.sort(key=lambda x: x[1], reverse=True)
+        return out
+
+
+def current_profile() -> RequestProfile | None:
+    if not has_app_context():
+        return None
+    return g.get(_G_KEY)
+
+
+def _preview(sql: str) -> str:
+    sql = " ".join((sql or "").split())
+    if len(sql) > _SQL_PREVIEW_CHARS:
+        return sql[:_SQL_PREVIEW_CHARS] + "…"
+    return sql
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is None:
+        return
+    conn.info.setdefault(_CONN_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get(_CONN_KEY)
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+
+    profile = current_profile()
+    if profile is not None:
+        profile.record(statement, elapsed)
+
+
+def _handle_error(exception_context):
+    # la sentencia falló: no habrá after_cursor_execute para este inicio
+    conn = exception_context.connection
+    starts = conn.info.get(_CONN_KEY) if conn is not None else None
+    if starts:
+        starts.pop()
+
+
+def _server_timing(profile: RequestProfile, total_ms: float, suspects) -> str:
+    db_ms = profile.db_seconds * 1000.0
+    parts = [
+        f'db;dur={db_ms:.1f};desc="{profile.queries} queries"',
+        f'app;dur={max(total_ms - db_ms, 0.0):.1f}',
+        f'total;dur={total_ms:.1f}',
+    ]
+    if suspects:
+        worst = suspects[0][1]
+        parts.append(f'n1;desc="{len(suspects)} repeated statements (max x{worst})"')
+    return ", ".join(parts)
+
+
+def _start_request():
+    setattr(g, _G_KEY, RequestProfile())
+
+
+def _finish_request(resp):
+    profile = g.pop(_G_KEY, None)
+    if profile is None:
+        return resp
+
+    total_ms = (time.perf_counter() - profile.started) * 1000.0
+    suspects = profile.n_plus_one()
+
+    resp.headers["Server-Timing"] = _server_timing(profile, total_ms, suspects)
+
+    if total_ms >= SLOW_REQUEST_MS or suspects:
+        log.warning(json.dumps({
+            "event": "slow_request" if total_ms >= SLOW_REQUEST_MS else "n_plus_one",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": resp.status_code,
+            "total_ms": round(total_ms, 1),
+            "db_ms": round(profile.db_seconds * 1000.0, 1),
+            "queries": profile.queries,
+            "slowest": [
+                {"ms": round(secs * 1000.0, 1), "sql": _preview(sql)}
+                for secs, sql in profile.slowest
+            ],
+            "n_plus_one": [
+                {"count": n, "ms": round(secs * 1000.0, 1), "sql": _preview(sql)}
+                for sql, n, secs in suspects
+            ],
+        }, ensure_ascii=False))
+
+    return resp
+
+
+def _drop_request(exc=None):
+    g.pop(_G_KEY, None)
+
+
+def init_app(app, engine):
+    """Engancha los listeners si TAMS_SQL_PROFILE=1 (si no, coste cero)."""
+    if not SQL_PROFILE:
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_drop_request)
@@ -0,0 +1,59 @@
+# app/scripts/text_search.py
+"""
+Búsqueda libre (?q=) indexada con pg_trgm.
+
+En vez de un OR de ILIKE por columna (seq scan), cada tabla tiene una
+expresión única:
+
+    tams_search_text(col1::text, col2::text, ...) ILIKE '%term%'
+
+respaldada por un índice GIN gin_trgm_ops sobre esa misma expresión
+(sql/003_trigram_search.sql). Las expresiones de aquí y las del SQL
+TIENEN que coincidir columna a columna y en el mismo orden.
+
+Si la función no existe en la BD (migración sin aplicar), search_available()
+devuelve False y los build_*_query siguen con el OR de ILIKE de siempre.
+"""
+
+from sqlalchemy import Text, cast, func, text
+
+import app.models as models
+
+SEARCH_FUNCTION = "tams_search_text"
+
+_available = None
+
+
+def search_available(db) -> bool:
+    """¿Existe tams_search_text() en esta BD? (se mira una vez por proceso)"""
+    global _available
+    if _available is None:
+        try:
+            _available = bool(
+                db.execute(
+                    text("SELECT to_regprocedure('tams_search_text(text[])') IS NOT NULL")
+                ).scalar()
+            )
+        except Exception:
+            db.rollback()
+            _available = False
+    return _available
+
+
+def search_text(*columns):
+    return getattr(func, SEARCH_FUNCTION)(*[cast(c, Text) for c in columns])
+
+
+def movements_search_text():
+    M = models.Movements
+    return search_text(M.action, M.entity_type, M.description, M.user_agent, M.entity_id)
+
+
+def courses_search_text():
+    C = models.Course
+    return search_text(C.course, C.name, C.notes)
+
+
+def devices_search_text():
+    D = models.Device
+    return search_text(D.name, D.uid, D.barcode, D.status, D.notes)
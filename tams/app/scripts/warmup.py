@@ -0,0 +1,141 @@
+# app/scripts/warmup.py
+"""
+Calentamiento en segundo plano tras create_app().
+
+La primera petición de cada worker no debería pagar:
+- abrir conexiones del pool (TAMS_WARMUP_CONNECTIONS)
+- construir el índice de AssetType (get_hierarchy)
+- compilar las plantillas Jinja (con bytecode cache en disco sólo se
+  cargan, ver configure_jinja_cache)
+
+Corre en un hilo daemon; si algo falla se registra y se sigue (la petición
+que lo necesite lo hará en línea, como antes). Con gunicorn --preload se
+arranca en cada worker tras el fork (start_deferred), no en el maestro.
+"""
+
+import logging
+import os
+import stat
+import threading
+import time
+
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+
+log = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("TAMS_WARMUP", "1") == "1"
+WARMUP_CONNECTIONS = int(os.getenv("TAMS_WARMUP_CONNECTIONS", "2"))
+# Sin definir: directorio por usuario de Jinja (<tmp>/_jinja2-cache-<uid>,
+# 0700, comprueba el dueño). Vacío: sin caché. Ruta: se usa si es nuestra
+# y nadie más puede escribir en ella.
+JINJA_CACHE_DIR = os.getenv("TAMS_JINJA_CACHE_DIR")
+
+_deferred_app = None
+
+
+def _check_cache_dir(path: str):
+    """
+    El bytecode se carga y ejecuta: un directorio que pueda escribir otro
+    usuario local es ejecución de código. Se crea 0700 y, si ya existía,
+    tiene que ser nuestro y no escribible por grupo/otros.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):  # Windows: sin dueño/permisos POSIX
+        return
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode):
+        raise OSError(f"{path} is not a directory")
+    if st.st_uid != os.getuid():
+        raise OSError(f"{path} is owned by uid {st.st_uid}")
+    if st.st_mode & 0o022:
+        raise OSError(f"{path} is writable by group/others")
+
+
+def configure_jinja_cache(app):
+    """
+    Bytecode cache de Jinja en disco (compartido entre workers y reinicios).
+    Hay que llamarlo antes del primer acceso a app.jinja_env.
+    """
+    if JINJA_CACHE_DIR == "":
+        return
+    try:
+        if JINJA_CACHE_DIR is None:
+            cache = FileSystemBytecodeCache()
+        else:
+            _check_cache_dir(JINJA_CACHE_DIR)
+            cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    except (OSError, RuntimeError) as e:
+        log.warning("Jinja bytecode cache disabled (%s): %s", JINJA_CACHE_DIR or "default", e)
+        return
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": cache}
+
+
+def _warm_pool():
+    from app.db import engine
+
+    conns = []
+    try:
+        for _ in range(max(WARMUP_CONNECTIONS, 0)):
+            conn = engine.connect()
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+    return len(conns)
+
+
+def _warm_hierarchy():
+    from app.scripts.asset_hierarchy import get_hierarchy
+    return len(get_hierarchy().by_id)
+
+
+def _warm_templates(app):
+    names = [n for n in app.jinja_env.list_templates() if n.endswith(".html")]
+    for name in names:
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            # una línea por plantilla rota: sin traceback, que se repetiría
+            # en cada arranque de worker
+            app.logger.warning("warmup: template %s failed to compile: %s", name, e)
+    return len(names)
+
+
+def _run(app):
+    t0 = time.perf_counter()
+    done = {}
+    for label, step in (
+        ("connections", _warm_pool),
+        ("asset_types", _warm_hierarchy),
+        ("templates", lambda: _warm_templates(app)),
+    ):
+        try:
+            with app.app_context():
+                done[label] = step()
+        except Exception as e:
+            done[label] = f"failed: {e}"
+    ms = (time.perf_counter() - t0) * 1000.0
+    app.logger.info("warmup done in %.0f ms (pid %s): %s", ms, os.getpid(), done)
+
+
+def start_warmup(app, *, defer: bool = False):
+    """Lanza el calentamiento (o lo deja pendiente para después del fork)."""
+    global _deferred_app
+    if not WARMUP_ENABLED:
+        return None
+    if defer:
+        _deferred_app = app
+        return None
+
+    thread = threading.Thread(target=_run, args=(app,), name="tams-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def start_deferred():
+    """Post-fork: arranca el calentamiento que start_warmup(defer=True) dejó pendiente."""
+    if _deferred_app is not None:
+        return start_warmup(_deferred_app)
+    return None
@@ -11,17 +11,17 @@ from flask import (
 )
 from . import bp
 from app.db import SessionLocal
+from app.scripts.exports import iter_query, stream_csv, export_xlsx
 import app.models as models
 from sqlalchemy import or_
 import bcrypt
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from flask_login import login_required, current_user
 from app.scripts import log_movement
+from app.scripts.device_resolver import resolve_device
 from app.models import User
 
-from io import StringIO, BytesIO
-import csv
-from openpyxl import Workbook
+from io import BytesIO
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -700,38 +700,22 @@ def read_uid_once():
         )
     db = SessionLocal()
     try:
-        device = db.query(models.Device).filter(models.Device.uid == uid).first()
+        resolved = resolve_device(db, uid, fields=("uid",))
+        device = resolved.device if resolved else None
+
         active_loan = None
-        if device:
-            a = (
-                db.query(models.Assignment)
-                .join(models.Course, models.Assignment.course_id == models.Course.id)
-                .filter(
-                    models.Assignment.device_id == device.id,
-                    models.Assignment.status == "active",
-                    models.Assignment.released_at.is_(None),
-                )
-                .order_by(models.Assignment.assigned_at.desc())
-                .first()
-            )
+        if resolved and resolved.assignment:
+            a = resolved.assignment
+            # “course code” = campo Course.course (en tu modelo)
+            active_loan = {
+                "assignment_id": a.id,
+                "course_id": a.course_id,
+                "course_code": (resolved.course.course or "").strip() if resolved.course else "",
+            }
+
+        asset_type_code = resolved.asset_type_code if resolved else None
+        parent_code = resolved.asset_parent_code if resolved else None
 
-            if a:
-                # “course code” = campo Course.course (en tu modelo)
-                active_loan = {
-                    "assignment_id": a.id,
-                    "course_id": a.course_id,
-                    "course_code": (a.course.course or "").strip() if a.course else "",
-                }
-
-        asset_type_code = None
-        parent_code = None
-        if device and device.asset_type:
-            asset_type_code = device.asset_type.code
-            parent_code = device.asset_type.parent.code if device.asset_type.parent else None
-        print("UID", uid, "device", device.id if device else None,
-            "asset_type_id", getattr(device, "asset_type_id", None) if device else None,
-            "asset_type_code", asset_type_code, "parent_code", parent_code,
-            "status", device.status if device else None)
         return jsonify({
             "success": True,
             "uid": uid,
@@ -796,18 +780,15 @@ def _user_rows(users):
     """
     Filas comunes para exportar usuarios.
     """
-    rows = []
-    rows.append(
-        [
-            "ID",
-            "Name",
-            "Surname",
-            "Username",
-            "Email",
-            "Role",
-            "Active",
-        ]
-    )
+    yield [
+        "ID",
+        "Name",
+        "Surname",
+        "Username",
+        "Email",
+        "Role",
+        "Active",
+    ]
 
     for u in users:
         if u.active is True:
@@ -817,56 +798,23 @@ def _user_rows(users):
         else:
             active_str = ""
 
-        rows.append(
-            [
-                u.id,
-                u.name or "",
-                u.surname or "",
-                u.username or "",
-                u.email or "",
-                u.role or "",
-                active_str,
-            ]
-        )
-
-    return rows
+        yield [
+            u.id,
+            u.name or "",
+            u.surname or "",
+            u.username or "",
+            u.email or "",
+            u.role or "",
+            active_str,
+        ]
 
 
 def _export_users_csv(users):
-    output = StringIO()
-    writer = csv.writer(output)
-
-    for row in _user_rows(users):
-        writer.writerow(row)
-
-    csv_data = output.getvalue()
-    output.close()
-
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=users.csv"},
-    )
+    return stream_csv(_user_rows(users), "users.csv")
 
 
 def _export_users_excel(users):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Users"
-
-    for row in _user_rows(users):
-        ws.append(row)
-
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    return send_file(
-        output,
-        mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        as_attachment=True,
-        download_name="users.xlsx",
-    )
+    return export_xlsx(_user_rows(users), "users.xlsx", "Users")
 
 
 def _export_users_pdf(users):
@@ -888,7 +836,7 @@ def _export_users_pdf(users):
     elements.append(title)
     elements.append(Spacer(1, 12))
 
-    data = _user_rows(users)
+    data = list(_user_rows(users))
     table = Table(data, repeatRows=1)
 
     table_style = TableStyle(
@@ -938,18 +886,14 @@ def export_users():
     page = max(int(request.args.get("page", 1)), 1)
     per_page = int(request.args.get("per_page", 20))
 
-    db = SessionLocal()
-    try:
-        query = build_users_query(db, request.args)
-
-        users = (
-            query.order_by(models.User.id.asc())
+    users = iter_query(
+        lambda db: (
+            build_users_query(db, request.args)
+            .order_by(models.User.id.asc())
             .offset((page - 1) * per_page)
             .limit(per_page)
-            .all()
         )
-    finally:
-        db.close()
+    )
 
     if fmt == "pdf":
         return _export_users_pdf(users)
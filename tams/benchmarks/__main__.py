@@ -0,0 +1,212 @@
+# benchmarks/__main__.py
+"""
+python -m benchmarks generate|run|compare|load|startup   (ver benchmarks/__init__.py)
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def cmd_generate(args):
+    from app.db import engine
+    from benchmarks.generate import generate
+
+    anchor = date.fromisoformat(args.anchor) if args.anchor else None
+    print(f"Generating scale={args.scale} seed={args.seed} into {engine.url.render_as_string(hide_password=True)}")
+    totals = generate(
+        engine,
+        scale=args.scale,
+        seed=args.seed,
+        anchor=anchor,
+        create_schema=args.create_schema,
+        apply_sql=args.apply_sql,
+        sql_dir=ROOT / "sql",
+        allow_any_db=args.allow_any_db,
+    )
+    print(json.dumps(totals, indent=2))
+
+
+def cmd_run(args):
+    # antes de importar la app: sin listener de NOTIFY y, si se pide,
+    # con Server-Timing para contar queries
+    os.environ.setdefault("TAMS_PG_NOTIFY", "0")
+    if args.profile_sql:
+        os.environ["TAMS_SQL_PROFILE"] = "1"
+        os.environ.setdefault("TAMS_SLOW_REQUEST_MS", "1e9")
+
+    from sqlalchemy import func, select
+
+    from app import create_app
+    from app.db import engine
+    from benchmarks.generate import INSERT_ORDER
+    from benchmarks.scenarios import run_all
+
+    app = create_app()
+    app.config["TESTING"] = True
+
+    anchor = date.fromisoformat(args.anchor) if args.anchor else None
+
+    with engine.connect() as conn:
+        row_counts = {
+            name: conn.execute(select(func.count()).select_from(model.__table__)).scalar_one()
+            for name, model in INSERT_ORDER
+        }
+
+    print(f"Running scenarios (repeat={args.repeat}, warmup={args.warmup})")
+    out = run_all(app, repeat=args.repeat, warmup=args.warmup, only=args.only, anchor=anchor)
+
+    report = {
+        "meta": {
+            "label": args.label,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "database": engine.url.render_as_string(hide_password=True),
+            "repeat": args.repeat,
+            "warmup": args.warmup,
+            "sql_profile": bool(args.profile_sql),
+            "row_counts": row_counts,
+            "users": out["users"],
+        },
+        "scenarios": out["scenarios"],
+    }
+
+    payload = json.dumps(report, indent=2, sort_keys=True, default=str)
+    if args.out:
+        Path(args.out).write_text(payload, encoding="utf-8")
+        print(f"Results written to {args.out}")
+    else:
+        print(payload)
+
+
+def cmd_compare(args):
+    base = json.loads(Path(args.base).read_text(encoding="utf-8"))["scenarios"]
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))["scenarios"]
+
+    print(f"{'scenario':55s} {'base ms':>10s} {'new ms':>10s} {'delta':>8s}")
+    worst = 0.0
+    for name in sorted(set(base) | set(new)):
+        b = base.get(name, {}).get("median_ms")
+        n = new.get(name, {}).get("median_ms")
+        if b is None or n is None:
+            print(f"{name:55s} {b if b is not None else '-':>10} {n if n is not None else '-':>10}")
+            continue
+        delta = (n - b) / b * 100.0 if b else 0.0
+        worst = max(worst, delta)
+        flag = "  <-- slower" if delta > args.threshold else ""
+        print(f"{name:55s} {b:>10.1f} {n:>10.1f} {delta:>+7.1f}%{flag}")
+
+    if args.fail_over is not None and worst > args.fail_over:
+        sys.exit(1)
+
+
+def cmd_load(args):
+    from benchmarks.http_load import run_load
+
+    paths = args.path or ["/auth/login"]
+    print(f"Load: {args.url} paths={paths} concurrency={args.concurrency} duration={args.duration}s")
+    result = run_load(
+        args.url, paths,
+        concurrency=args.concurrency, duration=args.duration, cookie=args.cookie,
+    )
+    result["label"] = args.label
+    payload = json.dumps(result, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(payload, encoding="utf-8")
+        print(f"Results written to {args.out}")
+    print(payload)
+
+
+def cmd_startup(args):
+    from benchmarks.startup import run_startup
+
+    print(f"Cold start (repeat={args.repeat})")
+    results = run_startup(repeat=args.repeat, with_db=args.with_db)
+    payload = json.dumps({
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "with_db": args.with_db,
+        },
+        "profiles": results,
+    }, indent=2, sort_keys=True)
+    if args.out:
+        Path(args.out).write_text(payload, encoding="utf-8")
+        print(f"Results written to {args.out}")
+    else:
+        print(payload)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    g = sub.add_parser("generate", help="fill a bench database with synthetic data")
+    g.add_argument("--scale", type=float, default=1.0, help="1, 10, 100 ... (default 1)")
+    g.add_argument("--seed", type=int, default=42)
+    g.add_argument("--anchor", help="YYYY-MM-DD the dates are spread around (default: today)")
+    g.add_argument("--create-schema", action="store_true", help="create_all() the models first")
+    g.add_argument("--apply-sql", action="store_true", help="apply sql/NNN_*.sql after the schema")
+    g.add_argument("--allow-any-db", action="store_true", help="skip the 'bench' database name check")
+    g.set_defaults(func=cmd_generate)
+
+    r = sub.add_parser("run", help="time the scenarios and write JSON")
+    r.add_argument("--repeat", type=int, default=5)
+    r.add_argument("--warmup", type=int, default=1)
+    r.add_argument("--only", action="append", help="substring filter on scenario names (repeatable)")
+    r.add_argument("--anchor", help="YYYY-MM-DD used for the calendar window (default: today)")
+    r.add_argument("--profile-sql", action="store_true", help="record query counts via TAMS_SQL_PROFILE")
+    r.add_argument("--label", default=None)
+    r.add_argument("--out", default=None, help="output JSON path (default: stdout)")
+    r.set_defaults(func=cmd_run)
+
+    c = sub.add_parser("compare", help="compare median times of two result files")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=10.0, help="%% slower to flag (default 10)")
+    c.add_argument("--fail-over", type=float, default=None, help="exit 1 if any scenario is this %% slower")
+    c.set_defaults(func=cmd_compare)
+
+    ld = sub.add_parser("load", help="HTTP throughput against a running server")
+    ld.add_argument("url", help="base URL, e.g. http://127.0.0.1:5000")
+    ld.add_argument("--path", action="append", help="path to request (repeatable, default /auth/login)")
+    ld.add_argument("--concurrency", type=int, default=16)
+    ld.add_argument("--duration", type=float, default=20.0)
+    ld.add_argument("--cookie", default=None, help="Cookie header (session=...) for logged-in pages")
+    ld.add_argument("--label", default=None)
+    ld.add_argument("--out", default=None)
+    ld.set_defaults(func=cmd_load)
+
+    st = sub.add_parser("startup", help="cold start: legacy vs current create_app()")
+    st.add_argument("--repeat", type=int, default=5)
+    st.add_argument("--with-db", action="store_true", help="keep NOTIFY listener and pool warmup")
+    st.add_argument("--out", default=None)
+    st.set_defaults(func=cmd_startup)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,492 @@
+# benchmarks/generate.py
+"""
+Generador determinista de datos TAMS para benchmarks.
+
+Vacía las tablas de TAMS (TRUNCATE ... RESTART IDENTITY) y las rellena con
+ids explícitos, así que la misma semilla + escala + fecha ancla producen
+exactamente los mismos datos. Las fechas de los cursos se reparten
+alrededor de la fecha ancla (por defecto hoy) para que los motores de
+alertas tengan cursos futuros, en curso y recién terminados.
+
+Escala 1x (BASE_COUNTS) ~ un centro pequeño; 10x / 100x multiplican todo.
+
+Sólo trabaja contra bases de datos cuyo nombre contenga "bench", salvo
+--allow-any-db.
+"""
+
+import random
+from datetime import date, datetime, time as dtime, timedelta, timezone
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.engine import make_url
+
+from app.extensions import db as sqla_db, bcrypt
+from app.models import (
+    AlertState,
+    AssetType,
+    Assignment,
+    Course,
+    CourseAssetRequirement,
+    CourseDeviceMovement,
+    CourseRework,
+    Device,
+    Movements,
+    Notification,
+    User,
+)
+
+BASE_COUNTS = {
+    "users": 40,
+    "cards": 1500,
+    "laptops": 250,
+    "desktops": 50,
+    "pendrives": 200,
+    "courses": 300,
+    "notifications_per_course": 2,
+    "alert_state_ratio": 0.3,
+    "rework_ratio": 0.1,
+}
+
+INSERT_CHUNK = 5000
+
+# Raíz -> hijos (code, name). Mismos códigos que usa la app.
+ASSET_TREE = (
+    ("CARD", "Cards", "TCO", True, False, (
+        ("CARD_GUEST", "Guest card"),
+        ("CARD_VENDING", "Vending card"),
+        ("CARD_CANTEEN", "Canteen card"),
+        ("CARD_INSTRUCTOR", "Instructor card"),
+    )),
+    ("COMPUTER", "Computers", "ITC support", False, True, (
+        ("LAPTOP", "Laptop"),
+        ("DESKTOP", "Desktop"),
+    )),
+    ("USB", "USB", "ITC support", False, True, (
+        ("PENDRIVE", "Pendrive"),
+    )),
+)
+
+# Tablas que se vacían (orden indiferente con CASCADE)
+TAMS_TABLES = (
+    Movements.__tablename__,
+    CourseDeviceMovement.__tablename__,
+    AlertState.__tablename__,
+    Notification.__tablename__,
+    CourseRework.__tablename__,
+    "temporary_card_loans",
+    Assignment.__tablename__,
+    CourseAssetRequirement.__tablename__,
+    Course.__tablename__,
+    Device.__tablename__,
+    AssetType.__tablename__,
+    User.__tablename__,
+)
+
+ALERT_KEYS = {
+    "tco": ("tco_cards_mismatch", "tco_start_soon_no_cards", "tco_course_ended_recent"),
+    "itc": ("itc_pc_pending", "itc_usb_pending", "itc_overdue_return"),
+}
+ALERT_STATE_STATUSES = ("open", "open", "ack", "snoozed", "ignored", "resolved")
+
+BENCH_PASSWORD = "bench"
+
+
+def scaled_counts(scale: float) -> dict:
+    out = {}
+    for key, value in BASE_COUNTS.items():
+        if isinstance(value, int) and not key.endswith("_per_course"):
+            out[key] = max(1, int(round(value * scale)))
+        else:
+            out[key] = value
+    return out
+
+
+def check_target(engine, allow_any_db: bool = False):
+    name = make_url(str(engine.url)).database or ""
+    if not allow_any_db and "bench" not in name.lower():
+        raise SystemExit(
+            f"Refusing to generate into database {name!r}: the generator TRUNCATEs "
+            "all TAMS tables. Use a database whose name contains 'bench' "
+            "(TAMS_DATABASE_URL) or pass --allow-any-db."
+        )
+
+
+def apply_sql_files(engine, sql_dir):
+    """Aplica sql/NNN_*.sql en orden (índices, pg_trgm, columnas generadas...)."""
+    for path in sorted(sql_dir.glob("[0-9][0-9][0-9]_*.sql")):
+        with engine.begin() as conn:
+            conn.exec_driver_sql(path.read_text(encoding="utf-8"))
+        print(f"  applied {path.name}")
+
+
+def _insert(conn, model, rows):
+    for i in range(0, len(rows), INSERT_CHUNK):
+        conn.execute(insert(model.__table__), rows[i:i + INSERT_CHUNK])
+
+
+def _reset_sequences(conn, tables):
+    for t in tables:
+        conn.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence(:t, 'id'), "
+                "COALESCE((SELECT MAX(id) FROM " + t + "), 0) + 1, false)"
+            ),
+            {"t": t},
+        )
+
+
+def _aware(d: date, hour: int = 9) -> datetime:
+    return datetime.combine(d, dtime(hour, 0), tzinfo=timezone.utc)
+
+
+class _Ids:
+    def __init__(self):
+        self._next = {}
+
+    def __call__(self, table: str) -> int:
+        n = self._next.get(table, 0) + 1
+        self._next[table] = n
+        return n
+
+
+def build_dataset(scale: float = 1.0, seed: int = 42, anchor: date | None = None) -> dict:
+    """
+    Devuelve {tabla: [filas]} sin tocar la BD. Determinista para
+    (scale, seed, anchor).
+    """
+    rnd = random.Random(seed)
+    anchor = anchor or date.today()
+    counts = scaled_counts(scale)
+    ids = _Ids()
+    now = _aware(anchor, 8)
+
+    data = {name: [] for name in (
+        "users", "asset_types", "devices", "courses", "course_asset_requirements",
+        "assignments", "course_device_movements", "course_reworks",
+        "notifications", "alert_states", "movements",
+    )}
+
+    # ---------------- users ----------------
+    password_hash = bcrypt.generate_password_hash(BENCH_PASSWORD).decode("utf-8")
+    roles = (
+        ("admin", None),
+        ("supervisor", "TCO"),
+        ("employee", "TCO"),
+        ("supervisor", "ITC support"),
+        ("employee", "ITC support"),
+        ("user", None),
+    )
+    for i in range(counts["users"]):
+        role, dept = roles[i % len(roles)]
+        uid = ids("users")
+        data["users"].append({
+            "id": uid,
+            "name": f"User{uid}",
+            "surname": f"Bench{uid}",
+            "uid": f"U{uid:08X}",
+            "username": f"bench_{role}_{uid}",
+            "password_hash": password_hash,
+            "email": f"bench{uid}@example.invalid",
+            "role": role,
+            "active": True,
+            "department": dept,
+        })
+    tco_users = [u["id"] for u in data["users"] if u["department"] == "TCO"]
+    itc_users = [u["id"] for u in data["users"] if u["department"] == "ITC support"]
+    all_users = [u["id"] for u in data["users"]]
+
+    # ---------------- asset types ----------------
+    type_ids = {}
+    for sort_root, (code, name, dept, rfid, barcode, children) in enumerate(ASSET_TREE):
+        root_id = ids("asset_types")
+        type_ids[code] = root_id
+        data["asset_types"].append({
+            "id": root_id, "code": code, "name": name, "parent_id": None,
+            "managed_by_department": dept, "requires_rfid": rfid,
+            "requires_barcode": barcode, "show_in_calendar": True,
+            "sort_order": sort_root * 10, "active": True,
+        })
+        for sort_child, (child_code, child_name) in enumerate(children):
+            cid = ids("asset_types")
+            type_ids[child_code] = cid
+            data["asset_types"].append({
+                "id": cid, "code": child_code, "name": child_name, "parent_id": root_id,
+                "managed_by_department": dept, "requires_rfid": rfid,
+                "requires_barcode": barcode, "show_in_calendar": True,
+                "sort_order": sort_child, "active": True,
+            })
+
+    # ---------------- devices ----------------
+    legacy_type = {
+        "CARD_GUEST": "guest", "CARD_VENDING": "vending",
+        "CARD_CANTEEN": "canteen", "CARD_INSTRUCTOR": "instructor",
+    }
+    pools = {"card": [], "pc": [], "usb": []}
+
+    def add_devices(n, kind, codes, weights, with_barcode):
+        for _ in range(n):
+            did = ids("devices")
+            code = rnd.choices(codes, weights=weights)[0]
+            data["devices"].append({
+                "id": did,
+                "name": f"{code.title()} {did}",
+                "uid": f"{rnd.getrandbits(56):014X}{did:06d}",
+                "type": legacy_type.get(code, "guest"),
+                "status": "available",
+                "active": True,
+                "asset_type_id": type_ids[code],
+                "barcode": f"TAMS{did:09d}" if with_barcode else None,
+                "created_at": now.replace(tzinfo=None) - timedelta(days=rnd.randint(30, 1500)),
+                "updated_at": now.replace(tzinfo=None),
+            })
+            pools[kind].append(did)
+
+    add_devices(counts["cards"], "card",
+                ["CARD_GUEST", "CARD_VENDING", "CARD_CANTEEN", "CARD_INSTRUCTOR"],
+                [70, 10, 10, 10], False)
+    add_devices(counts["laptops"], "pc", ["LAPTOP"], [1], True)
+    add_devices(counts["desktops"], "pc", ["DESKTOP"], [1], True)
+    add_devices(counts["pendrives"], "usb", ["PENDRIVE"], [1], True)
+
+    devices_by_id = {d["id"]: d for d in data["devices"]}
+    free = {k: list(v) for k, v in pools.items()}
+    for v in free.values():
+        rnd.shuffle(v)
+
+    # ---------------- courses & friends ----------------
+    window_start = anchor - timedelta(days=730)
+    window_days = 730 + 365
+
+    def take(kind, n):
+        pool = free[kind]
+        n = min(n, len(pool))
+        out, free[kind] = pool[:n], pool[n:]
+        return out
+
+    def add_assignment(device_id, course_id, assigned_at, released_at, status, kind):
+        aid = ids("assignments")
+        data["assignments"].append({
+            "id": aid,
+            "device_id": device_id,
+            "course_id": course_id,
+            "assigned_at": assigned_at,
+            "released_at": released_at,
+            "status": status,
+            "created_by": rnd.choice(all_users),
+            "is_temporary": False,
+            "created_at": assigned_at,
+            "updated_at": released_at or assigned_at,
+        })
+        data["movements"].append({
+            "id": ids("movements"),
+            "user_id": rnd.choice(all_users),
+            "entity_type": "assignment",
+            "entity_id": aid,
+            "action": "assign",
+            "before_data": None,
+            "after_data": {"device_id": device_id, "course_id": course_id},
+            "success": True,
+            "description": f"Device {device_id} assigned to course {course_id}",
+            "user_agent": "benchmarks",
+            "created_at": assigned_at,
+        })
+        if kind in ("pc", "usb"):
+            data["course_device_movements"].append({
+                "id": ids("course_device_movements"), "course_id": course_id,
+                "device_id": device_id, "movement_type": "assigned", "asset_kind": kind,
+                "movement_at": assigned_at, "assignment_id": aid,
+                "created_by": rnd.choice(itc_users or all_users),
+            })
+            if released_at is not None:
+                data["course_device_movements"].append({
+                    "id": ids("course_device_movements"), "course_id": course_id,
+                    "device_id": device_id, "movement_type": "returned", "asset_kind": kind,
+                    "movement_at": released_at, "assignment_id": aid,
+                    "created_by": rnd.choice(itc_users or all_users),
+                })
+        return aid
+
+    starts = sorted(
+        window_start + timedelta(days=rnd.randrange(window_days))
+        for _ in range(counts["courses"])
+    )
+
+    for n, start in enumerate(starts, 1):
+        cid = ids("courses")
+        end = start + timedelta(days=rnd.randint(2, 30))
+        trainees = rnd.randint(4, 24)
+        cancelled = rnd.random() < 0.05
+
+        if cancelled:
+            status_tco = "cancelled"
+        elif end < anchor:
+            status_tco = "finished"
+        elif start <= anchor:
+            status_tco = "active"
+        else:
+            status_tco = "planned"
+
+        if end < anchor - timedelta(days=30):
+            status_itc = rnd.choice(("end", "collected", "RT delivered"))
+        elif start <= anchor:
+            status_itc = rnd.choice(("delivered", "completed", "end"))
+        else:
+            status_itc = rnd.choice(("start", "completed", None))
+
+        data["courses"].append({
+            "id": cid,
+            "course": f"BENCH-{start:%Y}-{n:05d}",
+            "name": f"Synthetic course {n}",
+            "client": f"Client {rnd.randint(1, 40)}",
+            "start_date": start,
+            "end_date": end,
+            "status_tco": status_tco,
+            "status_itc": status_itc,
+            "trainees": trainees,
+            "responsible_id": rnd.choice(tco_users or all_users),
+            "notes": None,
+        })
+
+        wants_pc = rnd.random() < 0.4
+        wants_usb = rnd.random() < 0.3
+        reqs = [("CARD_GUEST", trainees)]
+        if wants_pc:
+            reqs.append(("LAPTOP", trainees))
+        if wants_usb:
+            reqs.append(("PENDRIVE", 1))
+        for code, qty in reqs:
+            data["course_asset_requirements"].append({
+                "id": ids("course_asset_requirements"), "course_id": cid,
+                "asset_type_id": type_ids[code], "quantity": qty, "active": True,
+            })
+
+        if cancelled:
+            continue
+
+        assigned_at = _aware(start - timedelta(days=rnd.randint(0, 3)))
+
+        # Pasado: todo devuelto (los devices vuelven al pool).
+        # Reciente / en curso: assignments vivos; algunos ya vencidos.
+        if end < anchor - timedelta(days=21):
+            released_at = _aware(end + timedelta(days=rnd.randint(0, 5)), 17)
+            for kind, qty in (("card", trainees), ("pc", trainees if wants_pc else 0),
+                              ("usb", 1 if wants_usb else 0)):
+                for device_id in rnd.sample(pools[kind], min(qty, len(pools[kind]))):
+                    add_assignment(device_id, cid, assigned_at, released_at, "closed", kind)
+        elif start <= anchor + timedelta(days=3):
+            days_over = (anchor - end).days
+            if days_over > 7:
+                live_status = "overdue_2"
+            elif days_over > 0:
+                live_status = "overdue_1"
+            else:
+                live_status = "active"
+
+            # hueco aleatorio para que salgan descuadres de tarjetas
+            short = rnd.choice((0, 0, 0, 1, 2))
+            for kind, qty in (("card", trainees - short), ("pc", trainees if wants_pc else 0),
+                              ("usb", 1 if wants_usb else 0)):
+                for device_id in take(kind, qty):
+                    add_assignment(device_id, cid, assigned_at, None, live_status, kind)
+                    devices_by_id[device_id]["status"] = "assigned"
+
+        if rnd.random() < counts["rework_ratio"]:
+            for _ in range(rnd.randint(1, 2)):
+                data["course_reworks"].append({
+                    "id": ids("course_reworks"), "course_id": cid,
+                    "rework_date": start + timedelta(days=rnd.randint(0, (end - start).days)),
+                    "notes": "bench rework",
+                    "created_by": rnd.choice(all_users),
+                    "cancelled_at": None,
+                })
+
+        for _ in range(counts["notifications_per_course"]):
+            dept = rnd.choice(("TCO", "ITC support"))
+            created = _aware(start - timedelta(days=rnd.randint(1, 30)))
+            data["notifications"].append({
+                "id": ids("notifications"),
+                "created_at": created,
+                "updated_at": created,
+                "created_by_user_id": rnd.choice(all_users),
+                "assigned_to_user_id": rnd.choice(tco_users if dept == "TCO" else itc_users) if rnd.random() < 0.5 else None,
+                "course_id": cid,
+                "department_target": dept,
+                "type": rnd.choice(("course_created", "course_updated", "pickup_request")),
+                "severity": rnd.choice(("notice", "notice", "warning", "critical")),
+                "status": "done" if end < anchor else rnd.choice(("open", "in_progress", "done")),
+                "title": f"Course {n} update",
+                "message": "Synthetic notification",
+                "active": True,
+            })
+
+        if rnd.random() < counts["alert_state_ratio"]:
+            for scope, keys in ALERT_KEYS.items():
+                for key in rnd.sample(keys, rnd.randint(1, len(keys))):
+                    status = rnd.choice(ALERT_STATE_STATUSES)
+                    data["alert_states"].append({
+                        "id": ids("alert_states"), "scope": scope, "course_id": cid,
+                        "alert_key": key, "status": status,
+                        "snooze_until": now + timedelta(days=rnd.randint(-3, 7)) if status == "snoozed" else None,
+                        "occurrences": rnd.randint(1, 50),
+                        "updated_by": "bench",
+                    })
+
+    # unos pocos extraviados
+    for device_id in rnd.sample(free["card"], min(len(free["card"]), counts["cards"] // 100)):
+        devices_by_id[device_id]["status"] = "lost"
+
+    return data
+
+
+# Orden de inserción (FKs)
+INSERT_ORDER = (
+    ("users", User),
+    ("asset_types", AssetType),
+    ("devices", Device),
+    ("courses", Course),
+    ("course_asset_requirements", CourseAssetRequirement),
+    ("assignments", Assignment),
+    ("course_device_movements", CourseDeviceMovement),
+    ("course_reworks", CourseRework),
+    ("notifications", Notification),
+    ("alert_states", AlertState),
+    ("movements", Movements),
+)
+
+
+def load_dataset(engine, data: dict):
+    with engine.begin() as conn:
+        conn.execute(text(f"TRUNCATE {', '.join(TAMS_TABLES)} RESTART IDENTITY CASCADE"))
+
+        # asset_types se auto-referencia: raíces antes que hijos
+        data["asset_types"].sort(key=lambda r: (r["parent_id"] is not None, r["id"]))
+
+        for name, model in INSERT_ORDER:
+            _insert(conn, model, data[name])
+            print(f"  {name:28s} {len(data[name]):>9d}")
+
+        _reset_sequences(conn, [model.__tablename__ for _, model in INSERT_ORDER])
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql("ANALYZE")
+
+
+def generate(engine, *, scale=1.0, seed=42, anchor=None, create_schema=False,
+             apply_sql=False, sql_dir=None, allow_any_db=False) -> dict:
+    check_target(engine, allow_any_db=allow_any_db)
+
+    if create_schema:
+        sqla_db.metadata.create_all(bind=engine)
+        print("  schema created (create_all)")
+    if apply_sql and sql_dir is not None:
+        apply_sql_files(engine, sql_dir)
+
+    data = build_dataset(scale=scale, seed=seed, anchor=anchor)
+    load_dataset(engine, data)
+
+    with engine.connect() as conn:
+        totals = {
+            name: conn.execute(select(func.count()).select_from(model.__table__)).scalar_one()
+            for name, model in INSERT_ORDER
+        }
+    return totals
@@ -0,0 +1,107 @@
+# benchmarks/http_load.py
+"""
+Carga HTTP simple contra un servidor TAMS en marcha (dev server o
+serve.py), para comparar throughput entre servidores.
+
+Cada hilo cliente mantiene su propia conexión keep-alive y pide las URLs en
+bucle durante --duration segundos. Sólo stdlib.
+
+    python -m benchmarks load http://127.0.0.1:5000 --path /auth/login \\
+        --concurrency 32 --duration 30 --out load_gunicorn.json
+
+Para páginas con login, pasar la cookie de sesión de un navegador:
+    --cookie "session=..."
+"""
+
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def _worker(host, port, https, paths, headers, stop_at, out, errors):
+    conn_cls = http.client.HTTPSConnection if https else http.client.HTTPConnection
+    conn = None
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        if conn is None:
+            conn = conn_cls(host, port, timeout=60)
+        t0 = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            elapsed = time.perf_counter() - t0
+            if resp.status >= 500:
+                errors.append(resp.status)
+            else:
+                out.append(elapsed)
+            if resp.getheader("Connection", "").lower() == "close":
+                conn.close()
+                conn = None
+        except Exception as e:
+            errors.append(type(e).__name__)
+            try:
+                conn.close()
+            except Exception:
+                pass
+            conn = None
+    if conn is not None:
+        conn.close()
+
+
+def run_load(base_url: str, paths, *, concurrency=16, duration=20.0, cookie=None) -> dict:
+    parts = urlsplit(base_url)
+    https = parts.scheme == "https"
+    host = parts.hostname or "127.0.0.1"
+    port = parts.port or (443 if https else 80)
+    headers = {"Connection": "keep-alive"}
+    if cookie:
+        headers["Cookie"] = cookie
+
+    samples: list[float] = []
+    errors: list = []
+    stop_at = time.perf_counter() + duration
+
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(host, port, https, list(paths), headers, stop_at, samples, errors),
+            daemon=True,
+        )
+        for _ in range(concurrency)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    ordered = sorted(samples)
+
+    def pct(p):
+        if not ordered:
+            return None
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000.0, 2)
+
+    return {
+        "base_url": base_url,
+        "paths": list(paths),
+        "concurrency": concurrency,
+        "duration_s": round(wall, 2),
+        "requests": len(ordered),
+        "errors": len(errors),
+        "error_kinds": sorted({str(e) for e in errors}),
+        "rps": round(len(ordered) / wall, 1) if wall else None,
+        "latency_ms": {
+            "mean": round(statistics.fmean(ordered) * 1000.0, 2) if ordered else None,
+            "p50": pct(0.50),
+            "p95": pct(0.95),
+            "p99": pct(0.99),
+            "max": round(ordered[-1] * 1000.0, 2) if ordered else None,
+        },
+    }
@@ -0,0 +1,230 @@
+# benchmarks/scenarios.py
+"""
+Escenarios de benchmark.
+
+Dos tipos:
+- "engine": llamada directa a una función con SessionLocal (motores de
+  alertas). Las variantes *_cold vacían el caché de alertas antes de cada
+  iteración; las *_warm miden el snapshot ya calculado.
+- "http": petición por el test client de Flask, logueado como un usuario
+  del dataset (admin / TCO / ITC). El cuerpo se consume entero (los exports
+  son streaming). Si la app corre con TAMS_SQL_PROFILE=1 se apunta también
+  el número de queries de la cabecera Server-Timing.
+
+Cada escenario devuelve tiempos en ms (min / mediana / media / p95 / max).
+"""
+
+import re
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import func
+
+from app.db import SessionLocal
+from app.models import Assignment, User
+from app.scripts import alerts_cache
+from app.scripts.alerts_itc import get_itc_upcoming_and_overdue_alerts
+from app.scripts.alerts_service import get_alerts_for_user
+from app.scripts.alerts_tco import get_tco_alerts
+
+_SERVER_TIMING_QUERIES_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+
+def _summary(samples_ms: list[float]) -> dict:
+    ordered = sorted(samples_ms)
+    p95_index = max(0, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        "n": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+        "p95_ms": round(ordered[p95_index], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+
+def _timed(fn, *, repeat: int, warmup: int, before_each=None) -> tuple[list[float], object]:
+    last = None
+    for _ in range(warmup):
+        if before_each:
+            before_each()
+        last = fn()
+
+    samples = []
+    for _ in range(repeat):
+        if before_each:
+            before_each()
+        t0 = time.perf_counter()
+        last = fn()
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    return samples, last
+
+
+def pick_users() -> dict:
+    """Un usuario activo por perfil: admin, TCO, ITC support."""
+    db = SessionLocal()
+    try:
+        def first(*criteria):
+            u = db.query(User).filter(User.active.is_(True), *criteria).order_by(User.id).first()
+            return u.id if u else None
+
+        return {
+            "admin": first(User.role.ilike("%admin%")),
+            "tco": first(User.department == "TCO", ~User.role.ilike("%admin%")),
+            "itc": first(User.department == "ITC support", ~User.role.ilike("%admin%")),
+        }
+    finally:
+        db.close()
+
+
+def busiest_course_id() -> int | None:
+    """Curso con más assignments (vivos + histórico): peor caso del detalle."""
+    db = SessionLocal()
+    try:
+        row = (
+            db.query(Assignment.course_id)
+            .group_by(Assignment.course_id)
+            .order_by(func.count().desc(), Assignment.course_id)
+            .first()
+        )
+        return row[0] if row else None
+    finally:
+        db.close()
+
+
+# ---------------------------------------------------------------------------
+# engine
+# ---------------------------------------------------------------------------
+
+def _with_db(fn):
+    def run():
+        db = SessionLocal()
+        try:
+            return fn(db)
+        finally:
+            db.close()
+    return run
+
+
+def _alerts_for(user_id):
+    def fn(db):
+        user = db.get(User, user_id)
+        return get_alerts_for_user(db, user, read_only=True)
+    return fn
+
+
+def engine_scenarios(users: dict) -> list[tuple[str, object, object]]:
+    """(nombre, fn, before_each)"""
+    out = [
+        ("engine.get_tco_alerts", _with_db(get_tco_alerts), None),
+        ("engine.get_itc_upcoming_and_overdue_alerts", _with_db(get_itc_upcoming_and_overdue_alerts), None),
+    ]
+    for profile, user_id in users.items():
+        if user_id is None:
+            continue
+        out.append((f"engine.get_alerts_for_user.{profile}_cold", _with_db(_alerts_for(user_id)), alerts_cache.invalidate))
+        out.append((f"engine.get_alerts_for_user.{profile}_warm", _with_db(_alerts_for(user_id)), None))
+    return out
+
+
+# ---------------------------------------------------------------------------
+# http
+# ---------------------------------------------------------------------------
+
+def http_scenarios(anchor: date | None = None, course_id: int | None = None) -> list[tuple[str, str, str]]:
+    """(nombre, perfil, url)"""
+    anchor = anchor or date.today()
+    month_start = anchor.replace(day=1) - timedelta(days=7)
+    month_end = month_start + timedelta(days=42)
+    calendar = f"/courses/api/calendar-events?start={month_start.isoformat()}&end={month_end.isoformat()}"
+
+    out = [
+        ("http.main.index.admin", "admin", "/"),
+        ("http.main.index.tco", "tco", "/"),
+        ("http.main.index.itc", "itc", "/"),
+        ("http.api_calendar_events.admin", "admin", calendar),
+        ("http.api_calendar_events.admin_full_history", "admin", "/courses/api/calendar-events"),
+        ("http.api_calendar_events.tco", "tco", calendar),
+        ("http.export.courses_csv", "admin", "/courses/export?format=csv&per_page=1000000"),
+        ("http.export.devices_csv", "admin", "/devices/export?format=csv"),
+        ("http.export.movements_csv", "admin", "/movements/export?format=csv"),
+        ("http.export.users_csv", "admin", "/users/export?format=csv"),
+    ]
+    if course_id is not None:
+        out.append((
+            "http.course_detail_fragment.busiest",
+            "itc",
+            f"/courses/{course_id}/fragment?modal_context=calendar",
+        ))
+    return out
+
+
+def _login(client, user_id):
+    with client.session_transaction() as sess:
+        sess["_user_id"] = str(user_id)
+        sess["_fresh"] = True
+
+
+def _http_fn(client, url, meta):
+    def fn():
+        resp = client.get(url)
+        body = resp.get_data()
+        meta["status"] = resp.status_code
+        meta["bytes"] = len(body)
+        m = _SERVER_TIMING_QUERIES_RE.search(resp.headers.get("Server-Timing", ""))
+        if m:
+            meta.setdefault("db_ms", []).append(float(m.group(1)))
+            meta.setdefault("queries", []).append(int(m.group(2)))
+        resp.close()
+    return fn
+
+
+# ---------------------------------------------------------------------------
+# runner
+# ---------------------------------------------------------------------------
+
+def run_all(app, *, repeat=5, warmup=1, only=None, anchor=None) -> dict:
+    users = pick_users()
+    results = {}
+
+    def wanted(name):
+        return not only or any(pat in name for pat in only)
+
+    with app.app_context():
+        for name, fn, before_each in engine_scenarios(users):
+            if not wanted(name):
+                continue
+            samples, value = _timed(fn, repeat=repeat, warmup=warmup, before_each=before_each)
+            results[name] = {
+                "kind": "engine",
+                **_summary(samples),
+                "result_size": len(value) if hasattr(value, "__len__") else None,
+            }
+            print(f"  {name:55s} {results[name]['median_ms']:>10.1f} ms")
+
+    clients = {}
+    for name, profile, url in http_scenarios(anchor, busiest_course_id()):
+        if not wanted(name):
+            continue
+        user_id = users.get(profile)
+        if user_id is None:
+            results[name] = {"kind": "http", "skipped": f"no {profile} user in dataset"}
+            continue
+
+        client = clients.get(profile)
+        if client is None:
+            client = clients[profile] = app.test_client()
+            _login(client, user_id)
+
+        meta = {}
+        samples, _ = _timed(_http_fn(client, url, meta), repeat=repeat, warmup=warmup)
+        entry = {"kind": "http", "url": url, "user": profile, **_summary(samples),
+                 "status": meta.get("status"), "bytes": meta.get("bytes")}
+        if meta.get("queries"):
+            entry["queries"] = max(meta["queries"])
+            entry["db_median_ms"] = round(statistics.median(meta["db_ms"]), 3)
+        results[name] = entry
+        print(f"  {name:55s} {entry['median_ms']:>10.1f} ms  [{entry['status']}]")
+
+    return {"users": users, "scenarios": results}
@@ -0,0 +1,109 @@
+# benchmarks/startup.py
+"""
+Benchmark de arranque en frío: cada muestra es un proceso Python nuevo que
+importa la app, llama a create_app() y sirve una primera petición
+(/auth/login, sólo plantilla) con el test client.
+
+Perfiles:
+- legacy: como arrancaba antes (sonda NFC, URL map impreso, sin
+  calentamiento ni bytecode cache de Jinja)
+- default: arranque actual
+- default_warm_cache: igual, con el bytecode cache ya escrito por una
+  ejecución previa (lo normal al reciclar workers)
+
+Sin NOTIFY ni conexiones de calentamiento por defecto, para que no dependa
+de tener PostgreSQL (--with-db para incluirlas).
+"""
+
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+resp = app.test_client().get("/auth/login")
+resp.get_data()
+t3 = time.perf_counter()
+print("__TAMS_STARTUP__" + json.dumps({
+    "import_ms": (t1 - t0) * 1000,
+    "create_app_ms": (t2 - t1) * 1000,
+    "first_request_ms": (t3 - t2) * 1000,
+    "total_ms": (t3 - t0) * 1000,
+    "status": resp.status_code,
+}))
+"""
+
+
+def _profiles(cache_dir: str) -> dict:
+    return {
+        "legacy": {
+            "TAMS_NFC_SERVER": "1",
+            "TAMS_PRINT_URL_MAP": "1",
+            "TAMS_WARMUP": "0",
+            "TAMS_JINJA_CACHE_DIR": "",
+        },
+        "default": {"TAMS_JINJA_CACHE_DIR": cache_dir, "_clear_cache": "1"},
+        "default_warm_cache": {"TAMS_JINJA_CACHE_DIR": cache_dir},
+    }
+
+
+def _sample(env: dict) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-c", _CHILD],
+        cwd=ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    for line in proc.stdout.splitlines():
+        if line.startswith("__TAMS_STARTUP__"):
+            return json.loads(line[len("__TAMS_STARTUP__"):])
+    raise RuntimeError(f"startup sample failed (exit {proc.returncode}):\n{proc.stderr[-2000:]}")
+
+
+def run_startup(repeat: int = 5, with_db: bool = False) -> dict:
+    cache_dir = tempfile.mkdtemp(prefix="tams-jinja-bench-")
+    base_env = dict(os.environ)
+    if not with_db:
+        base_env["TAMS_PG_NOTIFY"] = "0"
+        base_env["TAMS_WARMUP_CONNECTIONS"] = "0"
+
+    results = {}
+    try:
+        for name, overrides in _profiles(cache_dir).items():
+            clear_cache = overrides.pop("_clear_cache", None) == "1"
+            samples = []
+            for _ in range(repeat):
+                if clear_cache:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                    os.makedirs(cache_dir, exist_ok=True)
+                samples.append(_sample({**base_env, **overrides}))
+
+            summary = {"n": len(samples), "env": overrides}
+            for key in ("import_ms", "create_app_ms", "first_request_ms", "total_ms"):
+                values = [s[key] for s in samples]
+                summary[key] = {
+                    "median": round(statistics.median(values), 1),
+                    "min": round(min(values), 1),
+                    "max": round(max(values), 1),
+                }
+            summary["status"] = samples[-1]["status"]
+            results[name] = summary
+            print(
+                f"  {name:20s} create_app {summary['create_app_ms']['median']:>8.1f} ms   "
+                f"first request {summary['first_request_ms']['median']:>8.1f} ms   "
+                f"total {summary['total_ms']['median']:>8.1f} ms"
+            )
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    return results
@@ -0,0 +1,101 @@
+# gunicorn.conf.py
+"""
+Configuración de gunicorn para TAMS (Linux). La usa serve.py y también
+`gunicorn -c gunicorn.conf.py "app:create_app()"`.
+
+Todo sale de variables TAMS_*:
+  TAMS_BIND                  0.0.0.0:5000
+  TAMS_WORKERS               procesos (nº de CPUs, mín. 2, máx. 4)
+  TAMS_THREADS               hilos por proceso (8)
+  TAMS_WORKER_CLASS          gthread | gevent (requirements-gevent.txt) | sync (gthread)
+  TAMS_PRELOAD               1 = crear la app en el maestro antes del fork
+  TAMS_TIMEOUT               segundos sin latido antes de matar un worker (60)
+  TAMS_GRACEFUL_TIMEOUT      segundos para acabar peticiones al reiniciar (30)
+  TAMS_KEEPALIVE             segundos de keep-alive HTTP (5)
+  TAMS_MAX_REQUESTS          reciclar el worker tras N peticiones (0 = nunca, por defecto)
+  TAMS_MAX_REQUESTS_JITTER   aleatorio sumado a lo anterior (100)
+  TAMS_LOG_LEVEL             info
+
+  TAMS_SSE_ENABLED           por defecto 1 sólo con gevent (ver abajo)
+
+Cada stream SSE (/api/stream) ocupa un hilo mientras está abierto y
+base.html lo abre en cada pestaña: con gthread/sync bastarían
+workers * threads pestañas para dejar sin hilos a las peticiones normales.
+Por eso con esas clases el stream va desactivado por defecto (las páginas
+siguen con polling); con gevent cada stream es una greenlet y se activa.
+TAMS_SSE_ENABLED=1 lo fuerza (dimensionando TAMS_THREADS para las pestañas).
+"""
+
+import multiprocessing
+import os
+
+
+def _int(name, default):
+    return int(os.getenv(name, str(default)))
+
+
+bind = os.getenv("TAMS_BIND", "0.0.0.0:5000")
+# Al menos 2: al reciclar (max_requests) o si uno se cuelga, otro sigue
+# atendiendo. Con 1 CPU el segundo apenas cuesta (la app espera a la BD).
+workers = _int("TAMS_WORKERS", max(2, min(multiprocessing.cpu_count(), 4)))
+worker_class = os.getenv("TAMS_WORKER_CLASS", "gthread")
+threads = _int("TAMS_THREADS", 8)
+if worker_class == "gevent":
+    worker_connections = _int("TAMS_WORKER_CONNECTIONS", 200)
+
+# Antes de cargar la app (change_feed lee TAMS_SSE_ENABLED al importarse)
+os.environ.setdefault("TAMS_SSE_ENABLED", "1" if worker_class == "gevent" else "0")
+
+preload_app = os.getenv("TAMS_PRELOAD", "1") == "1"
+
+timeout = _int("TAMS_TIMEOUT", 60)
+graceful_timeout = _int("TAMS_GRACEFUL_TIMEOUT", 30)
+keepalive = _int("TAMS_KEEPALIVE", 5)
+
+# Reciclado desactivado por defecto: al salir, el worker cierra sus
+# conexiones keep-alive ociosas y los clientes que no reintentan (scripts,
+# agente NFC) ven el corte aunque haya otro worker. Activarlo sólo si se
+# observa crecimiento de memoria, con N alto (ver deployment.md).
+max_requests = _int("TAMS_MAX_REQUESTS", 0)
+max_requests_jitter = _int("TAMS_MAX_REQUESTS_JITTER", 100)
+
+loglevel = os.getenv("TAMS_LOG_LEVEL", "info")
+accesslog = os.getenv("TAMS_ACCESS_LOG", "-")
+errorlog = "-"
+proc_name = "tams"
+
+if preload_app:
+    # La app se crea en el maestro: los hilos de fondo (listener de NOTIFY,
+    # calentamiento) se arrancan en cada worker tras el fork, no en el maestro.
+    os.environ["TAMS_DEFER_BACKGROUND_THREADS"] = "1"
+
+
+def post_fork(server, worker):
+    """
+    En cada worker recién creado: ni las conexiones del pool ni los hilos
+    del maestro sirven aquí.
+    """
+    from app.db import engine
+    from app.scripts import pg_change_listener, warmup
+
+    if worker_class == "gevent":
+        # sin esto cada query de psycopg2 bloquea todas las greenlets del worker
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("gevent worker without psycogreen: psycopg2 calls block the worker")
+
+    # conexiones heredadas: se abandonan sin cerrarlas (son del maestro)
+    engine.dispose(close=False)
+    pg_change_listener.start_deferred()
+    warmup.start_deferred()
+
+
+def worker_exit(server, worker):
+    # cola de auditoría asíncrona pendiente (si TAMS_AUDIT_ASYNC=1)
+    try:
+        from app.scripts import audit_writer
+        audit_writer.shutdown()
+    except Exception:
+        pass
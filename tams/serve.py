@@ -0,0 +1,58 @@
+# serve.py
+"""
+Arranque de producción de TAMS (Linux): create_app() bajo gunicorn, con
+varios procesos y hilos. Sustituye a `python wsgi.py` (servidor de
+desarrollo de Werkzeug, un solo proceso y debug=True).
+
+    python serve.py                     # config de gunicorn.conf.py + TAMS_*
+    TAMS_WORKERS=4 TAMS_THREADS=16 python serve.py
+
+Reinicio sin cortes: `kill -HUP <pid maestro>` (recarga workers de uno en
+uno respetando TAMS_GRACEFUL_TIMEOUT). Más detalle en
+docs/context/deployment.md.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+HERE = Path(__file__).resolve().parent
+
+
+def _load_config() -> dict:
+    """Variables de gunicorn.conf.py (incluye los hooks post_fork / worker_exit)."""
+    path = HERE / "gunicorn.conf.py"
+    namespace = {"__file__": str(path), "__name__": "gunicorn_conf"}
+    exec(compile(path.read_text(encoding="utf-8"), str(path), "exec"), namespace)
+    return {k: v for k, v in namespace.items() if not k.startswith("_")}
+
+
+def main():
+    if sys.platform.startswith("win"):
+        sys.exit(
+            "serve.py needs gunicorn, which only runs on Linux/macOS. "
+            "On Windows use `python wsgi.py` (development server)."
+        )
+
+    from gunicorn.app.base import BaseApplication
+
+    class TamsApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key.lower(), value)
+
+        def load(self):
+            from app import create_app
+            return create_app()
+
+    os.chdir(HERE)
+    TamsApplication(_load_config()).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+-- sql/001_calendar_window_indexes.sql
+-- Índices para /courses/api/calendar-events filtrado por rango visible.
+-- Idempotente: se puede lanzar sobre una BD existente.
+
+CREATE INDEX IF NOT EXISTS ix_courses_start_date ON courses (start_date);
+CREATE INDEX IF NOT EXISTS ix_courses_end_date ON courses (end_date);
+
+-- Ya declarados en models.py (index=True); por si la BD viene de un dump antiguo.
+CREATE INDEX IF NOT EXISTS ix_course_reworks_rework_date ON course_reworks (rework_date);
+CREATE INDEX IF NOT EXISTS ix_course_device_movements_movement_at ON course_device_movements (movement_at);
@@ -0,0 +1,143 @@
+-- sql/002_movements_keyset_and_partitions.sql
+-- Auditoría (movements):
+--   1) índice para la paginación por cursor (created_at DESC, id DESC)
+--   2) tabla particionada por mes (RANGE created_at)
+--
+-- La parte 2 reescribe la tabla: lanzar en una ventana de mantenimiento.
+-- Tras ella, la PK pasa a ser (id, created_at) (obligatorio en PG para
+-- tablas particionadas); el ORM sigue usando id como identidad.
+--
+-- Mantenimiento mensual (crea las particiones de los próximos meses):
+--   SELECT tams_ensure_movements_partitions(3);
+-- o bien:  python -m app.scripts.movements_partitions
+--
+-- Archivar un mes viejo sin borrar filas una a una:
+--   ALTER TABLE movements DETACH PARTITION movements_y2024m01;
+
+-- -------------------------------------------------------------------
+-- 1) Keyset
+-- -------------------------------------------------------------------
+CREATE INDEX IF NOT EXISTS ix_movements_created_at_id
+    ON movements (created_at DESC, id DESC);
+
+
+-- -------------------------------------------------------------------
+-- 2) Particionado mensual
+-- -------------------------------------------------------------------
+CREATE OR REPLACE FUNCTION tams_ensure_movements_partitions(months_ahead integer DEFAULT 3)
+RETURNS integer
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    first_month date;
+    last_month  date;
+    m           date;
+    part_name   text;
+    created     integer := 0;
+BEGIN
+    SELECT date_trunc('month', COALESCE(min(created_at), now()))::date
+      INTO first_month
+      FROM movements;
+
+    last_month := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+
+    m := first_month;
+    WHILE m <= last_month LOOP
+        part_name := format('movements_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF movements FOR VALUES FROM (%L) TO (%L)',
+                part_name, m, (m + interval '1 month')::date
+            );
+            created := created + 1;
+        END IF;
+
+        m := (m + interval '1 month')::date;
+    END LOOP;
+
+    RETURN created;
+END;
+$$;
+
+
+DO $$
+DECLARE
+    fk record;
+BEGIN
+    -- ya particionada: nada que hacer
+    IF EXISTS (
+        SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'movements'::regclass
+    ) THEN
+        RAISE NOTICE 'movements ya está particionada';
+        RETURN;
+    END IF;
+
+    ALTER TABLE movements RENAME TO movements_legacy;
+
+    CREATE TABLE movements (
+        LIKE movements_legacy INCLUDING DEFAULTS INCLUDING CONSTRAINTS
+    ) PARTITION BY RANGE (created_at);
+
+    ALTER TABLE movements ADD CONSTRAINT movements_part_pkey PRIMARY KEY (id, created_at);
+
+    -- la secuencia del id pasa a la tabla nueva (si no, el DROP la borraría)
+    ALTER SEQUENCE movements_id_seq OWNED BY movements.id;
+
+    -- FKs (p.ej. user_id -> users) tal y como estén definidas hoy
+    FOR fk IN
+        SELECT conname, pg_get_constraintdef(oid) AS def
+          FROM pg_constraint
+         WHERE conrelid = 'movements_legacy'::regclass AND contype = 'f'
+    LOOP
+        EXECUTE format('ALTER TABLE movements ADD CONSTRAINT %I %s', fk.conname || '_p', fk.def);
+    END LOOP;
+
+    CREATE INDEX ix_movements_p_created_at_id ON movements (created_at DESC, id DESC);
+    CREATE INDEX ix_movements_p_entity ON movements (entity_type, entity_id, created_at DESC);
+    CREATE INDEX ix_movements_p_user_created_at ON movements (user_id, created_at DESC);
+    CREATE INDEX ix_movements_p_action ON movements (action);
+
+    -- red de seguridad: filas fuera de rango no rompen los INSERT
+    CREATE TABLE movements_default PARTITION OF movements DEFAULT;
+END;
+$$;
+
+-- Particiones desde el primer mes con datos hasta +3 meses, copia y
+-- borrado de la tabla antigua (sólo si el bloque anterior la renombró).
+DO $$
+DECLARE
+    first_month date;
+    last_month  date;
+    m           date;
+    part_name   text;
+BEGIN
+    IF to_regclass('movements_legacy') IS NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT date_trunc('month', COALESCE(min(created_at), now()))::date
+      INTO first_month
+      FROM movements_legacy;
+
+    last_month := (date_trunc('month', now()) + interval '3 months')::date;
+
+    m := first_month;
+    WHILE m <= last_month LOOP
+        part_name := format('movements_y%sm%s', to_char(m, 'YYYY'), to_char(m, 'MM'));
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF movements FOR VALUES FROM (%L) TO (%L)',
+                part_name, m, (m + interval '1 month')::date
+            );
+        END IF;
+        m := (m + interval '1 month')::date;
+    END LOOP;
+
+    INSERT INTO movements SELECT * FROM movements_legacy;
+
+    DROP TABLE movements_legacy;
+END;
+$$;
+
+ANALYZE movements;
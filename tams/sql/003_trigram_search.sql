@@ -0,0 +1,45 @@
+-- sql/003_trigram_search.sql
+-- Búsqueda libre (?q=) indexada con pg_trgm para movements, courses y devices.
+-- Las expresiones deben coincidir con app/scripts/text_search.py.
+--
+-- En tablas grandes, mejor crear los índices con CREATE INDEX CONCURRENTLY
+-- (fuera de transacción). En movements particionada, CONCURRENTLY no vale
+-- sobre la tabla padre: crearlo en cada partición y luego en el padre.
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- array_to_string omite NULLs. Se declara IMMUTABLE para poder indexarla
+-- (sólo recibe text).
+CREATE OR REPLACE FUNCTION tams_search_text(VARIADIC parts text[])
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+PARALLEL SAFE
+AS $$ SELECT array_to_string(parts, ' ') $$;
+
+-- -------------------------------------------------------------------
+-- q global
+-- -------------------------------------------------------------------
+CREATE INDEX IF NOT EXISTS ix_movements_search_trgm ON movements
+    USING gin (
+        tams_search_text(
+            action::text, entity_type::text, description::text, user_agent::text, entity_id::text
+        ) gin_trgm_ops
+    );
+
+CREATE INDEX IF NOT EXISTS ix_courses_search_trgm ON courses
+    USING gin (tams_search_text(course::text, name::text, notes::text) gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS ix_devices_search_trgm ON devices
+    USING gin (
+        tams_search_text(name::text, uid::text, barcode::text, status::text, notes::text) gin_trgm_ops
+    );
+
+-- -------------------------------------------------------------------
+-- Filtros por columna que también hacen ILIKE '%x%'
+-- -------------------------------------------------------------------
+CREATE INDEX IF NOT EXISTS ix_movements_description_trgm ON movements USING gin (description gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_courses_course_trgm ON courses USING gin (course gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_courses_name_trgm ON courses USING gin (name gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_courses_client_trgm ON courses USING gin (client gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ix_devices_name_trgm ON devices USING gin (name gin_trgm_ops);
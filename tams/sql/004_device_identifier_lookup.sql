@@ -0,0 +1,53 @@
+-- sql/004_device_identifier_lookup.sql
+-- Identificadores normalizados de devices (uid / barcode) para los lectores.
+-- La regla debe coincidir con app/scripts/device_resolver.normalize_identifier():
+-- mayúsculas y sólo A-Z0-9 ("04:aa:bb" -> "04AABB"). Cadena vacía -> NULL.
+--
+-- Requiere PostgreSQL >= 12 (columnas generadas). Reescribe la tabla devices.
+
+ALTER TABLE devices
+    ADD COLUMN IF NOT EXISTS uid_norm varchar(64)
+        GENERATED ALWAYS AS (NULLIF(regexp_replace(upper(uid), '[^A-Z0-9]', '', 'g'), '')) STORED;
+
+ALTER TABLE devices
+    ADD COLUMN IF NOT EXISTS barcode_norm varchar(128)
+        GENERATED ALWAYS AS (NULLIF(regexp_replace(upper(barcode), '[^A-Z0-9]', '', 'g'), '')) STORED;
+
+-- Índices únicos. Si ya hay duplicados tras normalizar ("04:AA" y "04AA"),
+-- se avisa con la lista y se crea un índice normal: hay que limpiar los datos
+-- y volver a lanzar este script para tener la unicidad.
+DO $$
+DECLARE
+    dups text;
+BEGIN
+    SELECT string_agg(uid_norm, ', ') INTO dups
+      FROM (SELECT uid_norm FROM devices WHERE uid_norm IS NOT NULL
+             GROUP BY uid_norm HAVING count(*) > 1) d;
+
+    IF dups IS NULL THEN
+        DROP INDEX IF EXISTS ix_devices_uid_norm;
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_devices_uid_norm ON devices (uid_norm);
+    ELSE
+        RAISE NOTICE 'devices.uid_norm duplicated (%): creating a non-unique index', dups;
+        CREATE INDEX IF NOT EXISTS ix_devices_uid_norm ON devices (uid_norm);
+    END IF;
+
+    SELECT string_agg(barcode_norm, ', ') INTO dups
+      FROM (SELECT barcode_norm FROM devices WHERE barcode_norm IS NOT NULL
+             GROUP BY barcode_norm HAVING count(*) > 1) d;
+
+    IF dups IS NULL THEN
+        DROP INDEX IF EXISTS ix_devices_barcode_norm;
+        CREATE UNIQUE INDEX IF NOT EXISTS ux_devices_barcode_norm ON devices (barcode_norm)
+            WHERE barcode_norm IS NOT NULL;
+    ELSE
+        RAISE NOTICE 'devices.barcode_norm duplicated (%): creating a non-unique index', dups;
+        CREATE INDEX IF NOT EXISTS ix_devices_barcode_norm ON devices (barcode_norm)
+            WHERE barcode_norm IS NOT NULL;
+    END IF;
+END
+$$;
+
+-- Assignment vivo / último assignment por device en el mismo JOIN.
+CREATE INDEX IF NOT EXISTS ix_assignments_device_assigned_at
+    ON assignments (device_id, assigned_at DESC);
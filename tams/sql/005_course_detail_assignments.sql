@@ -0,0 +1,8 @@
+-- sql/005_course_detail_assignments.sql
+-- Detalle de curso (app/scripts/course_detail.py): assignments vivos de un
+-- curso (released_at IS NULL) y recuento de devueltos por curso, ambos con
+-- el mismo índice; no hace falta recorrer el histórico de otros cursos.
+-- Idempotente.
+
+CREATE INDEX IF NOT EXISTS ix_assignments_course_released_at
+    ON assignments (course_id, released_at);
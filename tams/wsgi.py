@@ -6,10 +6,12 @@ app = create_app()
 
 
 if __name__ == "__main__":
+    # Servidor de DESARROLLO (Werkzeug). En producción (Linux): python serve.py
     app.run(
         host="0.0.0.0",
         port=int(os.getenv("PORT", 5000)),
-        debug=True,
+        debug=os.getenv("TAMS_DEBUG", "0") == "1",
+        threaded=True,
     )
 
     
\ No newline at end of file